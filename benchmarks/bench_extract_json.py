@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for core.json_scan against the old regex fallback of extract_json.
+
+Run from the repository root:
+    python -m benchmarks.bench_extract_json
+"""
+
+import json
+import re
+import timeit
+
+from core.json_scan import find_json_object
+
+
+def legacy_regex_extract(text: str):
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+def make_payload(size_kb: int) -> str:
+    rule = ".card { padding: 1rem; border: 1px solid #ddd; } "
+    markup = '<div class="card" data-x="{\\"a\\": 1}">Item</div>'
+    repeat = size_kb * 1024 // (len(rule) + len(markup))
+    return json.dumps({
+        "html": "<html><head></head><body>" + markup * repeat + "</body></html>",
+        "css": rule * repeat,
+        "js": "document.addEventListener('DOMContentLoaded', () => { console.log('ready'); });",
+        "name": "Benchmark App",
+    })
+
+
+def build_cases():
+    payload = make_payload(300)
+    return {
+        "300KB JSON with prose braces": (
+            "Sure! Here is {your} app, replace {name} as needed:\n" + payload + "\nHope {this} helps!"
+        ),
+        "300KB JSON + trailing object": payload + '\n\nMetadata: {"tokens": 1234}',
+        "300KB truncated response": payload[:-5000],
+        "adversarial 20K open braces": "{" * 20000,
+        "adversarial 40K open braces": "{" * 40000,
+        "adversarial 20K brace pairs": "{}" * 20000 + payload[:2000],
+    }
+
+
+def main(repeat: int = 3):
+    print(f"{'case':<34}{'scanner (ms)':>14}{'regex (ms)':>14}  scanner/regex result")
+    for name, text in build_cases().items():
+        scan_time = min(timeit.repeat(lambda: find_json_object(text), number=1, repeat=repeat))
+        regex_time = min(timeit.repeat(lambda: legacy_regex_extract(text), number=1, repeat=repeat))
+        scan_ok = find_json_object(text) is not None
+        regex_ok = legacy_regex_extract(text) is not None
+        print(f"{name:<34}{scan_time * 1000:>14.2f}{regex_time * 1000:>14.2f}  {scan_ok}/{regex_ok}")
+
+
+if __name__ == "__main__":
+    main()
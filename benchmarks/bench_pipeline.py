@@ -0,0 +1,142 @@
+"""
+Offline benchmark of the whole prompt -> generate -> preview-format -> export
+pipeline, replayed from a provider cassette (see core.cassettes).
+
+Record a cassette once against the configured providers, then replay it as
+often as needed without network access:
+    python -m benchmarks.bench_pipeline --record cassettes/pipeline.json
+    python -m benchmarks.bench_pipeline --cassette cassettes/pipeline.json --latency zero
+
+--providers local records from the offline local provider, which is handy for
+checking the harness itself. Replays use the providers the cassette was
+recorded from, and any request the cassette cannot answer fails the run.
+Metrics and the token usage of recording runs go to --out (a temporary
+directory by default), never into the working tree.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from core import ai_engine
+from core.cassettes import ORIGINAL, ZERO, Cassette, RECORD, REPLAY
+from core.metrics import metrics
+from core.providers import configure_providers
+from core.usage import ledger as usage_ledger
+from exporters.exporter import write_export
+from ui_items.editor_view import EditorView
+
+PROMPTS = [
+    "Create a landing page for a coffee shop with a menu and opening hours",
+    "Build a todo app with filters for active and completed tasks",
+    "Make a portfolio page for a photographer with a masonry gallery",
+    "Create a pricing table with three plans and a monthly/yearly toggle",
+    "Build a weather dashboard with a five day forecast",
+]
+
+STAGES = ("generate", "preview_format", "export", "total")
+
+
+def preview_formatter() -> EditorView:
+    # The formatting helpers only use each other, so no Tk widget is needed
+    return EditorView.__new__(EditorView)
+
+
+def run_once(prompt: str, formatter: EditorView, export_dir: str) -> dict:
+    timings = {}
+    started = time.perf_counter()
+    app = ai_engine.generate_app(prompt, retries=0, use_cache=False)
+    timings["generate"] = time.perf_counter() - started
+
+    stage = time.perf_counter()
+    code = app.document()
+    # The preview helpers print diagnostics on every call; keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        formatter.format_html_for_preview(code, app)
+        formatter.create_simple_html_preview(code, app)
+    timings["preview_format"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    write_export(export_dir, code)
+    timings["export"] = time.perf_counter() - stage
+
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cassette", default="cassettes/pipeline.json", help="Cassette to replay")
+    parser.add_argument("--record", metavar="CASSETTE", help="Record a new cassette instead of replaying")
+    parser.add_argument("--latency", choices=[ORIGINAL, ZERO], default=ZERO, help="Replay latency (default: zero)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs over the prompt set (default: 5)")
+    parser.add_argument("--settings", default="settings.json", help="Settings file for the providers to record")
+    parser.add_argument("--providers", choices=["settings", "local"], default="settings",
+                        help="Record from the providers in settings.json or the offline local provider")
+    parser.add_argument("--out", help="Directory for metrics and usage files (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        cassette = Cassette(args.record, RECORD)
+        repeat = 1
+        provider_settings = record_provider_settings(args)
+    else:
+        cassette = Cassette(args.cassette, REPLAY, args.latency)
+        repeat = max(args.repeat, 1)
+        provider_settings = cassette.provider_settings()
+        if not provider_settings:
+            print(f"{args.cassette} has no recorded interactions.")
+            return 1
+    configure_providers(provider_settings, wrapper=cassette.wrap)
+    metrics.reset()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        out = args.out or scratch
+        metrics.configure(export_dir=out)
+        usage_ledger.configure({"file": os.path.join(out, "usage.jsonl")})
+        formatter = preview_formatter()
+        samples = {stage: [] for stage in STAGES}
+        for _ in range(repeat):
+            cassette.rewind()
+            for prompt in PROMPTS:
+                for stage, seconds in run_once(prompt, formatter, scratch).items():
+                    samples[stage].append(seconds)
+        metrics.export()
+
+    stats = cassette.stats()
+    print(f"{stats['mode']} {stats['path']}: {len(PROMPTS)} prompts x {repeat} runs, "
+          f"{stats['hits']} replayed, {stats['misses']} missing")
+    if stats["misses"]:
+        # Timings of error pages say nothing about the pipeline
+        print("The cassette does not cover every request; record it again with the same prompts.")
+        return 1
+    print(f"{'stage':<16}{'p50 (ms)':>12}{'p95 (ms)':>12}{'max (ms)':>12}")
+    for stage in STAGES:
+        values = samples[stage]
+        print(f"{stage:<16}{percentile(values, 50) * 1000:>12.2f}{percentile(values, 95) * 1000:>12.2f}"
+              f"{max(values) * 1000:>12.2f}")
+    return 0
+
+
+def record_provider_settings(args):
+    if args.providers == "local":
+        return [{"name": "local"}]
+    try:
+        with open(args.settings, "r") as f:
+            return json.load(f).get("providers")
+    except (json.JSONDecodeError, IOError):
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,150 @@
 import json
-import re
+import time
+import queue
 import logging
-import requests
-import google.generativeai as genai
-from meta_ai_api import MetaAI
-
-logging.basicConfig(
-    filename="karbon_ai_errors.log",
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s"
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+from core import prompt_enhancer
+from core.artifacts import GeneratedApp
+from core.json_scan import find_json_object, repair_json_object
+from core.log_setup import log_payload
+from core.metrics import metrics
+from core.patching import apply_edits
+from core.regions import resolve_region, surrounding_context
+from core.providers import concurrency_slot, get_providers
+from core.resilience import OPEN, configure_resilience, guard_for
+from core.status_bus import (
+    CHUNK_RECEIVED, DONE, PROVIDER_SWITCHED, REQUEST_STARTED, RETRY, STATUS, StatusBus, StatusEvent
 )
+from core.streaming import PartialJSONFieldParser, render_partial_document
+from core.response_cache import ResponseCache, make_cache_key
+from core.single_flight import SingleFlight
+from core.usage import capture_reported_usage, ledger as usage_ledger
+
+logger = logging.getLogger(__name__)
+
+# Every status change and progress event is published here; the UI subscribes instead of polling
+status_bus = StatusBus()
+
+# Identical generations running at the same time share one provider call
+in_flight = SingleFlight()
+
+# Minimum seconds between partial previews pushed to on_partial callbacks
+PARTIAL_PREVIEW_INTERVAL = 0.3
+
+# Lines of read-only context sent on each side of a regenerated region
+REGION_CONTEXT_LINES = 3
+
+# Bump whenever build_generation_prompt changes so stale cached responses are not reused
+PROMPT_TEMPLATE_VERSION = 1
+
+response_cache = ResponseCache()
+
+# Hedged mode races the same request across providers; see request_hedged
+hedge_settings = {"enabled": False, "delay": 2.0, "max_providers": 2}
+hedge_stats = {}
+_hedge_lock = threading.Lock()
+# Queued by a hedged stream's reader thread after its provider's last chunk
+_STREAM_END = object()
+
+# AI prompt enhancement is opt-in; prompts no local template recognizes get rule_based_enhancement otherwise
+enhancement_settings = {"ai_fallback": False}
+
+# Sampling temperatures for n-variant generation when none are given; cycled for larger n
+DEFAULT_VARIANT_TEMPERATURES = (0.4, 0.8, 1.0, 1.2)
+
+# Upper bound for the pause between retry attempts
+MAX_BACKOFF_SECONDS = 4
+
+# Members a repaired, cut-off response must contain in full to be used instead of retried;
+# operations not listed (e.g. "update", whose edit list must be whole) always retry
+PARTIAL_REQUIRED_FIELDS = {"generate": ("html",), "region": ("fragment",)}
+
+UNAVAILABLE_HTML = "<!DOCTYPE html><html><head><title>Error</title><style></style></head><body><h1>AI service is currently unavailable.</h1></body></html>"
+
+
+def set_ai_status(state: str, message: str, kind: str = STATUS, **details):
+    """Publish a status event; details are the optional StatusEvent fields (provider, attempt, chars)"""
+    logger.info(f"AI Status Updated: {state} - {message}")
+    status_bus.publish(StatusEvent(kind, state, message, **details))
+
+
+def get_ai_status() -> dict:
+    """Latest {"state", "message"}; safe to call from any thread"""
+    return status_bus.snapshot()
+
+
+def attempt_started(attempt: int, message: str):
+    if attempt == 0:
+        set_ai_status("generating", message, REQUEST_STARTED, attempt=1)
+    else:
+        set_ai_status("generating", f"{message} (retry {attempt})", RETRY, attempt=attempt + 1)
+
+
+class ProviderUnavailableError(RuntimeError):
+    """A provider was skipped because its circuit is open or it is rate limited"""
+
+
+def _on_circuit_change(name: str, old_state: str, new_state: str):
+    if new_state == OPEN:
+        logger.warning(f"[Circuit] {name} opened after repeated failures; routing around it.")
+        set_ai_status("error", f"{name} is failing; switching to other providers.")
+    else:
+        logger.info(f"[Circuit] {name}: {old_state} -> {new_state}")
+
+
+configure_resilience(on_state_change=_on_circuit_change)
 
-ai_status = {"state": "connecting", "message": "Connecting to AI service..."}
+
+@contextmanager
+def _guarded_call(provider):
+    """Admit one call through the provider's circuit breaker, rate limiter and concurrency cap"""
+    guard = guard_for(provider.name)
+    waited = time.perf_counter()
+    refused = guard.admit()
+    if refused:
+        raise ProviderUnavailableError(f"{provider.name} {refused}.")
+    with concurrency_slot(provider.name):
+        metrics.observe("queue_wait", time.perf_counter() - waited, provider.name, provider.model)
+        try:
+            yield
+        except Exception:
+            guard.breaker.record_failure()
+            raise
+        except BaseException:
+            # Abandoned rather than failed, e.g. a stream whose consumer stopped reading; only give back
+            # a half-open trial so the breaker does not stay unavailable forever
+            guard.breaker.release_trial()
+            raise
+        guard.breaker.record_success()
+
+
+def routable_providers(api_key: str = None, operation: str = "generate"):
+    """Configured providers whose circuit currently lets requests through"""
+    providers = get_providers(api_key, operation)
+    routable = [provider for provider in providers if guard_for(provider.name).breaker.is_available()]
+    if providers and not routable:
+        set_ai_status("offline", "All AI providers are temporarily unavailable.")
+    return routable
+
+
+def backoff_delay(attempt: int, api_key: str = None, operation: str = "generate") -> Optional[float]:
+    """Seconds to pause before the next attempt; None when no provider can be routed to, so retrying is pointless"""
+    if not routable_providers(api_key, operation):
+        return None
+    return min(2 ** attempt, MAX_BACKOFF_SECONDS)
 
 
-def set_ai_status(state: str, message: str):
-    ai_status["state"] = state
-    ai_status["message"] = message
-    logging.info(f"AI Status Updated: {state} - {message}")
+def _backoff(attempt: int, api_key: str = None, operation: str = "generate") -> bool:
+    """Pause before the next attempt; False when retrying is pointless"""
+    delay = backoff_delay(attempt, api_key, operation)
+    if delay is None:
+        return False
+    time.sleep(delay)
+    return True
 
 
 def extract_json(response: str) -> dict:
@@ -30,19 +157,62 @@ def extract_json(response: str) -> dict:
     try:
         return json.loads(clean_response)
     except json.JSONDecodeError as e:
-        logging.error(f"JSONDecodeError on cleaned string: {e}")
-        match = re.search(r'\{.*\}', clean_response, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except json.JSONDecodeError as e_inner:
-                logging.error(f"JSONDecodeError during regex fallback: {e_inner}")
-        logging.error(f"No valid JSON found in response: {response}")
+        logger.error(f"JSONDecodeError on cleaned string: {e}")
+        parsed = find_json_object(clean_response)
+        if parsed is not None:
+            return parsed
+        parsed = repair_json_object(clean_response)
+        if parsed is not None:
+            logger.warning(f"Repaired cut-off JSON response: kept {list(parsed)}, "
+                           f"truncated member: {parsed.truncated}")
+            return parsed
+        log_payload(logger, "No valid JSON found in response", response)
         return None
 
 
-def generate_code_from_prompt(prompt: str, api_key: str = None, retries=2) -> str:
-    formatted = (
+def salvage_partial(parsed: dict, operation: str = "generate") -> dict:
+    """Check a repaired (cut-off) response is usable for operation; raises ValueError so the caller retries if not"""
+    if not getattr(parsed, "partial", False):
+        return parsed
+    required = PARTIAL_REQUIRED_FIELDS.get(operation, ())
+    if not required or any(not parsed.get(name) or parsed.truncated == name for name in required):
+        raise ValueError(f"Response was cut off before {', '.join(required) or 'it was complete'}.")
+    if parsed.truncated == "js":
+        # Half-written scripts never run, as in streamed previews
+        parsed["js"] = ""
+    return parsed
+
+
+def parse_response(provider, response: str, operation: str = "generate") -> dict:
+    """Parse a provider's raw answer; raises ValueError when it is unusable, so the caller moves on"""
+    log_payload(logger, f"[{provider.name}] Raw AI response", response)
+    with metrics.timer("extract_json", provider.name, provider.model):
+        parsed = extract_json(response)
+    if not parsed:
+        raise ValueError(f"{provider.name} response couldn't be parsed into JSON.")
+    return salvage_partial(parsed, operation)
+
+
+def build_generation_prompt(prompt: str, enhance: bool = False) -> str:
+    """Generation request for prompt; with enhance the model first expands the task and returns
+    that refined prompt alongside the app, in the same round trip"""
+    if enhance:
+        return (
+            f"You are a helpful assistant that writes complete frontend apps.\n"
+            f"Given the task: \"{prompt}\"\n"
+            f"The task may be vague or minimal. First expand it into a clear, detailed instruction for frontend web "
+            f"development: layout, components to include, styling considerations and any interactivity. "
+            f"Then build the app from that expanded instruction.\n"
+            f"Respond ONLY in this JSON format, with no additional text, markdown, or explanation before or after the JSON:\n"
+            "{\n"
+            "  \"html\": \"<html>...</html>\",\n"
+            "  \"css\": \"body { ... }\",\n"
+            "  \"js\": \"document.addEventListener(...)\",\n"
+            "  \"name\": \"App Name\",\n"
+            "  \"refined_prompt\": \"The expanded instruction, without commentary or formatting\"\n"
+            "}"
+        )
+    return (
         f"You are a helpful assistant that writes complete frontend apps.\n"
         f"Given the task: \"{prompt}\"\n"
         f"Respond ONLY in this JSON format, with no additional text, markdown, or explanation before or after the JSON:\n"
@@ -54,70 +224,775 @@ def generate_code_from_prompt(prompt: str, api_key: str = None, retries=2) -> st
         "}"
     )
 
+
+def inline_assets(parsed: dict) -> str:
+    return GeneratedApp.from_parsed(parsed).document()
+
+
+def _template_version(enhance: bool = False) -> str:
+    # Enhanced generations build from a rewritten prompt, so they never share cache entries with plain ones
+    return f"{PROMPT_TEMPLATE_VERSION}+enhance" if enhance else str(PROMPT_TEMPLATE_VERSION)
+
+
+def generation_context(api_key: str = None, enhance: bool = False) -> str:
+    """Provider, model and template version that would serve a generation; cached results are only shared within one"""
+    providers = get_providers(api_key)
+    provider = providers[0] if providers else None
+    if provider is None:
+        return f"none:none:{_template_version(enhance)}"
+    return f"{provider.name}:{provider.model}:{_template_version(enhance)}"
+
+
+def generation_cache_key(prompt: str, api_key: str = None, enhance: bool = False) -> str:
+    providers = get_providers(api_key)
+    provider = providers[0] if providers else None
+    return make_cache_key(
+        prompt,
+        provider.name if provider else "none",
+        provider.model if provider else "none",
+        _template_version(enhance)
+    )
+
+
+def find_similar_generation(prompt: str, api_key: str = None, enhance: bool = False, exclude_key: str = None):
+    """(SimilarMatch, code) for the closest earlier prompt above the similarity threshold, or None.
+    The exact cache entry the request would be served from (exclude_key, by default prompt's own) is
+    never offered as "similar"."""
+    if exclude_key is None:
+        exclude_key = generation_cache_key(prompt, api_key, enhance)
+    match = response_cache.similar.find(prompt, generation_context(api_key, enhance), exclude_key)
+    if match is None:
+        return None
+    code = response_cache.get(match.key)
+    if code is None:
+        # The result itself was evicted or expired; stop matching against it
+        response_cache.similar.discard(match.key)
+        return None
+    logger.info(f"[Cache] Similar prompt hit ({match.score:.0%}, {match.latency_ms:.2f} ms): "
+                 f"{prompt!r} ~ {match.prompt!r}")
+    return match, code
+
+
+def _cached_generation(cache_key: str, prompt: str = None, api_key: str = None, enhance: bool = False):
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"[Cache] Hit for {cache_key[:12]}")
+        set_ai_status("online", "AI service is online (cached response).", DONE, provider="cache")
+        return cached
+    if prompt is not None and response_cache.similar.auto_serve:
+        similar = find_similar_generation(prompt, api_key, enhance)
+        if similar is not None:
+            match, cached = similar
+            set_ai_status("online", f"AI service is online (cached response, {match.score:.0%} similar to "
+                                    f"\"{match.prompt[:40]}\", found in {match.latency_ms:.1f} ms).",
+                          DONE, provider="cache")
+    return cached
+
+
+def _store_generation(cache_key: str, prompt: str, code: str, api_key: str = None, enhance: bool = False):
+    response_cache.put(cache_key, code)
+    if response_cache.enabled:
+        response_cache.similar.add(prompt, cache_key, generation_context(api_key, enhance))
+
+
+def remember_prompt_alias(original_prompt: str, final_prompt: str, api_key: str = None):
+    """Index original_prompt as another way to ask for final_prompt's cached result, e.g. before enhancement"""
+    if response_cache.enabled and original_prompt != final_prompt:
+        response_cache.similar.add(original_prompt, generation_cache_key(final_prompt, api_key),
+                                   generation_context(api_key))
+
+
+class AIJob:
+    """The provider-independent steps of one AI request: its prompt, how an answer is accepted and what
+    success or running out of attempts produces.
+
+    run_job and async_engine.run_job_async drive the same jobs and differ only in
+    how they wait on the providers. provider is set to the provider that answered.
+    """
+
+    operation = "generate"
+    message = "Generating code..."
+
+    def __init__(self, formatted: str):
+        self.formatted = formatted
+        self.provider = None
+        self.last_error = "No AI provider is available."
+        self.requested = time.perf_counter()
+
+    def accept(self, parsed: dict):
+        """Turn a parsed answer into the result; raises if it is unusable"""
+        return parsed
+
+    def begin_attempt(self, attempt: int):
+        attempt_started(attempt, self.message)
+        self.requested = time.perf_counter()
+
+    def attempt_failed(self, attempt: int, error: Exception):
+        self.last_error = str(error)
+        logger.error(f"[AI Error] {self.operation.capitalize()} attempt {attempt + 1} failed: {error}")
+        set_ai_status("error", f"AI error: {error}")
+
+    def succeeded(self, provider, result):
+        return result
+
+    def exhausted(self):
+        set_ai_status("offline", "All attempts to use AI failed.", DONE)
+        return None
+
+
+class GenerationJob(AIJob):
+    """Generate prompt as a GeneratedApp, storing complete results in response_cache"""
+
+    def __init__(self, prompt: str, api_key: str = None, use_cache=True, enhance=False):
+        super().__init__(build_generation_prompt(prompt, enhance))
+        self.prompt = prompt
+        self.api_key = api_key
+        self.use_cache = use_cache
+        self.enhance = enhance
+        self.cache_key = generation_cache_key(prompt, api_key, enhance)
+        self.started = time.perf_counter()
+
+    def cached(self) -> Optional[str]:
+        """The cached document for this request, when the cache may answer it"""
+        if not self.use_cache:
+            return None
+        return _cached_generation(self.cache_key, self.prompt, self.api_key, self.enhance)
+
+    def succeeded(self, provider, parsed) -> GeneratedApp:
+        # Network and parsing of every provider tried in this attempt
+        timings = {"request": round(time.perf_counter() - self.requested, 6)}
+        app = GeneratedApp.from_parsed(parsed, provider.name, provider.model, timings)
+        with metrics.timer("inline", provider.name, provider.model, into=app.timings):
+            final_code = app.document()
+        log_payload(logger, f"Final inlined HTML code from {provider.name}", final_code)
+        # A salvaged response is shown but not cached, so asking again gets a complete one
+        if self.use_cache and not app.partial:
+            _store_generation(self.cache_key, self.prompt, final_code, self.api_key, self.enhance)
+        app.timings["total"] = _record_total(self.started, provider)
+        set_ai_status("online", online_message(app.partial), DONE, provider=provider.name)
+        return app
+
+    def exhausted(self) -> GeneratedApp:
+        _record_total(self.started)
+        super().exhausted()
+        return GeneratedApp.from_document(UNAVAILABLE_HTML)
+
+
+def run_job(job: AIJob, api_key: str = None, retries=2):
+    """Try job against the providers, backing off between attempts; returns job.succeeded() or job.exhausted()"""
     for attempt in range(retries + 1):
+        job.begin_attempt(attempt)
         try:
-            set_ai_status("generating", "Generating code...")
-            if api_key:
-                # Try Gemini
-                try:
-                    genai.configure(api_key=api_key)
-                    model = genai.GenerativeModel('gemini-2.5-flash')
-                    response = model.generate_content(formatted).text
-                    logging.info(f"[Gemini] Raw AI response: {response}")
-                except Exception as gem_e:
-                    logging.warning(f"[Gemini Fallback] Gemini failed: {gem_e}. Falling back to Meta AI.")
-                    api_key = None  # Force fallback
-                    continue
-            if not api_key:
-                # Fallback to Meta AI
-                ai = MetaAI()
-                result = ai.prompt(message=formatted)
-                response = result.get("message", "")
-                logging.info(f"[MetaAI] Raw AI response: {response}")
-
-            parsed = extract_json(response)
-            if not parsed:
-                raise ValueError("AI response couldn't be parsed into JSON.")
-
-            set_ai_status("online", "AI service is online.")
-            html = str(parsed.get("html", ""))
-            css = str(parsed.get("css", ""))
-            js = str(parsed.get("js", ""))
-
-            final_code = html.replace("</head>", f"<style>{css}</style></head>") \
-                             .replace("</body>", f"<script>{js}</script></body>")
-            logging.info(f"Final inlined HTML code (first 500 chars): {str(final_code)[:500]}...")
+            job.provider, result = _request_planned(job.formatted, routable_providers(api_key, job.operation),
+                                                    api_key, job.operation, job.accept)
+        except Exception as e:
+            job.attempt_failed(attempt, e)
+            if attempt < retries and _backoff(attempt, api_key):
+                continue
+            break
+        return job.succeeded(job.provider, result)
+    return job.exhausted()
+
+
+def generate_code_from_prompt(prompt: str, api_key: str = None, retries=2, on_partial=None,
+                              use_cache=True, enhance=False):
+    """Generate a complete app for prompt.
+
+    Providers from core.providers are tried in their configured order; each
+    attempt falls through to the next provider before backing off.
+    When on_partial is given the provider response is streamed and on_partial is
+    called with a previewable partial document at most every
+    PARTIAL_PREVIEW_INTERVAL seconds while generation is in progress.
+    Successful results are stored in response_cache and served from it on repeat
+    requests unless use_cache is False. A call identical to one already running in
+    another thread waits for that one instead of calling a provider again.
+    enhance folds prompt enhancement into the generation request (see
+    needs_enhancement), so an enhanced generation costs one round trip.
+    """
+    enhance = enhance and needs_enhancement(prompt)
+    if on_partial is not None:
+        def stream():
+            final_code = None
+            last_push = 0.0
+            for final_code, done in stream_code_from_prompt(prompt, api_key, retries, use_cache, enhance):
+                now = time.monotonic()
+                if not done and now - last_push >= PARTIAL_PREVIEW_INTERVAL:
+                    last_push = now
+                    on_partial(final_code)
             return final_code
+
+        # A caller attaching to a stream already in flight only gets the final code
+        return in_flight.do(("stream", generation_cache_key(prompt, api_key, enhance)), stream)
+
+    return generate_app(prompt, api_key, retries, use_cache, enhance).document()
+
+
+def generate_app(prompt: str, api_key: str = None, retries=2, use_cache=True, enhance=False) -> GeneratedApp:
+    """Generate prompt as a GeneratedApp: separate html/css/js plus provider, model and timings.
+    Cached and failed results carry only a finished document. Identical concurrent
+    calls share one generation (see in_flight). With enhance, prompts that need it are
+    expanded by the same request and the expansion is returned as app.refined_prompt."""
+    enhance = enhance and needs_enhancement(prompt)
+    job = GenerationJob(prompt, api_key, use_cache, enhance)
+    return in_flight.do(("generate", job.cache_key), lambda: _generate_app(job, api_key, retries))
+
+
+def _generate_app(job: GenerationJob, api_key: str, retries: int) -> GeneratedApp:
+    cached = job.cached()
+    if cached is not None:
+        return GeneratedApp.from_document(cached, provider="cache")
+    return run_job(job, api_key, retries)
+
+
+def online_message(partial: bool = False) -> str:
+    if partial:
+        return "AI service is online (the response was cut off; showing the part that was recovered)."
+    return "AI service is online."
+
+
+def _record_total(started: float, provider=None) -> float:
+    """Record end-to-end generation latency, refresh the exported metrics files and return the latency"""
+    elapsed = time.perf_counter() - started
+    metrics.observe("total", elapsed, provider.name if provider else "none", provider.model if provider else "none")
+    metrics.maybe_export()
+    return round(elapsed, 6)
+
+
+def variant_chains(n: int, api_key: str = None, temperatures=None, spread_providers=False):
+    """(temperature, provider chain) for each of n variants.
+
+    Every variant samples at its own temperature; with spread_providers each
+    one also starts at a different provider, falling back to the others.
+    """
+    providers = routable_providers(api_key)
+    temperatures = list(temperatures or DEFAULT_VARIANT_TEMPERATURES)
+    chains = []
+    for index in range(n):
+        temperature = temperatures[index % len(temperatures)]
+        ordered = providers
+        if spread_providers and providers:
+            shift = index % len(providers)
+            ordered = providers[shift:] + providers[:shift]
+        chains.append((temperature, [provider.with_options(temperature=temperature) for provider in ordered]))
+    return chains
+
+
+def generate_variants(prompt: str, n=4, api_key: str = None, temperatures=None, spread_providers=False,
+                      on_variant=None, enhance=False) -> list:
+    """Generate n alternative apps for prompt concurrently.
+
+    Returns variant dicts (index, temperature, provider, status, code,
+    refined_prompt, elapsed) in index order. on_variant is called with each
+    variant as soon as it finishes, from a worker thread. Variants bypass the
+    response cache since they are meant to differ. enhance works as in
+    generate_code_from_prompt, each variant expanding the prompt in its own request.
+    """
+    formatted = build_generation_prompt(prompt, enhance and needs_enhancement(prompt))
+    set_ai_status("generating", f"Generating {n} variants...", REQUEST_STARTED, attempt=1)
+
+    def run(index, temperature, chain):
+        started = time.monotonic()
+        variant = {"index": index, "temperature": temperature, "provider": None, "refined_prompt": None}
+        try:
+            provider, parsed = _request_in_order(formatted, chain, api_key)
+            app = GeneratedApp.from_parsed(parsed, provider.name, provider.model)
+            variant.update(provider=provider.name, status="ok", code=app.document(), refined_prompt=app.refined_prompt)
+        except Exception as e:
+            logger.error(f"[AI Error] Variant {index + 1} failed: {str(e)}")
+            variant.update(status="failed", code=UNAVAILABLE_HTML, error=str(e))
+        variant["elapsed"] = round(time.monotonic() - started, 3)
+        if on_variant:
+            on_variant(variant)
+        return variant
+
+    chains = variant_chains(n, api_key, temperatures, spread_providers)
+    with ThreadPoolExecutor(max_workers=max(n, 1)) as pool:
+        futures = [pool.submit(run, index, temperature, chain) for index, (temperature, chain) in enumerate(chains)]
+        variants = [future.result() for future in futures]
+
+    if any(variant["status"] == "ok" for variant in variants):
+        set_ai_status("online", "AI service is online.", DONE)
+    else:
+        set_ai_status("offline", "All attempts to use AI failed.", DONE)
+    return variants
+
+
+def _request_and_parse(provider, formatted: str, api_key: str = None, operation="generate", accept=None):
+    """Send formatted to provider and parse its JSON answer.
+
+    accept, when given, turns the parsed dict into the final result and raises
+    if the answer is unusable, so the caller moves on to the next provider.
+    """
+    with capture_reported_usage() as reported, _guarded_call(provider), \
+            metrics.timer("network", provider.name, provider.model):
+        response = provider.generate(formatted, api_key, operation)
+    usage_ledger.record_call(provider, operation, formatted, response, reported)
+    parsed = parse_response(provider, response, operation)
+    return accept(parsed) if accept else parsed
+
+
+def _request_in_order(formatted: str, providers, api_key: str = None, operation="generate", accept=None):
+    """Try providers one after another; return (provider, result) from the first that succeeds"""
+    last_error = RuntimeError("No AI provider is available.")
+    for index, provider in enumerate(providers):
+        if index:
+            provider_switched(providers[index - 1], provider)
+        try:
+            return provider, _request_and_parse(provider, formatted, api_key, operation, accept)
+        except Exception as e:
+            provider_failed(provider, e)
+            last_error = e
+    raise last_error
+
+
+def provider_failed(provider, error: Exception):
+    logger.error(f"[AI Error] {provider.name} failed: {str(error)}")
+    set_ai_status("error", f"AI error: {str(error)}", provider=provider.name)
+
+
+def _request_planned(formatted: str, providers, api_key: str = None, operation="generate", accept=None):
+    """_request_in_order, or one request_hedged race across the providers when hedging is on"""
+    plan = request_plan(providers)
+    if len(plan) == 1 and len(plan[0]) > 1:
+        return request_hedged(formatted, plan[0], api_key, operation=operation, accept=accept)
+    return _request_in_order(formatted, providers, api_key, operation, accept)
+
+
+def chunk_received(provider_name: str, chars: int):
+    # Published without logging; a stream produces one of these per chunk
+    status_bus.publish(StatusEvent(CHUNK_RECEIVED, "generating", f"Receiving code - {chars} characters",
+                                   provider=provider_name, chars=chars))
+
+
+def provider_switched(previous, provider):
+    set_ai_status("generating", f"{previous.name} failed; trying {provider.name}...", PROVIDER_SWITCHED,
+                  provider=provider.name)
+
+
+def configure_hedging(settings: dict):
+    """Apply the "hedging" section of settings.json"""
+    with _hedge_lock:
+        hedge_settings["enabled"] = bool(settings.get("enabled", hedge_settings["enabled"]))
+        hedge_settings["delay"] = float(settings.get("delay", hedge_settings["delay"]))
+        hedge_settings["max_providers"] = int(settings.get("max_providers", hedge_settings["max_providers"]))
+
+
+def request_hedged(formatted: str, providers, api_key: str = None, hedge_delay: float = None,
+                   operation="generate", accept=None):
+    """Race the same request across providers and return (provider, parsed) for the first valid answer.
+
+    The first provider starts immediately; the next one is launched after
+    hedge_delay seconds without a valid answer (0 fires them all at once), or
+    right away when a running provider fails. Losing requests cannot be
+    aborted mid-flight, so their threads finish in the background and their
+    results are only recorded in hedge_stats.
+    """
+    delay = hedge_settings["delay"] if hedge_delay is None else hedge_delay
+    pending = list(providers)[:hedge_settings["max_providers"]]
+    results = queue.Queue()
+    errors = []
+
+    def run(provider):
+        started = time.monotonic()
+        try:
+            parsed = _request_and_parse(provider, formatted, api_key, operation, accept)
+        except Exception as e:
+            record_hedge(provider.name, time.monotonic() - started, ok=False)
+            results.put((provider, None, e))
+            return
+        record_hedge(provider.name, time.monotonic() - started, ok=True)
+        results.put((provider, parsed, None))
+
+    def launch():
+        provider = pending.pop(0)
+        record_hedge(provider.name, launched=True)
+        logger.info(f"[Hedge] Sending request to {provider.name}")
+        threading.Thread(target=run, args=(provider,), daemon=True).start()
+
+    launch()
+    running = 1
+    while running:
+        try:
+            provider, parsed, error = results.get(timeout=delay if pending else None)
+        except queue.Empty:
+            launch()
+            running += 1
+            continue
+        running -= 1
+        if parsed is not None:
+            record_hedge(provider.name, won=True)
+            logger.info(f"[Hedge] {provider.name} won the race")
+            return provider, parsed
+        logger.error(f"[Hedge] {provider.name} failed: {error}")
+        errors.append(error)
+        if pending:
+            launch()
+            running += 1
+    raise errors[-1] if errors else RuntimeError("No AI provider is available.")
+
+
+def request_plan(providers):
+    """Provider groups to try in turn: one hedged race across all of them when hedging is on, else each alone"""
+    providers = list(providers)
+    if hedge_settings["enabled"] and len(providers) > 1:
+        return [providers]
+    return [[provider] for provider in providers]
+
+
+def _guarded_stream(provider, formatted: str, api_key: str = None):
+    """provider.stream(formatted) through the provider's guard, with network time and token usage recorded"""
+    chunks = []
+    try:
+        with capture_reported_usage() as reported, _guarded_call(provider), \
+                metrics.timer("network", provider.name, provider.model):
+            requested = time.perf_counter()
+            for chunk in provider.stream(formatted, api_key):
+                if not chunks:
+                    metrics.observe("first_chunk", time.perf_counter() - requested, provider.name, provider.model)
+                chunks.append(chunk)
+                yield chunk
+    finally:
+        # Streams cut short still used tokens
+        if chunks:
+            usage_ledger.record_call(provider, "generate", formatted, "".join(chunks), reported)
+
+
+def stream_hedged(formatted: str, providers, api_key: str = None, hedge_delay: float = None):
+    """Streaming request_hedged: race providers on their first chunk and return (provider, chunks).
+
+    chunks iterates the winner's whole stream. Providers are launched as in
+    request_hedged; the losers stop reading at their next chunk, and the winner
+    stops too once chunks is closed.
+    """
+    delay = hedge_settings["delay"] if hedge_delay is None else hedge_delay
+    pending = list(providers)[:hedge_settings["max_providers"]]
+    items = queue.Queue()
+    winner = []
+    stop = threading.Event()
+    launched = {}
+    errors = []
+
+    def run(provider):
+        stream = _guarded_stream(provider, formatted, api_key)
+        try:
+            for chunk in stream:
+                if stop.is_set() or (winner and winner[0] is not provider):
+                    break
+                items.put((provider, chunk, None))
         except Exception as e:
-            logging.error(f"[AI Error] Attempt {attempt + 1} failed: {str(e)}")
-            set_ai_status("error", f"AI error: {str(e)}")
-            import time
-            time.sleep(2 ** attempt)
+            items.put((provider, None, e))
+            return
+        finally:
+            stream.close()
+        items.put((provider, _STREAM_END, None))
+
+    def follow(provider, first):
+        try:
+            yield first
+            while True:
+                source, chunk, error = items.get()
+                if source is not provider:
+                    continue
+                if error is not None:
+                    raise error
+                if chunk is _STREAM_END:
+                    return
+                yield chunk
+        finally:
+            stop.set()
+
+    def launch():
+        provider = pending.pop(0)
+        launched[provider] = time.monotonic()
+        record_hedge(provider.name, launched=True)
+        logger.info(f"[Hedge] Streaming request to {provider.name}")
+        threading.Thread(target=run, args=(provider,), daemon=True).start()
+
+    launch()
+    running = 1
+    while running:
+        try:
+            provider, chunk, error = items.get(timeout=delay if pending else None)
+        except queue.Empty:
+            launch()
+            running += 1
+            continue
+        latency = time.monotonic() - launched[provider]
+        if error is None and chunk is not _STREAM_END:
+            winner.append(provider)
+            record_hedge(provider.name, latency, ok=True)
+            record_hedge(provider.name, won=True)
+            logger.info(f"[Hedge] {provider.name} streamed first")
+            return provider, follow(provider, chunk)
+        running -= 1
+        error = error or ValueError(f"{provider.name} returned an empty response.")
+        record_hedge(provider.name, latency, ok=False)
+        logger.error(f"[Hedge] {provider.name} failed: {error}")
+        errors.append(error)
+        if pending:
+            launch()
+            running += 1
+    raise errors[-1] if errors else RuntimeError("No AI provider is available.")
+
+
+def record_hedge(name: str, latency: float = None, ok: bool = None, launched=False, won=False):
+    with _hedge_lock:
+        stats = hedge_stats.setdefault(
+            name, {"launched": 0, "wins": 0, "completed": 0, "failures": 0, "total_latency": 0.0}
+        )
+        if launched:
+            stats["launched"] += 1
+        if won:
+            stats["wins"] += 1
+        if ok is not None:
+            stats["completed" if ok else "failures"] += 1
+            stats["total_latency"] += latency
+
+
+def get_single_flight_stats() -> dict:
+    """Generations that reached a provider and identical concurrent calls coalesced into them"""
+    return in_flight.stats()
+
+
+def get_hedge_stats() -> dict:
+    """Per-provider launch/win counts and mean latency of hedged requests"""
+    with _hedge_lock:
+        report = {}
+        for name, stats in hedge_stats.items():
+            finished = stats["completed"] + stats["failures"]
+            report[name] = dict(stats, mean_latency=stats["total_latency"] / finished if finished else None)
+        return report
+
+
+def stream_code_from_prompt(prompt: str, api_key: str = None, retries=2, use_cache=True, enhance=False):
+    """Stream a generation, yielding (document, done) tuples.
+
+    Every partial document is previewable HTML built from the fields decoded so
+    far; the last item has done=True and carries the same code that
+    generate_code_from_prompt would have returned.
+    """
+    job = GenerationJob(prompt, api_key, use_cache, enhance)
+    cached = job.cached()
+    if cached is not None:
+        yield cached, True
+        return
+
+    for attempt in range(retries + 1):
+        job.begin_attempt(attempt)
+        previous = None
+        for candidates in request_plan(routable_providers(api_key)):
+            provider = candidates[0]
+            if previous is not None:
+                provider_switched(previous, provider)
+            previous = provider
+            parser = PartialJSONFieldParser()
+            chunks = []
+            received = 0
+            try:
+                if len(candidates) > 1:
+                    provider, stream = stream_hedged(job.formatted, candidates, api_key)
+                else:
+                    stream = _guarded_stream(provider, job.formatted, api_key)
+                for chunk in stream:
+                    chunks.append(chunk)
+                    received += len(chunk)
+                    chunk_received(provider.name, received)
+                    if parser.feed(chunk):
+                        yield render_partial_document(parser.fields_so_far(), parser.completed), False
+                parsed = parse_response(provider, "".join(chunks))
+            except Exception as e:
+                job.attempt_failed(attempt, e)
+                continue
+            yield job.succeeded(provider, parsed).document(), True
+            return
+        if attempt < retries and _backoff(attempt, api_key):
+            continue
+        break
 
-    set_ai_status("offline", "All attempts to use AI failed.")
-    return "<!DOCTYPE html><html><head><title>Error</title><style></style></head><body><h1>AI service is currently unavailable.</h1></body></html>"
+    yield job.exhausted().document(), True
+
+
+def build_update_prompt(current_code: str, instruction: str) -> str:
+    return (
+        f"You are a helpful assistant that edits existing frontend apps.\n"
+        f"Here is the current single-file app between the CODE markers:\n"
+        f"<<<CODE\n{current_code}\nCODE>>>\n"
+        f"Apply this change: \"{instruction}\"\n"
+        f"Respond ONLY with a JSON edit list, with no additional text, markdown, or explanation before or after the JSON:\n"
+        "{\n"
+        "  \"edits\": [{\"search\": \"exact text copied from the current code\", \"replace\": \"new text\"}],\n"
+        "  \"summary\": \"One sentence describing the change\"\n"
+        "}\n"
+        "Every search block must be copied verbatim from the current code, occur in it exactly once and be "
+        "as short as possible while still unique. Never repeat code that does not change."
+    )
+
+
+def build_regenerate_prompt(current_code: str, instruction: str) -> str:
+    return f"{instruction}\n\nStart from this existing page and keep everything not mentioned unchanged:\n{current_code}"
+
+
+def update_code_from_prompt(current_code: str, instruction: str, api_key: str = None, retries=2,
+                            on_partial=None) -> str:
+    """Apply instruction to current_code through a compact search/replace edit list.
+
+    The model only returns the hunks that change, so output size scales with the
+    change rather than the page. If no provider produces an edit list that
+    applies cleanly, the whole page is regenerated from the current code.
+    """
+    if not current_code or not current_code.strip():
+        return generate_code_from_prompt(instruction, api_key, retries, on_partial=on_partial)
+
+    job = UpdateJob(current_code, instruction)
+    patched = run_job(job, api_key, retries)
+    if patched is not None:
+        return patched
+    return generate_code_from_prompt(job.regenerate_prompt(), api_key, retries, on_partial=on_partial,
+                                     use_cache=False)
+
+
+class UpdateJob(AIJob):
+    """Edit current_code through a search/replace edit list; exhausted() leaves the fallback to the caller"""
+
+    operation = "update"
+    message = "Generating code changes..."
+
+    def __init__(self, current_code: str, instruction: str):
+        super().__init__(build_update_prompt(current_code, instruction))
+        self.current_code = current_code
+        self.instruction = instruction
+
+    def accept(self, parsed: dict) -> str:
+        return apply_edits(self.current_code, parsed.get("edits"))
+
+    def attempt_failed(self, attempt: int, error: Exception):
+        # Not an outage yet: running out of attempts still falls back to a full regenerate
+        self.last_error = str(error)
+        logger.error(f"[AI Error] Update attempt {attempt + 1} failed: {error}")
+
+    def succeeded(self, provider, patched: str) -> str:
+        set_ai_status("online", "AI service is online.", DONE, provider=provider.name)
+        logger.info(f"[Update] Applied edit list from {provider.name}: "
+                    f"{len(self.current_code)} -> {len(patched)} chars")
+        return patched
+
+    def exhausted(self):
+        logger.warning("[Update] No edit list applied cleanly; regenerating the full page.")
+        return None
+
+    def regenerate_prompt(self) -> str:
+        return build_regenerate_prompt(self.current_code, self.instruction)
+
+
+def build_region_prompt(fragment: str, before: str, after: str, instruction: str) -> str:
+    return (
+        f"You are a helpful assistant that edits one fragment of a larger single-file web page.\n"
+        f"Context before the fragment (read-only):\n<<<BEFORE\n{before}\nBEFORE>>>\n"
+        f"Fragment to rewrite:\n<<<FRAGMENT\n{fragment}\nFRAGMENT>>>\n"
+        f"Context after the fragment (read-only):\n<<<AFTER\n{after}\nAFTER>>>\n"
+        f"Apply this change to the fragment only: \"{instruction}\"\n"
+        f"Respond ONLY in this JSON format, with no additional text, markdown, or explanation before or after the JSON:\n"
+        "{\n"
+        "  \"fragment\": \"the complete replacement for the fragment\"\n"
+        "}"
+    )
+
+
+def accept_fragment(parsed: dict) -> str:
+    """The replacement fragment of a region response; raises if it has none"""
+    replacement = parsed.get("fragment")
+    if not isinstance(replacement, str):
+        raise ValueError("Response has no 'fragment' field.")
+    return replacement
+
+
+def regenerate_region(code: str, start: int, end: int, instruction: str, api_key: str = None,
+                      retries=2, context_lines=REGION_CONTEXT_LINES) -> str:
+    """Rewrite code[start:end] according to instruction and splice the result back in.
+
+    Only the fragment and a few surrounding lines are sent, so request and
+    response size depend on the region rather than the page. Returns the
+    original code unchanged if every attempt fails.
+    """
+    updated = run_job(RegionJob(code, start, end, instruction, context_lines), api_key, retries)
+    return code if updated is None else updated
+
+
+class RegionJob(AIJob):
+    """Rewrite code[start:end] and splice it back in; exhausted() returns None"""
+
+    operation = "region"
+    message = "Regenerating selected region..."
+
+    def __init__(self, code: str, start: int, end: int, instruction: str, context_lines=REGION_CONTEXT_LINES):
+        self.code = code
+        self.start = start
+        self.end = end
+        before, after = surrounding_context(code, start, end, context_lines)
+        super().__init__(build_region_prompt(code[start:end], before, after, instruction))
+
+    def accept(self, parsed: dict) -> str:
+        return accept_fragment(parsed)
+
+    def succeeded(self, provider, replacement: str) -> str:
+        set_ai_status("online", "AI service is online.", DONE, provider=provider.name)
+        logger.info(f"[Region] {provider.name} rewrote {self.end - self.start} chars as {len(replacement)} chars")
+        return self.code[:self.start] + replacement + self.code[self.end:]
+
+
+def regenerate_target(code: str, target: str, instruction: str, api_key: str = None, retries=2) -> str:
+    """regenerate_region for a line range ("10-25") or simple selector ("nav", "#hero", ".card")"""
+    span = resolve_region(code, target)
+    if span is None:
+        raise ValueError(f"Could not find '{target}' in the current code.")
+    return regenerate_region(code, span[0], span[1], instruction, api_key, retries)
+
+
+def build_optimize_prompt(prompt: str) -> str:
+    return (
+        f"Transform the following vague or minimal UI prompt into a clear, detailed, and professional instruction specifically for frontend web development. "
+        f"Focus on HTML, CSS, and JavaScript. Include layout details, components to be included, styling considerations, and any interactivity if relevant. "
+        f"Keep the improved prompt concise yet specific. Do not add commentary or formatting:\n\n"
+        f"User Prompt: \"{prompt.strip()}\"\n\n"
+        f"Refined Prompt:"
+    )
+
+
+def configure_enhancement(settings: dict):
+    """Apply the "prompt_enhancement" section of settings.json"""
+    enhancement_settings["ai_fallback"] = bool(settings.get("ai_fallback", enhancement_settings["ai_fallback"]))
+
+
+def plan_enhancement(prompt: str):
+    """(prompt to generate from, whether AI should still enhance it) for an enhanced generation.
+    Local templates come first and cost no network; AI is only asked when configured to."""
+    if not needs_enhancement(prompt):
+        return prompt, False
+    local = prompt_enhancer.enhance(prompt)
+    if local is not None:
+        return local, False
+    if enhancement_settings["ai_fallback"]:
+        return prompt, True
+    return rule_based_enhancement(prompt), False
 
 
 def optimize_prompt(prompt: str, api_key: str = None) -> str:
     print("[optimize_prompt] Called with:", prompt)
-    if len(prompt.strip()) >= 20 and not is_generic(prompt):
-        return prompt
+    final_prompt, use_ai = plan_enhancement(prompt)
+    if not use_ai:
+        return final_prompt
 
-    try:
-        if api_key:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            enriched = model.generate_content(
-                f"Transform the following vague or minimal UI prompt into a clear, detailed, and professional instruction specifically for frontend web development. "
-                f"Focus on HTML, CSS, and JavaScript. Include layout details, components to be included, styling considerations, and any interactivity if relevant. "
-                f"Keep the improved prompt concise yet specific. Do not add commentary or formatting:\n\n"
-                f"User Prompt: \"{prompt.strip()}\"\n\n"
-                f"Refined Prompt:"
-            ).text.strip()
+    request = build_optimize_prompt(prompt)
+    for provider in routable_providers(api_key, operation="optimize"):
+        try:
+            with capture_reported_usage() as reported, _guarded_call(provider), \
+                    metrics.timer("optimize", provider.name, provider.model):
+                enriched = provider.generate(request, api_key, operation="optimize").strip()
+            usage_ledger.record_call(provider, "optimize", request, enriched, reported)
             if enriched:
                 return enriched
-    except Exception as e:
-        logging.error(f"optimize_prompt failed with Gemini: {str(e)}")
+        except Exception as e:
+            logger.error(f"optimize_prompt failed with {provider.name}: {str(e)}")
     return rule_based_enhancement(prompt)
 
 
@@ -126,6 +1001,11 @@ def rule_based_enhancement(prompt: str) -> str:
     return f"{prompt}\n\nUse semantic HTML5 structure.\nApply responsive CSS (mobile-first).\nInclude clean modular JavaScript with comments."
 
 
+def needs_enhancement(prompt: str) -> bool:
+    """Short or generic prompts are worth expanding; detailed ones are used as written"""
+    return len(prompt.strip()) < 20 or is_generic(prompt)
+
+
 def is_generic(prompt: str) -> bool:
     generic_phrases = {
         "make a website", "build ui", "create page", "webpage", "dashboard", "login", "landing page"
@@ -0,0 +1,108 @@
+"""
+Structured result of a generation: the separate html, css and js the model
+returned plus where and how fast it was produced. Consumers read the parts
+directly; the single-file document is assembled once, on demand.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+_HEAD_CLOSE = re.compile(r"</head\s*>", re.IGNORECASE)
+_BODY_CLOSE = re.compile(r"</body\s*>", re.IGNORECASE)
+_BODY = re.compile(r"<body[^>]*>(.*)</body\s*>", re.IGNORECASE | re.DOTALL)
+
+
+def _last_match(pattern, text: str):
+    last = None
+    for last in pattern.finditer(text):
+        pass
+    return last
+
+
+@dataclass
+class GeneratedApp:
+    html: str = ""
+    css: str = ""
+    js: str = ""
+    name: str = ""
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    # Seconds spent per pipeline phase for this request ("network", "extract_json", ...)
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Set for fallbacks that carry a complete document instead of parts (e.g. the error page)
+    raw_document: Optional[str] = None
+    # Salvaged from a cut-off response (see core.json_scan.repair_json_object)
+    partial: bool = False
+    # Expanded prompt the model built from, when enhancement was folded into the request
+    refined_prompt: Optional[str] = None
+
+    @classmethod
+    def from_parsed(cls, parsed: dict, provider: str = None, model: str = None, timings: Dict = None):
+        return cls(
+            html=str(parsed.get("html", "")),
+            css=str(parsed.get("css", "")),
+            js=str(parsed.get("js", "")),
+            name=str(parsed.get("name", "")),
+            provider=provider,
+            model=model,
+            timings=dict(timings or {}),
+            partial=getattr(parsed, "partial", False),
+            refined_prompt=str(parsed.get("refined_prompt") or "").strip() or None,
+        )
+
+    @classmethod
+    def from_document(cls, document: str, **details):
+        """Wrap an already assembled page, e.g. an edited or cached document"""
+        return cls(raw_document=document, **details)
+
+    def document(self) -> str:
+        """Single-file page with css and js inlined; built once and reused"""
+        if self.raw_document is None:
+            self.raw_document = self._inline()
+        return self.raw_document
+
+    def _inline(self) -> str:
+        return self._assemble(f"<style>{self.css}</style>", f"<script>{self.js}</script>")
+
+    def _assemble(self, style: str, script: str) -> str:
+        # Splice before the last closing tags only, so "</body>" inside a script string is left alone
+        html = self.html
+        head = _last_match(_HEAD_CLOSE, html)
+        body = _last_match(_BODY_CLOSE, html)
+        splices = []
+        if head is not None:
+            splices.append((head.start(), style))
+        if body is not None:
+            splices.append((body.start(), script))
+        parts = []
+        position = 0
+        for index, insert in sorted(splices):
+            parts += [html[position:index], insert]
+            position = index
+        parts.append(html[position:])
+        return "".join(parts)
+
+    def body_html(self) -> str:
+        """Markup inside <body>, without the inlined script"""
+        match = _BODY.search(self.html or self.document())
+        return match.group(1) if match else (self.html or self.document())
+
+    def files(self) -> Dict[str, str]:
+        """Multi-file layout for export: index.html linking style.css and script.js"""
+        if not self.html:
+            return {"index.html": self.document()}
+        page = self._assemble('<link rel="stylesheet" href="style.css">', '<script src="script.js"></script>')
+        return {"index.html": page, "style.css": self.css, "script.js": self.js}
+
+    def to_json(self) -> str:
+        return json.dumps({"html": self.html, "css": self.css, "js": self.js, "name": self.name,
+                           "provider": self.provider, "model": self.model, "refined_prompt": self.refined_prompt})
+
+    @classmethod
+    def from_json(cls, text: str):
+        data = json.loads(text)
+        return cls(html=data.get("html", ""), css=data.get("css", ""), js=data.get("js", ""),
+                   name=data.get("name", ""), provider=data.get("provider"), model=data.get("model"),
+                   refined_prompt=data.get("refined_prompt"))
@@ -0,0 +1,506 @@
+"""
+Asyncio counterparts of the AI engine entry points.
+
+Generations run as tasks on one shared event loop thread instead of one OS
+thread each, can be cancelled (freeing the provider connection immediately)
+and can be given a deadline. Results come back as GenerationResult objects;
+TkAsyncBridge delivers them to Tk callbacks on the main thread.
+"""
+
+import asyncio
+import dataclasses
+import logging
+import queue
+import threading
+import time
+import tkinter as tk
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from core import ai_engine
+from core.artifacts import GeneratedApp
+from core.ai_engine import (
+    UNAVAILABLE_HTML, REGION_CONTEXT_LINES, AIJob, GenerationJob, ProviderUnavailableError, RegionJob, UpdateJob,
+    backoff_delay, build_generation_prompt, build_optimize_prompt, chunk_received, generation_cache_key,
+    needs_enhancement, parse_response, plan_enhancement, provider_failed, provider_switched, record_hedge,
+    request_plan, rule_based_enhancement, routable_providers, set_ai_status, variant_chains
+)
+from core.status_bus import DONE, REQUEST_STARTED
+from core.metrics import metrics
+from core.providers import async_concurrency_slot
+from core.regions import resolve_region
+from core.resilience import guard_for
+from core.streaming import PartialJSONFieldParser, render_partial_document
+from core.usage import capture_reported_usage, ledger as usage_ledger
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+
+
+@dataclass
+class GenerationResult:
+    status: str
+    code: str = ""
+    provider: Optional[str] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    temperature: Optional[float] = None
+    # Separate html/css/js with provider and timings; only set for fresh generations
+    app: Optional[GeneratedApp] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == OK
+
+
+@asynccontextmanager
+async def _guarded_async_call(provider):
+    """Async _guarded_call: waits for rate-limit tokens and concurrency slots without blocking the loop"""
+    guard = guard_for(provider.name)
+    waited = time.perf_counter()
+    refused = await guard.admit_async()
+    if refused:
+        raise ProviderUnavailableError(f"{provider.name} {refused}.")
+    async with async_concurrency_slot(provider.name):
+        metrics.observe("queue_wait", time.perf_counter() - waited, provider.name, provider.model)
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Cancelling is not the provider's fault; only give back a half-open trial
+            guard.breaker.release_trial()
+            raise
+        except Exception:
+            guard.breaker.record_failure()
+            raise
+        guard.breaker.record_success()
+
+
+async def _backoff(attempt: int, api_key: str = None, operation: str = "generate") -> bool:
+    delay = backoff_delay(attempt, api_key, operation)
+    if delay is None:
+        return False
+    await asyncio.sleep(delay)
+    return True
+
+
+async def _request_and_parse_async(provider, formatted: str, api_key: str = None, operation="generate",
+                                   accept: Callable = None, on_partial: Callable = None, claim: Callable = None):
+    """Async _request_and_parse; with on_partial the response is streamed as previews (see _stream_with_previews)"""
+    with capture_reported_usage() as reported:
+        async with _guarded_async_call(provider):
+            with metrics.timer("network", provider.name, provider.model):
+                if on_partial is None:
+                    response = await provider.agenerate(formatted, api_key, operation)
+                else:
+                    response = await _stream_with_previews(provider, formatted, api_key, on_partial, claim)
+    usage_ledger.record_call(provider, operation, formatted, response, reported)
+    parsed = parse_response(provider, response, operation)
+    return accept(parsed) if accept else parsed
+
+
+async def _request_in_order_async(formatted: str, providers, api_key: str = None, operation="generate",
+                                  accept: Callable = None, on_partial: Callable = None):
+    """Async _request_in_order"""
+    last_error = RuntimeError("No AI provider is available.")
+    for index, provider in enumerate(providers):
+        if index:
+            provider_switched(providers[index - 1], provider)
+        try:
+            return provider, await _request_and_parse_async(provider, formatted, api_key, operation, accept,
+                                                            on_partial)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            provider_failed(provider, e)
+            last_error = e
+    raise last_error
+
+
+async def _request_planned_async(job: AIJob, providers, api_key: str = None, on_partial: Callable = None):
+    """Async _request_planned for job"""
+    plan = request_plan(providers)
+    if len(plan) == 1 and len(plan[0]) > 1:
+        return await request_hedged_async(
+            plan[0], lambda provider, claim: _request_and_parse_async(
+                provider, job.formatted, api_key, job.operation, job.accept, on_partial, claim))
+    return await _request_in_order_async(job.formatted, providers, api_key, job.operation, job.accept, on_partial)
+
+
+async def run_job_async(job: AIJob, api_key: str = None, retries=2, on_partial: Callable = None):
+    """Async run_job: the same job steps, awaiting providers on the event loop so the job can be cancelled"""
+    for attempt in range(retries + 1):
+        job.begin_attempt(attempt)
+        try:
+            job.provider, result = await _request_planned_async(
+                job, routable_providers(api_key, job.operation), api_key, on_partial)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.attempt_failed(attempt, e)
+            if attempt < retries and await _backoff(attempt, api_key):
+                continue
+            break
+        return job.succeeded(job.provider, result)
+    return job.exhausted()
+
+
+async def _generate(prompt: str, api_key: str, retries: int, on_partial: Callable, use_cache: bool,
+                    enhance: bool = False) -> GenerationResult:
+    job = GenerationJob(prompt, api_key, use_cache, enhance)
+    cached = job.cached()
+    if cached is not None:
+        return GenerationResult(OK, cached, provider="cache")
+    app = await run_job_async(job, api_key, retries, on_partial)
+    if job.provider is None:
+        return GenerationResult(FAILED, app.document(), error=job.last_error)
+    return GenerationResult(OK, app.document(), provider=app.provider, app=app)
+
+
+async def request_hedged_async(providers, attempt: Callable, hedge_delay: float = None):
+    """Async request_hedged: race attempt(provider, claim) across providers and return (provider, result).
+
+    Providers are launched as in request_hedged. A streaming attempt calls
+    claim() when its first chunk arrives; the first to do so leads the race and
+    every other attempt is cancelled, freeing its connection. Attempts that
+    never claim race to completion and the first success wins.
+    """
+    delay = ai_engine.hedge_settings["delay"] if hedge_delay is None else hedge_delay
+    pending = list(providers)[:ai_engine.hedge_settings["max_providers"]]
+    leader = asyncio.get_running_loop().create_future()
+    running = {}
+    launched = {}
+    errors = []
+
+    def claimer(provider):
+        def claim() -> bool:
+            if not leader.done():
+                leader.set_result(provider)
+                logger.info(f"[Hedge] {provider.name} streamed first")
+            return leader.result() is provider
+        return claim
+
+    def launch():
+        provider = pending.pop(0)
+        launched[provider] = time.monotonic()
+        record_hedge(provider.name, launched=True)
+        logger.info(f"[Hedge] Sending request to {provider.name}")
+        running[asyncio.ensure_future(attempt(provider, claimer(provider)))] = provider
+
+    launch()
+    try:
+        while running:
+            waiting = set(running) if leader.done() else {*running, leader}
+            done, _ = await asyncio.wait(waiting, timeout=delay if pending and not leader.done() else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            if leader.done():
+                for task, provider in list(running.items()):
+                    if provider is not leader.result():
+                        task.cancel()
+                        del running[task]
+            for task in done:
+                provider = running.pop(task, None)
+                if provider is None:
+                    continue
+                latency = time.monotonic() - launched[provider]
+                error = task.exception()
+                record_hedge(provider.name, latency, ok=error is None)
+                if error is None:
+                    record_hedge(provider.name, won=True)
+                    logger.info(f"[Hedge] {provider.name} won the race")
+                    return provider, task.result()
+                logger.error(f"[Hedge] {provider.name} failed: {error}")
+                errors.append(error)
+                if leader.done():
+                    # The leader failed mid-stream; the others were already cancelled
+                    raise error
+                if pending:
+                    launch()
+    finally:
+        for task in running:
+            task.cancel()
+    raise errors[-1] if errors else RuntimeError("No AI provider is available.")
+
+
+async def _stream_with_previews(provider, formatted: str, api_key: str, on_partial: Callable,
+                                claim: Callable = None) -> str:
+    """Stream a response, pushing throttled previews to on_partial; in a hedged race only once claim() makes
+    this provider the leader"""
+    parser = PartialJSONFieldParser()
+    chunks = []
+    last_push = 0.0
+    received = 0
+    leading = claim is None
+    requested = time.perf_counter()
+    async for chunk in provider.astream(formatted, api_key):
+        if not chunks:
+            metrics.observe("first_chunk", time.perf_counter() - requested, provider.name, provider.model)
+            leading = leading or claim()
+        chunks.append(chunk)
+        received += len(chunk)
+        if not leading:
+            continue
+        chunk_received(provider.name, received)
+        now = time.monotonic()
+        if parser.feed(chunk) and now - last_push >= ai_engine.PARTIAL_PREVIEW_INTERVAL:
+            last_push = now
+            on_partial(render_partial_document(parser.fields_so_far(), parser.completed))
+    return "".join(chunks)
+
+
+async def generate_code_async(prompt: str, api_key: str = None, retries=2, timeout: float = None,
+                              on_partial: Callable = None, use_cache=True, enhance=False) -> GenerationResult:
+    """Async generate_code_from_prompt.
+
+    timeout bounds the whole call including retries; when it passes, or the task
+    is cancelled, the in-flight provider request is cancelled with it. Cancelling
+    the task returns a CANCELLED result instead of raising. A request identical to
+    one already running attaches to it instead of calling the provider again.
+    With enhance, the prompt is expanded by the generation request itself and the
+    expansion comes back as result.app.refined_prompt.
+    """
+    started = time.monotonic()
+    enhance = enhance and needs_enhancement(prompt)
+    # Identical concurrent requests share one generation; only its first caller gets partial previews
+    key = ("generate", generation_cache_key(prompt, api_key, enhance))
+    try:
+        result = await asyncio.wait_for(
+            ai_engine.in_flight.ado(key, lambda: _generate(prompt, api_key, retries, on_partial, use_cache, enhance)),
+            timeout)
+    except asyncio.TimeoutError:
+        set_ai_status("error", f"AI request timed out after {timeout}s.", DONE)
+        result = GenerationResult(TIMEOUT, UNAVAILABLE_HTML, error=f"Timed out after {timeout}s.")
+    except asyncio.CancelledError:
+        set_ai_status("online", "Generation cancelled.", DONE)
+        result = GenerationResult(CANCELLED, error="Cancelled.")
+    # Coalesced callers share the result object; each gets its own copy with its own elapsed time
+    result = dataclasses.replace(result, elapsed=round(time.monotonic() - started, 3))
+    return result
+
+
+async def optimize_prompt_async(prompt: str, api_key: str = None, timeout: float = None) -> str:
+    """Async optimize_prompt; falls back to rule_based_enhancement on failure or timeout"""
+    final_prompt, use_ai = plan_enhancement(prompt)
+    if not use_ai:
+        return final_prompt
+
+    async def refine():
+        request = build_optimize_prompt(prompt)
+        for provider in routable_providers(api_key, operation="optimize"):
+            try:
+                with capture_reported_usage() as reported:
+                    async with _guarded_async_call(provider):
+                        with metrics.timer("optimize", provider.name, provider.model):
+                            enriched = (await provider.agenerate(request, api_key, operation="optimize")).strip()
+                usage_ledger.record_call(provider, "optimize", request, enriched, reported)
+                if enriched:
+                    return enriched
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"optimize_prompt_async failed with {provider.name}: {str(e)}")
+        return rule_based_enhancement(prompt)
+
+    try:
+        return await asyncio.wait_for(refine(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"optimize_prompt_async timed out after {timeout}s")
+        return rule_based_enhancement(prompt)
+
+
+async def generate_variants_async(prompt: str, n=4, api_key: str = None, temperatures=None,
+                                  spread_providers=False, on_variant: Callable = None, timeout: float = None,
+                                  enhance=False) -> list:
+    """Async generate_variants: returns GenerationResult objects in variant order.
+
+    on_variant is called with (index, result) as each variant finishes;
+    cancelling the call cancels every variant still running. With enhance each
+    result's app carries its own refined_prompt.
+    """
+    formatted = build_generation_prompt(prompt, enhance and needs_enhancement(prompt))
+    set_ai_status("generating", f"Generating {n} variants...", REQUEST_STARTED, attempt=1)
+
+    async def run(index, temperature, chain):
+        started = time.monotonic()
+        try:
+            provider, parsed = await _request_in_order_async(formatted, chain, api_key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[AI Error] Variant {index + 1} failed: {str(e)}")
+            result = GenerationResult(FAILED, UNAVAILABLE_HTML, error=str(e))
+        else:
+            app = GeneratedApp.from_parsed(parsed, provider.name, provider.model)
+            result = GenerationResult(OK, app.document(), provider=provider.name, app=app)
+        result.elapsed = round(time.monotonic() - started, 3)
+        result.temperature = temperature
+        if on_variant:
+            on_variant(index, result)
+        return result
+
+    chains = variant_chains(n, api_key, temperatures, spread_providers)
+    tasks = [run(index, temperature, chain) for index, (temperature, chain) in enumerate(chains)]
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+    except asyncio.TimeoutError:
+        set_ai_status("error", f"AI request timed out after {timeout}s.", DONE)
+        return [GenerationResult(TIMEOUT, UNAVAILABLE_HTML, error=f"Timed out after {timeout}s.") for _ in range(n)]
+    if any(result.ok for result in results):
+        set_ai_status("online", "AI service is online.", DONE)
+    else:
+        set_ai_status("offline", "All attempts to use AI failed.", DONE)
+    return results
+
+
+async def _bounded(coro, timeout: float = None, activity: str = "Generation") -> GenerationResult:
+    """Await coro under timeout; a timeout or cancellation comes back as a TIMEOUT or CANCELLED result"""
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        set_ai_status("error", f"AI request timed out after {timeout}s.", DONE)
+        result = GenerationResult(TIMEOUT, error=f"Timed out after {timeout}s.")
+    except asyncio.CancelledError:
+        set_ai_status("online", f"{activity} cancelled.", DONE)
+        result = GenerationResult(CANCELLED, error="Cancelled.")
+    return dataclasses.replace(result, elapsed=round(time.monotonic() - started, 3))
+
+
+async def update_code_async(current_code: str, instruction: str, api_key: str = None, retries=2,
+                            timeout: float = None, on_partial: Callable = None) -> GenerationResult:
+    """Async update_code_from_prompt; timeout and cancellation behave as in generate_code_async.
+
+    A timed-out or cancelled update has no code, so callers keep the current one.
+    """
+    return await _bounded(_update(current_code, instruction, api_key, retries, on_partial), timeout, "Update")
+
+
+async def _update(current_code: str, instruction: str, api_key: str, retries: int,
+                  on_partial: Callable) -> GenerationResult:
+    if not current_code or not current_code.strip():
+        return await _generate(instruction, api_key, retries, on_partial, True)
+
+    job = UpdateJob(current_code, instruction)
+    patched = await run_job_async(job, api_key, retries)
+    if patched is not None:
+        return GenerationResult(OK, patched, provider=job.provider.name)
+    return await _generate(job.regenerate_prompt(), api_key, retries, on_partial, False)
+
+
+async def regenerate_region_async(code: str, start: int, end: int, instruction: str, api_key: str = None,
+                                  retries=2, context_lines=REGION_CONTEXT_LINES,
+                                  timeout: float = None) -> GenerationResult:
+    """Async regenerate_region; a failed result still carries the original code"""
+    return await _bounded(_regenerate_region(code, start, end, instruction, api_key, retries, context_lines),
+                          timeout, "Region update")
+
+
+async def _regenerate_region(code: str, start: int, end: int, instruction: str, api_key: str, retries: int,
+                             context_lines: int) -> GenerationResult:
+    job = RegionJob(code, start, end, instruction, context_lines)
+    updated = await run_job_async(job, api_key, retries)
+    if updated is None:
+        return GenerationResult(FAILED, code, error=job.last_error)
+    return GenerationResult(OK, updated, provider=job.provider.name)
+
+
+async def regenerate_target_async(code: str, target: str, instruction: str, api_key: str = None, retries=2,
+                                  timeout: float = None) -> GenerationResult:
+    """Async regenerate_target"""
+    span = resolve_region(code, target)
+    if span is None:
+        raise ValueError(f"Could not find '{target}' in the current code.")
+    return await regenerate_region_async(code, span[0], span[1], instruction, api_key, retries, timeout=timeout)
+
+
+class _LoopThread:
+    """One daemon thread running the event loop shared by every async AI request"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="karbon-ai-loop", daemon=True).start()
+            return self._loop
+
+
+_loop_thread = _LoopThread()
+
+
+def submit(coro):
+    """Schedule coro on the shared AI event loop; returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _loop_thread.get())
+
+
+class AsyncTask:
+    """Handle to a submitted request; cancel() stops it and frees its provider connection"""
+
+    def __init__(self, future):
+        self._future = future
+
+    def cancel(self) -> bool:
+        return self._future.cancel()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+
+class TkAsyncBridge:
+    """Runs coroutines on the shared loop and hands their results to callbacks on the Tk thread.
+
+    The loop thread only queues callbacks; a poll the bridge schedules on the
+    Tk thread with after() runs them, since Tk must not be called from other
+    threads. Create the bridge on the Tk thread.
+    """
+
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, widget):
+        self.widget = widget
+        self._callbacks = queue.Queue()
+        self._poll()
+
+    def _poll(self):
+        while True:
+            try:
+                callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        try:
+            self.widget.after(self.POLL_INTERVAL_MS, self._poll)
+        except tk.TclError:
+            # The widget is gone; later results have nowhere to go
+            pass
+
+    def submit(self, coro, on_done: Callable = None, on_error: Callable = None) -> AsyncTask:
+        future = submit(coro)
+
+        def finished(done_future):
+            if done_future.cancelled():
+                return
+            error = done_future.exception()
+            if error is not None:
+                if on_error:
+                    self.call_soon(on_error, error)
+                return
+            if on_done:
+                self.call_soon(on_done, done_future.result())
+
+        future.add_done_callback(finished)
+        return AsyncTask(future)
+
+    def call_soon(self, callback: Callable, *args):
+        """Thread-safe way to run callback on the Tk thread, e.g. for on_partial previews"""
+        self._callbacks.put((callback, args))
@@ -0,0 +1,206 @@
+"""
+Headless batch generation for Karbon.
+
+Reads one prompt per line from a file (or stdin with "-") and generates each
+one on a bounded thread pool, writing every result to its own directory plus a
+summary.jsonl with latency and status per prompt. Each run replaces the
+summary left by the previous one.
+
+Usage:
+    python main.py batch prompts.txt --out batch_output --workers 4 --limit gemini=2
+    python main.py batch prompts.txt --record cassettes/run.json
+    python main.py batch prompts.txt --replay cassettes/run.json --replay-latency zero
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List
+
+from core import ai_engine
+from core.cassettes import ORIGINAL, ZERO, open_cassette
+from core.log_setup import configure_logging
+from core.metrics import metrics
+from core.providers import configure_providers, set_concurrency_limit
+from core.resilience import configure_resilience
+from core.usage import ledger as usage_ledger
+
+
+def read_prompts(source) -> List[str]:
+    """Non-empty lines of source, skipping "#" comments"""
+    prompts = []
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            prompts.append(line)
+    return prompts
+
+
+def slugify(text: str, max_length: int = 40) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+    return slug[:max_length].rstrip("-") or "prompt"
+
+
+def load_settings(path: str) -> Dict:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error reading {path} ({e}), using default settings.")
+        return {}
+
+
+def generate_one(index: int, prompt: str, out_dir: str, api_key: str = None, retries: int = 2,
+                 use_cache: bool = True) -> Dict:
+    """Generate a single prompt and write it to out_dir/<index>-<slug>/index.html"""
+    started = time.monotonic()
+    record = {"index": index, "prompt": prompt, "started_at": datetime.now().isoformat()}
+    try:
+        app = ai_engine.generate_app(prompt, api_key, retries=retries, use_cache=use_cache)
+        code = app.document()
+        status = "failed" if code == ai_engine.UNAVAILABLE_HTML else "ok"
+        target_dir = os.path.join(out_dir, f"{index:04d}-{slugify(prompt)}")
+        os.makedirs(target_dir, exist_ok=True)
+        output_path = os.path.join(target_dir, "index.html")
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(code)
+        record.update(status=status, output=output_path, chars=len(code), provider=app.provider,
+                      timings=app.timings)
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["latency"] = round(time.monotonic() - started, 3)
+    return record
+
+
+def run_batch(prompts: List[str], out_dir: str, workers: int = 4, api_key: str = None, retries: int = 2,
+              use_cache: bool = True, on_result=None) -> List[Dict]:
+    """Generate every prompt on a pool of workers; out_dir/summary.jsonl is rewritten with one line per result
+    as they finish"""
+    os.makedirs(out_dir, exist_ok=True)
+    summary_path = os.path.join(out_dir, "summary.jsonl")
+    summary_lock = threading.Lock()
+    results = []
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool, \
+            open(summary_path, "w", encoding="utf-8") as summary:
+        futures = [
+            pool.submit(generate_one, index, prompt, out_dir, api_key, retries, use_cache)
+            for index, prompt in enumerate(prompts, start=1)
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            with summary_lock:
+                summary.write(json.dumps(record, ensure_ascii=False) + "\n")
+                summary.flush()
+            results.append(record)
+            if on_result:
+                on_result(record)
+
+    results.sort(key=lambda record: record["index"])
+    return results
+
+
+def parse_limits(values: List[str]) -> Dict[str, int]:
+    limits = {}
+    for value in values or []:
+        name, _, limit = value.partition("=")
+        if not name or not limit.isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid provider limit '{value}', expected NAME=N")
+        limits[name] = int(limit)
+    return limits
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="karbon batch", description="Generate many prompts without the UI.")
+    parser.add_argument("prompts", help="File with one prompt per line, or - for stdin")
+    parser.add_argument("--out", default="batch_output", help="Output directory (default: batch_output)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent generations (default: 4)")
+    parser.add_argument("--limit", action="append", metavar="PROVIDER=N",
+                        help="Max concurrent requests for one provider, e.g. gemini=2 (repeatable)")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per prompt (default: 2)")
+    parser.add_argument("--settings", default="settings.json", help="Settings file for api_key and providers")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    parser.add_argument("--debug", action="store_true", help="Log full raw AI responses")
+    parser.add_argument("--record", metavar="CASSETTE", help="Record provider responses and timings to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Answer from a recorded cassette instead of the providers")
+    parser.add_argument("--replay-latency", choices=[ORIGINAL, ZERO], default=ORIGINAL,
+                        help="Replay with the recorded latency or none (default: original)")
+    args = parser.parse_args(argv)
+    try:
+        cassette = open_cassette(args.record, args.replay, args.replay_latency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    settings = load_settings(args.settings)
+    logging_settings = dict(settings.get("logging") or {})
+    if args.debug:
+        logging_settings["debug"] = True
+    configure_logging(logging_settings)
+    configure_providers(settings.get("providers"), wrapper=cassette.wrap if cassette else None)
+    ai_engine.response_cache.configure(settings.get("response_cache", {}))
+    ai_engine.configure_hedging(settings.get("hedging", {}))
+    configure_resilience(settings.get("resilience"))
+    usage_ledger.configure(settings.get("usage", {}))
+    # The run's metrics belong with its results, not in ./metrics
+    metrics.configure(export_dir=args.out)
+    for name, limit in parse_limits(args.limit).items():
+        set_concurrency_limit(name, limit)
+
+    if args.prompts == "-":
+        prompts = read_prompts(sys.stdin)
+    else:
+        with open(args.prompts, "r", encoding="utf-8") as f:
+            prompts = read_prompts(f)
+    if not prompts:
+        print("No prompts to generate.")
+        return 1
+
+    print(f"Generating {len(prompts)} prompts with {args.workers} workers into {args.out}")
+
+    def report(record):
+        print(f"[{record['index']:04d}] {record['status']:<6} {record['latency']:>7.2f}s  {record['prompt'][:60]}")
+
+    started = time.monotonic()
+    started_at = time.time()
+    # With a cassette every prompt has to reach the (recording or replaying) provider
+    use_cache = not args.no_cache and cassette is None
+    results = run_batch(prompts, args.out, args.workers, settings.get("api_key") or None, args.retries,
+                        use_cache, on_result=report)
+    succeeded = sum(1 for record in results if record["status"] == "ok")
+    ai_engine.response_cache.flush()
+    metrics.export()
+    latency = metrics.percentiles("total")
+    print(f"Done: {succeeded}/{len(results)} succeeded in {time.monotonic() - started:.2f}s. "
+          f"Summary: {os.path.join(args.out, 'summary.jsonl')}")
+    if latency["count"]:
+        print(f"Generation latency p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, p99 {latency['p99']:.2f}s "
+              f"(per-phase histograms in {os.path.join(args.out, 'metrics.prom')})")
+    for totals in usage_ledger.summary(group_by=(), since=started_at):
+        print(f"Tokens: {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion over "
+              f"{totals['calls']} calls ({totals['estimated_calls']} estimated)"
+              + (f", cost {totals['cost']:.4f}" if totals["cost"] is not None else ""))
+    if cassette is not None:
+        stats = cassette.stats()
+        print(f"Cassette {stats['path']} ({stats['mode']}): {stats['interactions']} interactions, "
+              f"{stats['hits']} replayed, {stats['misses']} missing")
+    return 0 if succeeded == len(results) else 2
+
+
+def exit_if_batch(argv: List[str] = None):
+    """Entry point shared by the launch scripts: "karbon batch ..." runs main() and exits, anything else returns"""
+    argv = sys.argv if argv is None else argv
+    if len(argv) > 1 and argv[1] == "batch":
+        sys.exit(main(argv[2:]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
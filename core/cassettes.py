@@ -0,0 +1,263 @@
+"""
+Record/replay cassettes for AI providers.
+In record mode every provider call is passed through and its request,
+response and timings are appended to a cassette file. In replay mode the
+cassette answers instead of the network, with the original latency or none,
+so the generation pipeline can be benchmarked and regression-tested offline
+and reproducibly.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from core.providers import AIProvider
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Replay latency modes
+ORIGINAL = "original"
+ZERO = "zero"
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMissError(LookupError):
+    """Replay found no recorded interaction for a request"""
+
+
+def interaction_key(provider: AIProvider, operation: str, prompt: str) -> str:
+    """Identity of a request: provider, model, sampling temperature, operation and the exact prompt"""
+    identity = [provider.name, provider.model, provider.options.get("temperature"), operation, prompt]
+    return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Recorded provider interactions stored as one JSON file"""
+
+    def __init__(self, path: str, mode: str = REPLAY, latency: str = ORIGINAL):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if latency not in (ORIGINAL, ZERO):
+            raise ValueError(f"Unknown replay latency: {latency}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._interactions = self._load() if mode == REPLAY or os.path.exists(path) else []
+        # Replay position per key, so repeated identical requests come back in recorded order
+        self._positions = {}
+
+    def wrap(self, provider: AIProvider) -> AIProvider:
+        """provider wrapped for this cassette's mode; pass to configure_providers(wrapper=...)"""
+        if self.mode == RECORD:
+            return RecordingProvider(provider, self)
+        return ReplayProvider(provider, self)
+
+    def record(self, provider: AIProvider, operation: str, prompt: str, response: str, elapsed: float,
+               chunks: List = None):
+        interaction = {
+            "key": interaction_key(provider, operation, prompt),
+            "provider": provider.name,
+            "model": provider.model,
+            "temperature": provider.options.get("temperature"),
+            "operation": operation,
+            "prompt": prompt,
+            "response": response,
+            "elapsed": round(elapsed, 6),
+            # [seconds since the request started, text] per streamed chunk
+            "chunks": chunks,
+            "recorded_at": time.time(),
+        }
+        with self._lock:
+            self._interactions.append(interaction)
+            self._save()
+
+    def lookup(self, provider: AIProvider, operation: str, prompt: str) -> Dict:
+        """Next recorded interaction for this request; the last one repeats once they run out"""
+        key = interaction_key(provider, operation, prompt)
+        with self._lock:
+            matches = [interaction for interaction in self._interactions if interaction["key"] == key]
+            if not matches:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded {operation} response from {provider.name} for this prompt "
+                                        f"in {self.path}.")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.hits += 1
+            return matches[min(position, len(matches) - 1)]
+
+    def provider_settings(self) -> List[Dict]:
+        """"providers" settings entries for the providers and models this cassette was recorded from"""
+        entries = []
+        for interaction in self._interactions:
+            entry = {"name": interaction["provider"], "model": interaction["model"]}
+            if entry not in entries:
+                entries.append(entry)
+        return entries
+
+    def rewind(self):
+        """Start replaying every key from its first recording again"""
+        with self._lock:
+            self._positions.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"path": self.path, "mode": self.mode, "interactions": len(self._interactions),
+                    "hits": self.hits, "misses": self.misses}
+
+    def _load(self) -> List[Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            if self.mode == REPLAY:
+                raise ValueError(f"Cannot read cassette {self.path}: {e}")
+            print(f"Error loading cassette {self.path} ({e}), starting a new one.")
+            return []
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version in {self.path}: {data.get('version')}")
+        return data.get("interactions", [])
+
+    def _save(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CASSETTE_VERSION, "interactions": self._interactions}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            print(f"Error saving cassette: {e}")
+
+
+class RecordingProvider(AIProvider):
+    """Passes calls through to a real provider and records each successful response"""
+
+    def __init__(self, inner: AIProvider, cassette: Cassette):
+        super().__init__(**inner.options)
+        self.inner = inner
+        self.cassette = cassette
+        self.name = inner.name
+        self.model = inner.model
+        self.supports_optimize = inner.supports_optimize
+
+    def is_available(self, api_key: str = None) -> bool:
+        return self.inner.is_available(api_key)
+
+    def generate(self, prompt, api_key=None, operation="generate"):
+        started = time.perf_counter()
+        response = self.inner.generate(prompt, api_key, operation)
+        self.cassette.record(self.inner, operation, prompt, response, time.perf_counter() - started)
+        return response
+
+    def stream(self, prompt, api_key=None, operation="generate"):
+        started = time.perf_counter()
+        chunks = []
+        for chunk in self.inner.stream(prompt, api_key, operation):
+            chunks.append([round(time.perf_counter() - started, 6), chunk])
+            yield chunk
+        self.cassette.record(self.inner, operation, prompt, "".join(text for _, text in chunks),
+                             time.perf_counter() - started, chunks)
+
+    def abort(self, resources=()):
+        self.inner.abort(resources)
+
+    def load_sdk(self):
+        return self.inner.load_sdk()
+
+    def with_options(self, **overrides):
+        return RecordingProvider(self.inner.with_options(**overrides), self.cassette)
+
+    def __repr__(self):
+        return f"<Recording {self.inner!r}>"
+
+
+class ReplayProvider(AIProvider):
+    """Answers from a cassette in place of the provider it was recorded from"""
+
+    # Recorded answers cost nothing; the recording run already accounted for them
+    billable = False
+
+    def __init__(self, inner: AIProvider, cassette: Cassette):
+        super().__init__(**inner.options)
+        self.inner = inner
+        self.cassette = cassette
+        self.name = inner.name
+        self.model = inner.model
+        self.supports_optimize = inner.supports_optimize
+
+    def is_available(self, api_key: str = None) -> bool:
+        # Recorded answers need no key or network
+        return True
+
+    def generate(self, prompt, api_key=None, operation="generate"):
+        interaction = self.cassette.lookup(self.inner, operation, prompt)
+        delay = self._delay(interaction["elapsed"])
+        if delay > 0:
+            time.sleep(delay)
+        return interaction["response"]
+
+    def stream(self, prompt, api_key=None, operation="generate"):
+        interaction = self.cassette.lookup(self.inner, operation, prompt)
+        elapsed = 0.0
+        for offset, text in self._chunks(interaction):
+            delay = self._delay(offset - elapsed)
+            if delay > 0:
+                time.sleep(delay)
+            elapsed = offset
+            yield text
+
+    async def agenerate(self, prompt, api_key=None, operation="generate"):
+        interaction = self.cassette.lookup(self.inner, operation, prompt)
+        delay = self._delay(interaction["elapsed"])
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return interaction["response"]
+
+    async def astream(self, prompt, api_key=None, operation="generate"):
+        interaction = self.cassette.lookup(self.inner, operation, prompt)
+        elapsed = 0.0
+        for offset, text in self._chunks(interaction):
+            delay = self._delay(offset - elapsed)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elapsed = offset
+            yield text
+
+    def with_options(self, **overrides):
+        return ReplayProvider(self.inner.with_options(**overrides), self.cassette)
+
+    def _delay(self, seconds: float) -> float:
+        return 0.0 if self.cassette.latency == ZERO else max(seconds, 0.0)
+
+    @staticmethod
+    def _chunks(interaction: Dict):
+        # Calls recorded with generate() replay as one chunk arriving at the end
+        return interaction.get("chunks") or [[interaction["elapsed"], interaction["response"]]]
+
+    def __repr__(self):
+        return f"<Replay {self.inner!r}>"
+
+
+def open_cassette(record_path: Optional[str] = None, replay_path: Optional[str] = None,
+                  latency: str = ORIGINAL) -> Optional[Cassette]:
+    """Cassette for the --record/--replay command line options, or None when neither is given"""
+    if record_path and replay_path:
+        raise ValueError("Use either record or replay, not both.")
+    if record_path:
+        return Cassette(record_path, RECORD)
+    if replay_path:
+        return Cassette(replay_path, REPLAY, latency)
+    return None
@@ -0,0 +1,179 @@
+"""
+Single-pass scanner that locates JSON object candidates inside free-form model output.
+"""
+
+import json
+import re
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+_STRUCTURE = re.compile(r'["{}]')
+# Remainder of a JSON string after its opening quote (unrolled, so it cannot backtrack badly)
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+def iter_object_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) spans of every balanced top-level {...} block in text.
+
+    Braces inside JSON strings are ignored and prose between blocks is skipped
+    without inspection, so the scan is O(n) and never backtracks. A block that
+    never closes, such as a stray "{" in prose, does not hide what follows it:
+    scanning goes on as if restarted from the next "{" after its start, so the
+    balanced blocks nested in it are yielded at the end.
+    """
+    # Open blocks as [start, balanced blocks closed directly inside it]
+    stack = []
+    search = _STRUCTURE.search
+    skip_string = _STRING_TAIL.match
+    pos = text.find("{")
+    while pos != -1:
+        match = search(text, pos)
+        if match is None:
+            break
+        token = match.group()
+        pos = match.end()
+        if token == '"':
+            string_end = skip_string(text, pos)
+            if string_end is None:
+                break
+            pos = string_end.end()
+        elif token == "{":
+            stack.append([match.start(), []])
+        elif stack:
+            start, _ = stack.pop()
+            if stack:
+                stack[-1][1].append((start, pos))
+            else:
+                yield start, pos
+                pos = text.find("{", pos)
+    # Restarting after an unclosed block's "{" sees the same tokens, so its nested blocks are the next candidates
+    for _, nested in stack:
+        yield from nested
+
+
+def find_json_object(text: str) -> Optional[dict]:
+    """Return the first non-empty top-level {...} block in text that parses as a JSON object"""
+    for start, end in iter_object_spans(text):
+        if end - start <= 2:
+            continue
+        try:
+            value = json.loads(text[start:end])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict) and value:
+            return value
+    return None
+
+
+class PartialObject(dict):
+    """Object salvaged from a truncated or malformed response.
+
+    truncated names the member whose value was cut off and closed early, or is
+    None when every member kept is complete.
+    """
+
+    partial = True
+
+    def __init__(self, value: dict, truncated: Optional[str] = None):
+        super().__init__(value)
+        self.truncated = truncated
+
+
+_REPAIR_STRUCTURE = re.compile(r'["{}\[\],]')
+_CLOSERS = {"{": "}", "[": "]"}
+# Unfinished escape at the end of a cut-off string: an odd run of backslashes, maybe a partial \uXXXX
+_DANGLING_ESCAPE = re.compile(r'(\\+)(u[0-9a-fA-F]{0,3})?$')
+# Cut points tried, newest first, before giving up on a response
+MAX_REPAIR_ATTEMPTS = 4
+
+
+def repair_json_object(text: str) -> Optional[PartialObject]:
+    """Salvage the first JSON object in text when it is cut off or slightly malformed.
+
+    The response is closed where it stops: an open string is terminated and
+    open arrays and objects are closed. If that does not parse, it is cut back
+    to the last complete member instead. Trailing commas and raw control
+    characters inside strings are tolerated. Returns None when not even one
+    member can be recovered.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    # Open containers as a linked list of (bracket, parent) so cut points can share it
+    stack = None
+    # (position, open containers): text[start:position] ends right after a complete value
+    cuts = deque(maxlen=MAX_REPAIR_ATTEMPTS)
+    trailing_commas = []
+    in_string = False
+    search = _REPAIR_STRUCTURE.search
+    skip_string = _STRING_TAIL.match
+    pos = start
+    while True:
+        match = search(text, pos)
+        if match is None:
+            pos = len(text)
+            break
+        token = match.group()
+        pos = match.end()
+        if token == '"':
+            string_end = skip_string(text, pos)
+            if string_end is None:
+                in_string = True
+                pos = len(text)
+                break
+            pos = string_end.end()
+        elif token in _CLOSERS:
+            stack = (token, stack)
+        elif token == ",":
+            if stack is not None:
+                cuts.append((match.start(), stack))
+        else:
+            previous = match.start() - 1
+            while previous > start and text[previous].isspace():
+                previous -= 1
+            if text[previous] == ",":
+                trailing_commas.append(previous)
+            if stack is None:
+                continue
+            stack = stack[1]
+            if stack is None:
+                break
+
+    # Closing everything where the text stops keeps a cut-off last member; cut points drop it
+    candidates = [(pos, stack, True)] + [(cut, open_containers, False) for cut, open_containers in reversed(cuts)]
+    for cut, open_containers, closes_last in candidates:
+        body = _without(text, start, cut, trailing_commas).rstrip()
+        if in_string and closes_last:
+            dangling = _DANGLING_ESCAPE.search(body)
+            if dangling and len(dangling.group(1)) % 2:
+                body = body[:dangling.start()] + dangling.group(1)[:-1]
+            body += '"'
+        body = body.rstrip(",")
+        if closes_last:
+            # Nothing was cut off, or only closing brackets after a finished top-level string or container
+            complete = not in_string and (stack is None or (stack[1] is None and body.endswith(('"', "}", "]"))))
+        else:
+            # Cut back to a top-level comma: every member kept is whole
+            complete = open_containers[1] is None
+        closers = []
+        while open_containers is not None:
+            closers.append(_CLOSERS[open_containers[0]])
+            open_containers = open_containers[1]
+        try:
+            value = json.loads(body + "".join(closers), strict=False)
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        if isinstance(value, dict) and value:
+            return PartialObject(value, None if complete else next(reversed(value)))
+    return None
+
+
+def _without(text: str, start: int, end: int, positions) -> str:
+    """text[start:end] with the characters at positions removed"""
+    parts = []
+    for position in positions:
+        if start <= position < end:
+            parts.append(text[start:position])
+            start = position + 1
+    parts.append(text[start:end])
+    return "".join(parts)
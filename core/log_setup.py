@@ -0,0 +1,98 @@
+"""
+Logging for the AI engine: records are handed to a queue and written by a
+background listener into a size-rotated file, so generation threads never
+block on disk. Raw model payloads are truncated unless debug logging is on.
+"""
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict
+
+# Parent logger of every core.* module logger
+LOGGER_NAME = "core"
+
+DEFAULT_LOGGING_SETTINGS = {
+    "file": "karbon_ai_errors.log",
+    "max_bytes": 1024 * 1024,   # rotate after 1 MB
+    "backup_count": 3,          # keep karbon_ai_errors.log.1 .. .3
+    "payload_chars": 500,       # characters of a raw AI payload kept when debug is off
+    "debug": False              # log full raw payloads at DEBUG level
+}
+
+# Set KARBON_DEBUG=1 to turn on debug logging without editing settings.json
+DEBUG_ENV_VAR = "KARBON_DEBUG"
+
+_settings = dict(DEFAULT_LOGGING_SETTINGS)
+_listener = None
+
+
+def configure_logging(settings: Dict = None):
+    """Apply the "logging" section of settings.json; safe to call again when settings change"""
+    global _listener
+    _settings.clear()
+    _settings.update(DEFAULT_LOGGING_SETTINGS, **(settings or {}))
+    if os.environ.get(DEBUG_ENV_VAR, "").lower() in ("1", "true", "yes"):
+        _settings["debug"] = True
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+    file_handler = RotatingFileHandler(
+        _settings["file"],
+        maxBytes=int(_settings["max_bytes"]),
+        backupCount=int(_settings["backup_count"]),
+        encoding="utf-8",
+        delay=True
+    )
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+    records = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in [h for h in logger.handlers if isinstance(h, QueueHandler)]:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(records))
+    logger.setLevel(logging.DEBUG if _settings["debug"] else logging.INFO)
+    logger.propagate = False
+
+    _listener = QueueListener(records, file_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records to disk, stop the listener thread and detach the queue handler"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in [h for h in logger.handlers if isinstance(h, QueueHandler)]:
+        logger.removeHandler(handler)
+    logger.propagate = True
+    _settings.clear()
+    _settings.update(DEFAULT_LOGGING_SETTINGS)
+
+
+atexit.register(shutdown_logging)
+
+
+def log_payload(logger: logging.Logger, label: str, payload):
+    """Log a raw AI payload: in full at DEBUG when debug is on, otherwise a truncated preview at INFO"""
+    text = str(payload)
+    if _settings["debug"]:
+        logger.debug("%s (%d chars): %s", label, len(text), text)
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    limit = int(_settings["payload_chars"])
+    if len(text) > limit:
+        logger.info("%s (%d chars, truncated): %s...", label, len(text), text[:limit])
+    else:
+        logger.info("%s: %s", label, text)
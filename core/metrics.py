@@ -0,0 +1,181 @@
+"""
+Latency histograms for the phases of the generation pipeline.
+Every observation is labelled with the phase ("optimize", "queue_wait",
+"network", "first_chunk", "extract_json", "inline", "total"), provider and
+model. Snapshots are exported as a Prometheus text file and a JSON file, and
+percentiles are available to the UI through percentiles().
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+# Upper bounds in seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Recent samples kept per series for exact percentiles
+SAMPLE_WINDOW = 1024
+
+DEFAULT_EXPORT_DIR = "metrics"
+# Minimum seconds between automatic exports
+EXPORT_INTERVAL = 5.0
+
+
+class Histogram:
+    """Cumulative bucket counts for export plus a sliding sample window for percentiles"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=SAMPLE_WINDOW):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile (q in 0..100) of the recent samples"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+        return ordered[min(rank, len(ordered) - 1)]
+
+
+class MetricsRegistry:
+    """Thread-safe set of histograms keyed by (phase, provider, model)"""
+
+    def __init__(self, export_dir: str = DEFAULT_EXPORT_DIR, export_interval: float = EXPORT_INTERVAL):
+        self.export_dir = export_dir
+        self.export_interval = export_interval
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+
+    def configure(self, export_dir: str = None, export_interval: float = None):
+        with self._lock:
+            if export_dir:
+                self.export_dir = export_dir
+            if export_interval is not None:
+                self.export_interval = float(export_interval)
+
+    def observe(self, phase: str, seconds: float, provider: str = "none", model: str = "none"):
+        key = (phase, provider or "none", model or "none")
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, phase: str, provider: str = "none", model: str = "none", into: Dict = None):
+        """Time the body; failed phases are recorded too since slow failures matter as much.
+        into, when given, also receives the duration under phase for per-request reporting."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(phase, elapsed, provider, model)
+            if into is not None:
+                into[phase] = round(elapsed, 6)
+
+    def percentiles(self, phase: str = None, provider: str = None, model: str = None,
+                    quantiles: Iterable[float] = (50, 95, 99)) -> Dict:
+        """{"p50": s, "p95": s, "p99": s, "count": n} over every series matching the given labels"""
+        with self._lock:
+            samples = []
+            count = 0
+            for (series_phase, series_provider, series_model), histogram in self._histograms.items():
+                if phase not in (None, series_phase) or provider not in (None, series_provider) or \
+                        model not in (None, series_model):
+                    continue
+                samples.extend(histogram.samples)
+                count += histogram.count
+        merged = Histogram(window=max(len(samples), 1))
+        for sample in samples:
+            merged.observe(sample)
+        result = {f"p{q:g}": merged.percentile(q) for q in quantiles}
+        result["count"] = count
+        return result
+
+    def snapshot(self) -> Dict:
+        """JSON-friendly view of every series"""
+        with self._lock:
+            series = []
+            for (phase, provider, model), histogram in sorted(self._histograms.items()):
+                series.append({
+                    "phase": phase,
+                    "provider": provider,
+                    "model": model,
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99),
+                    "buckets": dict(zip([str(bound) for bound in histogram.buckets] + ["+Inf"], histogram.counts)),
+                })
+        return {"generated_at": time.time(), "series": series}
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition format (histogram type)"""
+        name = "karbon_generation_phase_seconds"
+        lines = [
+            f"# HELP {name} Latency of each generation pipeline phase.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for (phase, provider, model), histogram in sorted(self._histograms.items()):
+                labels = f'phase="{_escape(phase)}",provider="{_escape(provider)}",model="{_escape(model)}"'
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, export_dir: str = None):
+        """Write metrics.prom and metrics.json into export_dir (default: the configured directory)"""
+        target = export_dir or self.export_dir
+        try:
+            os.makedirs(target, exist_ok=True)
+            _write_atomic(os.path.join(target, "metrics.prom"), self.prometheus_text())
+            _write_atomic(os.path.join(target, "metrics.json"), json.dumps(self.snapshot(), indent=2))
+        except IOError as e:
+            print(f"Error exporting metrics: {e}")
+        self._last_export = time.monotonic()
+
+    def maybe_export(self):
+        """Export unless the last export was less than export_interval seconds ago"""
+        if time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,39 @@
+"""
+Search/replace edit lists for incremental code updates.
+The model answers an update request with small hunks instead of a whole new
+document; they are applied locally and rejected on any conflict.
+"""
+
+from typing import Dict, List
+
+
+class PatchConflictError(ValueError):
+    """Raised when an edit cannot be applied unambiguously to the current code"""
+
+
+def apply_edits(code: str, edits: List[Dict]) -> str:
+    """Apply search/replace hunks in order and return the patched code.
+
+    Each edit is {"search": "exact existing text", "replace": "new text"}. The
+    search text must occur exactly once in the code as it stands after the
+    previous edits; anything else is a conflict and nothing is applied.
+    """
+    if not isinstance(edits, list) or not edits:
+        raise PatchConflictError("Edit list is empty.")
+
+    patched = code
+    for number, edit in enumerate(edits, start=1):
+        if not isinstance(edit, dict) or "search" not in edit or "replace" not in edit:
+            raise PatchConflictError(f"Edit {number} is missing 'search' or 'replace'.")
+        search = str(edit["search"])
+        replace = str(edit["replace"])
+        if not search:
+            raise PatchConflictError(f"Edit {number} has an empty search block.")
+
+        index = patched.find(search)
+        if index == -1:
+            raise PatchConflictError(f"Edit {number}: search text not found in current code.")
+        if patched.find(search, index + 1) != -1:
+            raise PatchConflictError(f"Edit {number}: search text matches more than once.")
+        patched = patched[:index] + replace + patched[index + len(search):]
+    return patched
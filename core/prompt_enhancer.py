@@ -0,0 +1,214 @@
+"""
+Offline prompt enhancement.
+Short prompts are matched against a small library of component templates
+(auth forms, pricing tables, portfolios, ...) by keyword and expanded into a
+detailed spec without any network call. Prompts no template recognizes are
+left to the caller, which may fall back to AI enhancement.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Combined keyword weight a template needs before it is trusted with a prompt
+MIN_SCORE = 1.0
+
+# Weaker intents merged into the main one as extra sections, e.g. "landing page with pricing"
+MAX_SECTIONS = 1
+
+GUIDELINES = ("Use semantic HTML5 structure.", "Apply responsive CSS (mobile-first).",
+              "Include clean modular JavaScript with comments.")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class ComponentTemplate:
+    name: str
+    title: str
+    # {keyword or two-word phrase: weight}; plurals are folded on both sides before matching
+    keywords: Dict[str, float]
+    components: Tuple[str, ...]
+    style: str
+    interactivity: str
+    # Whether it can be merged into another page as a section rather than being a page of its own
+    section: bool = False
+
+
+TEMPLATES = (
+    ComponentTemplate(
+        "signup", "sign-up form",
+        {"signup": 1.5, "sign up": 1.5, "register": 1.5, "registration": 1.5, "create account": 1.5,
+         "onboarding": 1.0, "form": 0.3, "account": 0.5},
+        ("Centered card with the app name and a short welcome line",
+         "Name, email, password and confirm-password fields with visible labels",
+         "Terms of service checkbox",
+         "Primary \"Create account\" button and a \"Already have an account? Log in\" link"),
+        "Clean, minimal card on a soft background with clear focus outlines",
+        "Inline validation for email format, password strength meter and matching passwords; "
+        "disable the submit button until the form is valid"),
+    ComponentTemplate(
+        "login", "login form",
+        {"login": 1.5, "log in": 1.5, "signin": 1.5, "sign in": 1.5, "auth": 1.2, "authentication": 1.2,
+         "password": 0.8, "form": 0.3, "account": 0.5},
+        ("Centered card with the app logo or name",
+         "Email and password fields with visible labels",
+         "\"Remember me\" checkbox and a \"Forgot password?\" link",
+         "Primary \"Log in\" button and a \"Create an account\" link",
+         "Optional social sign-in buttons separated by an \"or\" divider"),
+        "Clean, minimal card on a soft background with clear focus outlines",
+        "Show/hide password toggle, inline validation messages and a loading state on submit"),
+    ComponentTemplate(
+        "pricing", "pricing table",
+        {"pricing": 1.5, "price": 1.2, "plan": 1.0, "subscription": 1.0, "tier": 1.0, "billing": 0.8},
+        ("Section heading with a one-line value proposition",
+         "Three plan cards (e.g. Basic, Pro, Enterprise) with price, billing period and feature list",
+         "Highlighted \"Most popular\" middle plan",
+         "Call-to-action button on every card",
+         "Short FAQ below the plans"),
+        "Cards with equal heights, generous spacing and an accent color for the featured plan",
+        "Monthly/yearly billing toggle that updates all prices and shows the yearly saving", section=True),
+    ComponentTemplate(
+        "portfolio", "portfolio",
+        {"portfolio": 1.5, "showcase": 1.0, "resume": 1.2, "cv": 1.2, "personal": 0.6, "project": 0.6,
+         "photographer": 1.0, "designer": 0.8, "developer": 0.6},
+        ("Hero with name, role and a short introduction",
+         "Projects grid with image, title, short description and tags per project",
+         "About section with skills",
+         "Contact section with email and social links",
+         "Sticky navigation linking to each section"),
+        "Modern, airy layout with large imagery and a restrained two-color palette",
+        "Filter projects by tag, smooth scrolling between sections and a lightbox for project images"),
+    ComponentTemplate(
+        "dashboard", "admin dashboard",
+        {"dashboard": 1.5, "admin": 1.2, "analytics": 1.2, "metric": 0.8, "kpi": 1.0, "report": 0.6,
+         "chart": 0.8, "panel": 0.5},
+        ("Collapsible sidebar navigation and a top bar with search and user menu",
+         "Row of KPI cards with value and change versus last period",
+         "Line chart and bar chart drawn with canvas or SVG",
+         "Recent activity table with status badges"),
+        "Neutral background, card-based grid and consistent status colors",
+        "Sidebar toggle, sortable table columns and a date range selector that refreshes the sample data"),
+    ComponentTemplate(
+        "todo", "todo app",
+        {"todo": 1.5, "to do": 1.5, "task": 1.0, "checklist": 1.2, "reminder": 0.8},
+        ("Input with an \"Add\" button for new tasks",
+         "Task list with checkbox, title and delete button per task",
+         "Filters for all, active and completed tasks",
+         "Counter of remaining tasks and a \"Clear completed\" button"),
+        "Focused single-column layout with clear completed-task styling",
+        "Add on Enter, toggle, edit on double-click, delete, and persist tasks in localStorage"),
+    ComponentTemplate(
+        "shop", "online store",
+        {"shop": 1.5, "store": 1.2, "ecommerce": 1.5, "product": 1.0, "cart": 1.2, "checkout": 1.2},
+        ("Header with logo, search and cart icon with item count",
+         "Product grid with image, name, price and \"Add to cart\" button",
+         "Category filter and sort by price",
+         "Slide-out cart with quantities and total"),
+        "Bright product cards on a white background with a strong accent for buttons",
+        "Add to cart, change quantities, remove items and keep the cart total up to date"),
+    ComponentTemplate(
+        "blog", "blog",
+        {"blog": 1.5, "article": 1.0, "post": 0.8, "journal": 0.8, "magazine": 1.0},
+        ("Header with site title and navigation",
+         "Featured post hero",
+         "List of post cards with cover image, title, date, excerpt and tags",
+         "Sidebar with categories and a newsletter signup"),
+        "Readable typography with a comfortable line length",
+        "Filter posts by tag and a client-side search box"),
+    ComponentTemplate(
+        "contact", "contact page",
+        {"contact": 1.5, "feedback": 0.8, "inquiry": 1.0, "enquiry": 1.0, "support": 0.6, "form": 0.3},
+        ("Contact form with name, email, subject and message",
+         "Contact details with address, phone and email",
+         "Embedded map placeholder and opening hours"),
+        "Two-column layout that stacks on mobile",
+        "Validate required fields and show a success message without reloading the page", section=True),
+    ComponentTemplate(
+        "restaurant", "restaurant site",
+        {"restaurant": 1.5, "cafe": 1.5, "coffee": 1.0, "coffee shop": 1.5, "menu": 1.0, "bakery": 1.2,
+         "bar": 0.8, "food": 0.8},
+        ("Hero with a photo, name and \"Reserve a table\" button",
+         "Menu grouped by category with dish names, descriptions and prices",
+         "Opening hours and location",
+         "Reservation form with date, time and party size"),
+        "Warm color palette with elegant headings",
+        "Menu category tabs and reservation form validation"),
+    ComponentTemplate(
+        "gallery", "image gallery",
+        {"gallery": 1.5, "photo": 1.0, "image": 0.8, "album": 1.0, "masonry": 1.2},
+        ("Responsive masonry or grid layout of images with captions",
+         "Category filter buttons",
+         "Lightbox viewer"),
+        "Dark background that makes the images stand out",
+        "Open images in the lightbox with keyboard navigation and lazy-load offscreen images", section=True),
+    ComponentTemplate(
+        "landing", "landing page",
+        {"landing": 1.5, "homepage": 1.0, "website": 1.0, "webpage": 1.0, "startup": 1.0, "saas": 1.0,
+         "marketing": 0.8, "product page": 1.0},
+        ("Navigation bar with logo and links",
+         "Hero with headline, subheading and primary call-to-action",
+         "Feature highlights in a three-column grid",
+         "Testimonials",
+         "Final call-to-action banner and footer with links"),
+        "Bold hero, consistent color palette and plenty of whitespace",
+        "Smooth scrolling navigation, mobile menu toggle and subtle reveal-on-scroll animations"),
+)
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _build_index(templates) -> Dict[str, List[Tuple[int, float]]]:
+    index = {}
+    for position, template in enumerate(templates):
+        for keyword, weight in template.keywords.items():
+            term = " ".join(_singular(word) for word in keyword.split())
+            index.setdefault(term, []).append((position, weight))
+    return index
+
+
+_INDEX = _build_index(TEMPLATES)
+
+
+def _terms(prompt: str) -> set:
+    """Words and adjacent word pairs of the prompt, plural-folded"""
+    words = [_singular(word) for word in _WORD.findall(prompt.lower())]
+    terms = set(words)
+    terms.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    # "sign-up", "log-in" and "e-commerce" tokenize apart; also try them joined
+    terms.update(f"{first}{second}" for first, second in zip(words, words[1:]))
+    return terms
+
+
+def classify(prompt: str) -> List[Tuple[ComponentTemplate, float]]:
+    """Templates matching prompt with their keyword score, best first; empty when nothing is recognized"""
+    scores = {}
+    for term in _terms(prompt):
+        for position, weight in _INDEX.get(term, ()):
+            scores[position] = scores.get(position, 0.0) + weight
+    # Ties go to the template listed first, which is the more specific one
+    ranked = sorted((-score, position) for position, score in scores.items() if score >= MIN_SCORE)
+    return [(TEMPLATES[position], -score) for score, position in ranked]
+
+
+def enhance(prompt: str) -> Optional[str]:
+    """Detailed spec for prompt built from the matching templates, or None if no template recognizes it"""
+    matches = classify(prompt)
+    if not matches:
+        return None
+    # A page-type match hosts any section-type ones, whichever scored higher
+    pages = [template for template, _ in matches if not template.section]
+    primary = pages[0] if pages else matches[0][0]
+    sections = [template for template, _ in matches if template.section and template is not primary][:MAX_SECTIONS]
+    lines = [f"{prompt.strip().rstrip('.')}.", "", f"Build a {primary.title} with:"]
+    lines += [f"- {component}" for component in primary.components]
+    for template in sections:
+        lines.append(f"Also include a {template.title} section with:")
+        lines += [f"- {component}" for component in template.components]
+    lines += ["", f"Styling: {primary.style}.", f"Interactivity: {primary.interactivity}."]
+    lines += GUIDELINES
+    return "\n".join(lines)
@@ -0,0 +1,208 @@
+"""
+Local similarity index over previously generated prompts.
+Prompts are compared by TF-IDF cosine over content words, so rewordings such as
+"create a login page" and "make a login page please" map to the same cached
+result without another AI call. Everything runs offline; an inverted index
+keeps lookups to the prompts that share at least one word with the query.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.85
+
+# Filler and request verbs that do not change what gets built
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "with", "that", "this", "it", "is", "be",
+    "me", "my", "i", "we", "you", "your", "please", "pls", "can", "could", "would", "should", "want", "need",
+    "make", "create", "build", "generate", "design", "write", "give", "show", "some", "simple", "just", "like",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(prompt: str) -> List[str]:
+    """Content words of prompt, lower-cased with a naive plural strip"""
+    tokens = []
+    for word in TOKEN_PATTERN.findall(prompt.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class SimilarMatch(NamedTuple):
+    prompt: str
+    key: str
+    score: float
+    latency_ms: float
+
+
+class SimilarPromptIndex:
+    """Persistent TF-IDF index mapping past prompts to response cache keys"""
+
+    INDEX_FILE = "similar_prompts.json"
+
+    def __init__(self, cache_dir: str, threshold: float = DEFAULT_SIMILARITY_THRESHOLD, enabled=True,
+                 auto_serve=False):
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.enabled = enabled
+        # Serve matches straight from generate_code_from_prompt instead of only offering them
+        self.auto_serve = auto_serve
+        self.lookups = 0
+        self.matches = 0
+        self.total_latency_ms = 0.0
+        self._lock = threading.Lock()
+        self._entries = None
+        self._postings = {}
+        self._document_frequency = Counter()
+
+    def configure(self, settings: Dict, cache_dir: str = None):
+        """Apply the "similarity" part of the response_cache settings"""
+        with self._lock:
+            self.enabled = bool(settings.get("enabled", self.enabled))
+            self.threshold = float(settings.get("threshold", self.threshold))
+            self.auto_serve = bool(settings.get("auto_serve", self.auto_serve))
+            if cache_dir and cache_dir != self.cache_dir:
+                self.cache_dir = cache_dir
+                self._entries = None
+
+    def add(self, prompt: str, key: str, context: str = ""):
+        """Remember that prompt maps to the cache entry key under context (provider/model/template).
+        Several prompts may point at the same key."""
+        if not self.enabled:
+            return
+        tokens = tokenize(prompt)
+        if not tokens:
+            return
+        with self._lock:
+            entries = self._load()
+            entry_id = next((i for i, entry in entries.items()
+                             if entry["key"] == key and entry["prompt"] == prompt), None)
+            if entry_id is not None:
+                self._unindex(entry_id)
+            else:
+                entry_id = str(max((int(i) for i in entries), default=-1) + 1)
+            entries[entry_id] = {"prompt": prompt, "key": key, "context": context,
+                                 "terms": dict(Counter(tokens)), "created": time.time()}
+            self._index(entry_id)
+            self._save()
+
+    def find(self, prompt: str, context: str = "", exclude_key: str = None) -> Optional[SimilarMatch]:
+        """Best match for prompt at or above the threshold, or None; entries for exclude_key are skipped"""
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        with self._lock:
+            entries = self._load()
+            query = Counter(tokenize(prompt))
+            best_id, best_score = None, 0.0
+            if query and entries:
+                weights = {term: count * self._idf(term, len(entries)) for term, count in query.items()}
+                query_norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+                candidates = set()
+                for term in query:
+                    candidates.update(self._postings.get(term, ()))
+                for entry_id in candidates:
+                    entry = entries[entry_id]
+                    if entry["context"] != context or entry["key"] == exclude_key:
+                        continue
+                    score = self._cosine(weights, query_norm, entry["terms"], len(entries))
+                    if score > best_score:
+                        best_id, best_score = entry_id, score
+            latency_ms = (time.perf_counter() - started) * 1000
+            self.lookups += 1
+            self.total_latency_ms += latency_ms
+            if best_id is None or best_score < self.threshold:
+                return None
+            self.matches += 1
+            entry = entries[best_id]
+            return SimilarMatch(entry["prompt"], entry["key"], round(best_score, 4), round(latency_ms, 3))
+
+    def discard(self, *keys: str):
+        """Forget entries whose cached result no longer exists"""
+        with self._lock:
+            entries = self._load()
+            for entry_id in [i for i, entry in entries.items() if entry["key"] in keys]:
+                self._unindex(entry_id)
+                del entries[entry_id]
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._postings = {}
+            self._document_frequency = Counter()
+            self.lookups = self.matches = 0
+            self.total_latency_ms = 0.0
+            self._save()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._load()),
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "avg_latency_ms": round(self.total_latency_ms / self.lookups, 3) if self.lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+    def _idf(self, term: str, documents: int) -> float:
+        # Smoothed so terms unseen in the index still carry weight
+        return math.log((1 + documents) / (1 + self._document_frequency.get(term, 0))) + 1
+
+    def _cosine(self, weights: Dict, query_norm: float, terms: Dict, documents: int) -> float:
+        entry_weights = {term: count * self._idf(term, documents) for term, count in terms.items()}
+        entry_norm = math.sqrt(sum(weight * weight for weight in entry_weights.values()))
+        if not query_norm or not entry_norm:
+            return 0.0
+        dot = sum(weight * entry_weights.get(term, 0.0) for term, weight in weights.items())
+        return dot / (query_norm * entry_norm)
+
+    def _index(self, entry_id: str):
+        for term in self._entries[entry_id]["terms"]:
+            self._postings.setdefault(term, set()).add(entry_id)
+            self._document_frequency[term] += 1
+
+    def _unindex(self, entry_id: str):
+        for term in self._entries[entry_id]["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(entry_id)
+            self._document_frequency[term] -= 1
+
+    def _load(self) -> Dict:
+        if self._entries is None:
+            path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            self._entries = {}
+            self._postings = {}
+            self._document_frequency = Counter()
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"Error loading similar prompt index: {e}")
+            for entry_id in self._entries:
+                self._index(entry_id)
+        return self._entries
+
+    def _save(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, path)
+        except IOError as e:
+            print(f"Error saving similar prompt index: {e}")
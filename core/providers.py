@@ -0,0 +1,541 @@
+"""
+AI provider interface and registry for Karbon.
+Backends register themselves by name and are instantiated, ordered and
+configured from the "providers" section of settings.json.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import importlib
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from core.usage import report_usage
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_CLASSES = {}
+
+DEFAULT_PROVIDER_SETTINGS = [
+    {"name": "gemini", "enabled": True, "model": "gemini-2.5-flash", "structured_output": True},
+    {"name": "meta_ai", "enabled": True},
+    {"name": "local", "enabled": False, "latency": 0.0},
+]
+
+
+class ClientPool:
+    """Keeps configured SDK clients warm across calls, keyed by (provider, credential, model).
+
+    get() shares one client between callers; checkout()/checkin() lend idle
+    clients out one call at a time, for SDKs whose clients keep per-call state.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+            return client
+
+    def checkout(self, key, factory):
+        """An idle client for key, or a new one from factory; hand it back with checkin() when the call succeeds"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        return factory()
+
+    def checkin(self, key, client):
+        with self._lock:
+            self._idle.setdefault(key, []).append(client)
+
+    def invalidate(self, provider_name: str = None):
+        """Drop pooled clients for provider_name, or every client when None"""
+        with self._lock:
+            for clients in (self._clients, self._idle):
+                for key in list(clients):
+                    if provider_name is None or key[0] == provider_name:
+                        del clients[key]
+
+    def __len__(self):
+        return len(self._clients) + sum(len(idle) for idle in self._idle.values())
+
+
+client_pool = ClientPool()
+
+
+# Resources held by the provider call running in this context, see track_call_resource
+_call_resources = contextvars.ContextVar("call_resources", default=None)
+
+
+def track_call_resource(resource):
+    """Register something the current generate()/stream() call holds, so abort() can release
+    exactly that call's resources and leave concurrent calls to the same provider alone"""
+    resources = _call_resources.get()
+    if resources is not None:
+        resources.append(resource)
+
+
+# Optional per-provider caps on simultaneous requests, see set_concurrency_limit
+_concurrency_limits = {}
+_concurrency_lock = threading.Lock()
+
+
+def set_concurrency_limit(provider_name: str, limit: int = None):
+    """Allow at most limit in-flight requests to provider_name (None removes the cap)"""
+    with _concurrency_lock:
+        if limit:
+            _concurrency_limits[provider_name] = threading.BoundedSemaphore(int(limit))
+        else:
+            _concurrency_limits.pop(provider_name, None)
+
+
+@contextmanager
+def concurrency_slot(provider_name: str):
+    """Block until provider_name has a free request slot"""
+    with _concurrency_lock:
+        semaphore = _concurrency_limits.get(provider_name)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def async_concurrency_slot(provider_name: str, poll_interval: float = 0.05):
+    """concurrency_slot for coroutines: waits on the event loop instead of blocking a thread"""
+    with _concurrency_lock:
+        semaphore = _concurrency_limits.get(provider_name)
+    if semaphore is None:
+        yield
+        return
+    while not semaphore.acquire(blocking=False):
+        await asyncio.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _string_fields(*names, required=None) -> Dict:
+    return {
+        "type": "object",
+        "properties": {name: {"type": "string"} for name in names},
+        "required": list(required if required is not None else names),
+    }
+
+
+# JSON shapes the ai_engine prompts ask for, per operation, for providers that can enforce them.
+# "optimize" answers in plain text and has none.
+RESPONSE_SCHEMAS = {
+    # refined_prompt is only asked for when enhancement is folded into the request
+    "generate": _string_fields("html", "css", "js", "name", "refined_prompt", required=("html", "css", "js", "name")),
+    "update": {
+        "type": "object",
+        "properties": {
+            "edits": {"type": "array", "items": _string_fields("search", "replace")},
+            "summary": {"type": "string"},
+        },
+        "required": ["edits"],
+    },
+    "region": _string_fields("fragment"),
+}
+
+
+def _sdk(module_name: str):
+    """Import a provider SDK on first use; afterwards this is a sys.modules lookup"""
+    return importlib.import_module(module_name)
+
+
+def register_provider(cls):
+    """Class decorator that makes a provider available by its name"""
+    PROVIDER_CLASSES[cls.name] = cls
+    return cls
+
+
+class AIProvider:
+    """Base class for text generation backends.
+
+    Subclasses implement generate(); stream() defaults to yielding the whole
+    response as a single chunk. The operation argument ("generate", "optimize",
+    ...) lets backends tailor their output and is ignored by real models.
+    """
+
+    name = "base"
+    default_model = None
+    requires_api_key = False
+    # Whether optimize_prompt may use this backend
+    supports_optimize = True
+    # SDK modules the backend needs; imported on first use instead of at startup
+    sdk_modules = ()
+    # Whether calls spend real tokens and belong in the usage ledger
+    billable = True
+
+    def __init__(self, **options):
+        self.options = options
+        self.model = options.get("model", self.default_model)
+        self.supports_optimize = options.get("optimize", self.supports_optimize)
+
+    def is_available(self, api_key: str = None) -> bool:
+        return not self.requires_api_key or bool(api_key or self.options.get("api_key"))
+
+    def generate(self, prompt: str, api_key: str = None, operation: str = "generate") -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, api_key: str = None, operation: str = "generate") -> Iterator[str]:
+        yield self.generate(prompt, api_key, operation)
+
+    async def agenerate(self, prompt: str, api_key: str = None, operation: str = "generate") -> str:
+        """Async generate(); by default runs generate() in a worker thread and abort()s it on cancellation"""
+        resources = []
+
+        def call():
+            _call_resources.set(resources)
+            return self.generate(prompt, api_key, operation)
+
+        try:
+            return await asyncio.to_thread(call)
+        except asyncio.CancelledError:
+            self.abort(resources)
+            raise
+
+    async def astream(self, prompt: str, api_key: str = None, operation: str = "generate"):
+        """Async stream(); by default pumps stream() from a worker thread into the event loop"""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        stop = threading.Event()
+        end = object()
+        resources = []
+
+        def produce():
+            _call_resources.set(resources)
+            try:
+                for chunk in self.stream(prompt, api_key, operation):
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                loop.call_soon_threadsafe(chunks.put_nowait, end)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+
+        worker = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is end:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            if not worker.done():
+                stop.set()
+                self.abort(resources)
+
+    def abort(self, resources=()):
+        """Release the resources a cancelled in-flight call registered with track_call_resource; no-op by default"""
+
+    def load_sdk(self):
+        """Import this backend's SDK modules now rather than on the first request"""
+        return [_sdk(name) for name in self.sdk_modules]
+
+    def with_options(self, **overrides) -> "AIProvider":
+        """Copy of this provider with some options replaced, e.g. a different temperature"""
+        copy = type(self)(**dict(self.options, **overrides))
+        copy.name = self.name
+        return copy
+
+    def resolve_api_key(self, api_key: str = None) -> Optional[str]:
+        return api_key or self.options.get("api_key")
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}:{self.model}>"
+
+
+@register_provider
+class GeminiProvider(AIProvider):
+    name = "gemini"
+    default_model = "gemini-2.5-flash"
+    requires_api_key = True
+    sdk_modules = ("google.generativeai",)
+
+    # genai.configure is process-wide, so remember which key it currently holds
+    _configured_key = None
+    _configure_lock = threading.Lock()
+
+    def _client(self, api_key: str):
+        key = self.resolve_api_key(api_key)
+        pool_key = (self.name, key, self.model)
+        genai = _sdk("google.generativeai")
+        with GeminiProvider._configure_lock:
+            if GeminiProvider._configured_key != key:
+                genai.configure(api_key=key)
+                GeminiProvider._configured_key = key
+                client_pool.invalidate(self.name)
+            return client_pool.get(pool_key, lambda: genai.GenerativeModel(self.model))
+
+    def _generation_config(self, operation: str = "generate"):
+        config = {}
+        temperature = self.options.get("temperature")
+        if temperature is not None:
+            config["temperature"] = float(temperature)
+        schema = RESPONSE_SCHEMAS.get(operation)
+        if schema is not None and self.options.get("structured_output", True):
+            # Constrained decoding returns bare JSON, so extract_json parses it on the first try
+            config["response_mime_type"] = "application/json"
+            config["response_schema"] = schema
+        return config or None
+
+    @staticmethod
+    def _report_usage(response):
+        # Streamed responses carry the running totals on every chunk; the last one wins
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is not None:
+            report_usage(getattr(metadata, "prompt_token_count", None),
+                         getattr(metadata, "candidates_token_count", None))
+
+    def generate(self, prompt, api_key=None, operation="generate"):
+        response = self._client(api_key).generate_content(prompt, generation_config=self._generation_config(operation))
+        self._report_usage(response)
+        return response.text
+
+    def stream(self, prompt, api_key=None, operation="generate"):
+        for chunk in self._client(api_key).generate_content(prompt, stream=True,
+                                                             generation_config=self._generation_config(operation)):
+            self._report_usage(chunk)
+            text = chunk.text
+            if text:
+                yield text
+
+    async def agenerate(self, prompt, api_key=None, operation="generate"):
+        # Native async call, so cancelling the task also cancels the RPC
+        response = await self._client(api_key).generate_content_async(
+            prompt, generation_config=self._generation_config(operation))
+        self._report_usage(response)
+        return response.text
+
+    async def astream(self, prompt, api_key=None, operation="generate"):
+        response = await self._client(api_key).generate_content_async(
+            prompt, stream=True, generation_config=self._generation_config(operation))
+        async for chunk in response:
+            self._report_usage(chunk)
+            text = chunk.text
+            if text:
+                yield text
+
+
+@register_provider
+class MetaAIProvider(AIProvider):
+    name = "meta_ai"
+    default_model = "meta-ai"
+    supports_optimize = False
+    sdk_modules = ("meta_ai_api",)
+
+    def _pool_key(self):
+        return self.name, self.options.get("fb_email"), self.model
+
+    def _checkout(self):
+        # MetaAI objects carry the conversation id and are not thread-safe, so each call borrows its own
+        credentials = (self.options.get("fb_email"), self.options.get("fb_password"))
+        meta_ai = _sdk("meta_ai_api").MetaAI
+        client = client_pool.checkout(self._pool_key(),
+                                      lambda: meta_ai(*credentials) if credentials[0] else meta_ai())
+        track_call_resource(client)
+        return client
+
+    def abort(self, resources=()):
+        # Closing the call's own session drops its sockets, which unblocks a stuck request
+        for client in resources:
+            client.session.close()
+
+    def generate(self, prompt, api_key=None, operation="generate"):
+        client = self._checkout()
+        # Every request starts a fresh conversation so earlier prompts never leak into its context
+        result = client.prompt(message=prompt, new_conversation=True)
+        # A failed call may leave the session unusable, so only clients that succeeded go back
+        client_pool.checkin(self._pool_key(), client)
+        return result.get("message", "")
+
+    def stream(self, prompt, api_key=None, operation="generate"):
+        client = self._checkout()
+        # Meta AI streams the cumulative message, so only forward the new suffix
+        seen = 0
+        for result in client.prompt(message=prompt, stream=True, new_conversation=True):
+            message = result.get("message", "")
+            if len(message) > seen:
+                yield message[seen:]
+                seen = len(message)
+        client_pool.checkin(self._pool_key(), client)
+
+
+@register_provider
+class LocalProvider(AIProvider):
+    """Deterministic offline stand-in used for load tests and benchmarks.
+
+    Options:
+        latency: seconds to wait before answering (default 0)
+        chunk_size / chunk_delay: how stream() splits and paces the response
+        responses: {"substring": "raw response"} canned answers, matched in order
+        temperature: varies the generated app id, so n-variant runs produce distinct apps
+    """
+
+    name = "local"
+    default_model = "local-template"
+
+    TASK_PATTERN = re.compile(r'Given the task: "(.*?)"\n', re.DOTALL)
+    OPTIMIZE_PATTERN = re.compile(r'User Prompt: "(.*?)"', re.DOTALL)
+    CODE_PATTERN = re.compile(r'<<<CODE\n(.*)\nCODE>>>', re.DOTALL)
+    INSTRUCTION_PATTERN = re.compile(r'Apply this change: "(.*?)"\n', re.DOTALL)
+    FRAGMENT_PATTERN = re.compile(r'<<<FRAGMENT\n(.*)\nFRAGMENT>>>', re.DOTALL)
+    REGION_INSTRUCTION_PATTERN = re.compile(r'Apply this change to the fragment only: "(.*?)"\n', re.DOTALL)
+
+    def generate(self, prompt, api_key=None, operation="generate"):
+        latency = float(self.options.get("latency", 0.0))
+        if latency > 0:
+            time.sleep(latency)
+        return self.render(prompt, operation)
+
+    def stream(self, prompt, api_key=None, operation="generate"):
+        response = self.generate(prompt, api_key, operation)
+        chunk_size = max(int(self.options.get("chunk_size", 64)), 1)
+        chunk_delay = float(self.options.get("chunk_delay", 0.0))
+        for i in range(0, len(response), chunk_size):
+            if chunk_delay > 0 and i:
+                time.sleep(chunk_delay)
+            yield response[i:i + chunk_size]
+
+    async def agenerate(self, prompt, api_key=None, operation="generate"):
+        latency = float(self.options.get("latency", 0.0))
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return self.render(prompt, operation)
+
+    async def astream(self, prompt, api_key=None, operation="generate"):
+        response = await self.agenerate(prompt, api_key, operation)
+        chunk_size = max(int(self.options.get("chunk_size", 64)), 1)
+        chunk_delay = float(self.options.get("chunk_delay", 0.0))
+        for i in range(0, len(response), chunk_size):
+            if chunk_delay > 0 and i:
+                await asyncio.sleep(chunk_delay)
+            yield response[i:i + chunk_size]
+
+    def render(self, prompt: str, operation: str = "generate") -> str:
+        for needle, response in self.options.get("responses", {}).items():
+            if needle in prompt:
+                return response
+
+        if operation == "update":
+            # Append a marker comment just before </body> in the submitted code
+            match = self.CODE_PATTERN.search(prompt)
+            code = match.group(1) if match else ""
+            instruction = self.INSTRUCTION_PATTERN.search(prompt)
+            note = (instruction.group(1) if instruction else "update").replace("--", "-")
+            edits = [{"search": "</body>", "replace": f"<!-- {note} --></body>"}] if code.count("</body>") == 1 else []
+            return json.dumps({"edits": edits, "summary": note})
+
+        if operation == "region":
+            match = self.FRAGMENT_PATTERN.search(prompt)
+            instruction = self.REGION_INSTRUCTION_PATTERN.search(prompt)
+            note = (instruction.group(1) if instruction else "update").replace("--", "-")
+            return json.dumps({"fragment": f"{match.group(1) if match else ''}<!-- {note} -->"})
+
+        if operation == "optimize":
+            match = self.OPTIMIZE_PATTERN.search(prompt)
+            return self.refine(match.group(1) if match else prompt)
+
+        match = self.TASK_PATTERN.search(prompt)
+        task = match.group(1) if match else prompt
+        # A temperature option stands in for sampling randomness so variants differ
+        temperature = self.options.get("temperature")
+        seed = task if temperature is None else f"{task}@{temperature}"
+        digest = hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8]
+        title = task.strip()[:60] or "Local App"
+        escaped = title.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        app = {
+            "html": (f"<!DOCTYPE html><html><head><title>{escaped}</title></head>"
+                     f"<body><main id=\"app-{digest}\"><h1>{escaped}</h1>"
+                     f"<p>Generated offline by the local provider.</p></main></body></html>"),
+            "css": f"body {{ font-family: sans-serif; margin: 0; }} #app-{digest} {{ padding: 2rem; }}",
+            "js": f"document.addEventListener('DOMContentLoaded', () => console.log('app-{digest}'));",
+            "name": title,
+        }
+        if '"refined_prompt"' in prompt:
+            app["refined_prompt"] = self.refine(task)
+        return json.dumps(app)
+
+    @staticmethod
+    def refine(task: str) -> str:
+        return (f"{task.strip()}. Use a responsive layout with a header, main content area and footer, "
+                f"accessible semantic HTML, a consistent color palette and subtle hover interactions.")
+
+
+def create_provider(name: str, **options) -> AIProvider:
+    if name not in PROVIDER_CLASSES:
+        raise KeyError(f"Unknown AI provider: {name}")
+    return PROVIDER_CLASSES[name](**options)
+
+
+def load_providers(provider_settings: List[Dict] = None) -> List[AIProvider]:
+    """Build the ordered provider list from settings, skipping disabled or unknown entries"""
+    providers = []
+    for entry in provider_settings or DEFAULT_PROVIDER_SETTINGS:
+        options = dict(entry)
+        name = options.pop("name", None)
+        if not options.pop("enabled", True):
+            continue
+        try:
+            providers.append(create_provider(name, **options))
+        except KeyError as e:
+            logger.warning(f"[Providers] {e}; skipping.")
+    return providers
+
+
+_active_providers = load_providers()
+
+
+def configure_providers(provider_settings: List[Dict] = None, wrapper=None):
+    """Replace the active provider chain, e.g. with settings.json's "providers" list.
+    wrapper, when given, is applied to every provider (see core.cassettes)."""
+    global _active_providers
+    _active_providers = load_providers(provider_settings)
+    if wrapper is not None:
+        _active_providers = [wrapper(provider) for provider in _active_providers]
+    logger.info(f"[Providers] Active providers: {_active_providers}")
+
+
+def get_providers(api_key: str = None, operation: str = "generate") -> List[AIProvider]:
+    """Return the usable providers, in configured order, for this call"""
+    return [
+        provider for provider in _active_providers
+        if provider.is_available(api_key) and (operation != "optimize" or provider.supports_optimize)
+    ]
+
+
+def prewarm_providers(providers: List[AIProvider] = None) -> threading.Thread:
+    """Import the SDKs of the active providers on a background thread, so the first
+    request does not pay for them while startup does not either"""
+    targets = list(providers if providers is not None else _active_providers)
+
+    def load():
+        for provider in targets:
+            try:
+                provider.load_sdk()
+            except Exception as e:
+                logger.warning(f"[Providers] Could not preload the {provider.name} SDK: {e}")
+
+    thread = threading.Thread(target=load, name="provider-prewarm", daemon=True)
+    thread.start()
+    return thread
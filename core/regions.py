@@ -0,0 +1,81 @@
+"""
+Locate fragments of a generated page so they can be regenerated on their own.
+A region is a (start, end) character span inside the full document.
+"""
+
+import re
+from typing import Optional, Tuple
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"
+}
+
+LINE_RANGE_PATTERN = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d+))?\s*$")
+
+
+def line_range_span(code: str, first_line: int, last_line: int) -> Optional[Tuple[int, int]]:
+    """Span covering 1-based lines first_line..last_line inclusive"""
+    lines = code.splitlines(keepends=True)
+    if first_line < 1 or last_line < first_line or first_line > len(lines):
+        return None
+    start = sum(len(line) for line in lines[:first_line - 1])
+    end = start + sum(len(line) for line in lines[first_line - 1:last_line])
+    return start, end
+
+
+def element_span(code: str, selector: str) -> Optional[Tuple[int, int]]:
+    """Span of the first element matching a simple selector: "nav", "#hero" or ".card" """
+    selector = selector.strip()
+    if selector.startswith("#"):
+        opening = re.compile(r"<([a-zA-Z][\w-]*)\b[^>]*\bid\s*=\s*[\"']" + re.escape(selector[1:]) + r"[\"'][^>]*>")
+    elif selector.startswith("."):
+        opening = re.compile(
+            r"<([a-zA-Z][\w-]*)\b[^>]*\bclass\s*=\s*[\"'][^\"']*(?<![\w-])" + re.escape(selector[1:]) +
+            r"(?![\w-])[^\"']*[\"'][^>]*>"
+        )
+    elif re.fullmatch(r"[a-zA-Z][\w-]*", selector):
+        opening = re.compile(r"<(" + re.escape(selector) + r")\b[^>]*>", re.IGNORECASE)
+    else:
+        return None
+
+    match = opening.search(code)
+    if not match:
+        return None
+    tag = match.group(1).lower()
+    if tag in VOID_ELEMENTS or match.group(0).endswith("/>"):
+        return match.start(), match.end()
+
+    # Walk nested open/close tags of the same name to find the matching close
+    depth = 1
+    tags = re.compile(r"<(/?)" + re.escape(tag) + r"\b[^>]*>", re.IGNORECASE)
+    for other in tags.finditer(code, match.end()):
+        depth += -1 if other.group(1) else 1
+        if depth == 0:
+            return match.start(), other.end()
+    return None
+
+
+def resolve_region(code: str, target: str) -> Optional[Tuple[int, int]]:
+    """Interpret target as a line range ("12-30", "7") or an element selector"""
+    lines = LINE_RANGE_PATTERN.match(target)
+    if lines:
+        first = int(lines.group(1))
+        return line_range_span(code, first, int(lines.group(2) or first))
+    return element_span(code, target)
+
+
+def surrounding_context(code: str, start: int, end: int, context_lines: int = 3) -> Tuple[str, str]:
+    """Return up to context_lines full lines before start and after end"""
+    before_start = start
+    for _ in range(context_lines + 1):
+        before_start = code.rfind("\n", 0, before_start)
+        if before_start == -1:
+            break
+    before = code[before_start + 1:start]
+    after_end = end
+    for _ in range(context_lines + 1):
+        after_end = code.find("\n", after_end + 1)
+        if after_end == -1:
+            after_end = len(code)
+            break
+    return before, code[end:after_end]
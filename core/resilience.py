@@ -0,0 +1,236 @@
+"""
+Per-provider rate limiting and circuit breaking for AI calls.
+Each provider gets a token bucket that paces requests and a circuit breaker
+that stops routing to it after repeated failures until a cool-down passes.
+A call asks the breaker first, so one it refuses never spends or waits for a token.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Why ProviderGuard.admit() refused a call
+CIRCUIT_OPEN = "circuit is open"
+RATE_LIMITED = "is rate limited"
+
+DEFAULT_RESILIENCE_SETTINGS = {
+    "rate": 1.0,              # tokens added per second; 0 disables rate limiting
+    "burst": 5,               # bucket capacity
+    "max_wait": 2.0,          # longest a caller waits for a token before trying another provider
+    "failure_threshold": 3,   # consecutive failures that open the circuit
+    "recovery_timeout": 30.0  # seconds before an open circuit lets a trial request through
+}
+
+# Built-in overrides; the offline stand-in provider is never rate limited
+PROVIDER_DEFAULTS = {
+    "local": {"rate": 0},
+}
+
+
+class TokenBucket:
+    """Classic token bucket; thread-safe. A rate of 0 or less never limits."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def wait_time(self) -> float:
+        """Seconds until a token will be available"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Take a token, waiting up to timeout seconds for one to become available"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.try_acquire():
+                return True
+            wait = self.wait_time()
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive failures; open -> half-open after
+    recovery_timeout; a successful half-open trial closes it again, a failed one re-opens it."""
+
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_timeout: float = 30.0,
+                 on_state_change: Callable = None):
+        self.name = name
+        self.failure_threshold = int(failure_threshold)
+        self.recovery_timeout = float(recovery_timeout)
+        self.on_state_change = on_state_change
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, new_state: str):
+        old_state, self._state = self._state, new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        if new_state != HALF_OPEN:
+            self._trial_in_flight = False
+        if old_state != new_state and self.on_state_change:
+            self.on_state_change(self.name, old_state, new_state)
+
+    def is_available(self) -> bool:
+        """True if a request could be routed here now (no side effects)"""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and not self._trial_in_flight)
+
+    def allow_request(self) -> bool:
+        """Claim permission for one request; in half-open only a single trial is let through"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._transition(OPEN)
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot when the request was cancelled or never sent"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def seconds_until_retry(self) -> float:
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+
+class ProviderGuard:
+    """Token bucket plus circuit breaker for one provider"""
+
+    def __init__(self, name: str, settings: Dict, on_state_change: Callable = None):
+        options = dict(DEFAULT_RESILIENCE_SETTINGS, **settings)
+        self.name = name
+        self.max_wait = float(options["max_wait"])
+        self.bucket = TokenBucket(options["rate"], options["burst"])
+        self.breaker = CircuitBreaker(name, options["failure_threshold"], options["recovery_timeout"],
+                                      on_state_change)
+
+    def admit(self) -> Optional[str]:
+        """Claim the breaker, then wait up to max_wait for a token; returns None or why the call was refused"""
+        if not self.breaker.allow_request():
+            return CIRCUIT_OPEN
+        if not self.bucket.acquire(timeout=self.max_wait):
+            self.breaker.release_trial()
+            return RATE_LIMITED
+        return None
+
+    async def admit_async(self) -> Optional[str]:
+        """admit() that waits for the token without blocking the event loop"""
+        if not self.breaker.allow_request():
+            return CIRCUIT_OPEN
+        deadline = time.monotonic() + self.max_wait
+        while not self.bucket.try_acquire():
+            wait = self.bucket.wait_time()
+            if time.monotonic() + wait > deadline:
+                self.breaker.release_trial()
+                return RATE_LIMITED
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+        return None
+
+
+_guards = {}
+_guard_settings = {}
+_guards_lock = threading.Lock()
+_state_listener: Optional[Callable] = None
+
+
+def configure_resilience(settings: Dict = None, on_state_change: Callable = None):
+    """Apply the "resilience" section of settings.json ({"default": {...}, "<provider>": {...}})"""
+    global _guard_settings, _state_listener
+    with _guards_lock:
+        _guard_settings = dict(settings or {})
+        if on_state_change is not None:
+            _state_listener = on_state_change
+        _guards.clear()
+
+
+def guard_for(provider_name: str) -> ProviderGuard:
+    with _guards_lock:
+        guard = _guards.get(provider_name)
+        if guard is None:
+            settings = dict(PROVIDER_DEFAULTS.get(provider_name, {}))
+            settings.update(_guard_settings.get("default", {}))
+            settings.update(_guard_settings.get(provider_name, {}))
+            guard = ProviderGuard(provider_name, settings, _state_listener)
+            _guards[provider_name] = guard
+        return guard
+
+
+def resilience_snapshot() -> Dict:
+    """Circuit state, failure count and available tokens per provider"""
+    with _guards_lock:
+        guards = list(_guards.values())
+    return {
+        guard.name: {
+            "state": guard.breaker.state,
+            "failures": guard.breaker.failures,
+            "retry_in": round(guard.breaker.seconds_until_retry(), 1),
+            "token_wait": round(guard.bucket.wait_time(), 2),
+        }
+        for guard in guards
+    }
@@ -0,0 +1,204 @@
+"""
+Persistent content-addressed cache for AI generation results.
+Entries are keyed by a hash of the normalized prompt, provider, model and prompt
+template version, and evicted by TTL and least-recently-used order once the
+cache grows past its size cap. Hits only update access times in memory; they
+reach index.json with the next put, clear or flush.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from core.prompt_index import SimilarPromptIndex
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "ai_responses")
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lower-case the prompt and collapse whitespace so trivial edits share a key"""
+    return " ".join(prompt.lower().split())
+
+
+def make_cache_key(prompt: str, provider: str, model: str, template_version) -> str:
+    """Hash everything that influences the generated output"""
+    material = json.dumps(
+        [normalize_prompt(prompt), provider, model, str(template_version)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk LRU + TTL cache with hit/miss counters"""
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None
+        # Access times changed by hits since index.json was last written
+        self._dirty = False
+        # Reworded prompts that should reuse an existing entry; see core.prompt_index
+        self.similar = SimilarPromptIndex(cache_dir)
+
+    def configure(self, settings: Dict):
+        """Apply the "response_cache" section of settings.json"""
+        with self._lock:
+            self.enabled = bool(settings.get("enabled", self.enabled))
+            self.max_bytes = int(settings.get("max_bytes", self.max_bytes))
+            self.ttl_seconds = float(settings.get("ttl_seconds", self.ttl_seconds))
+            new_dir = settings.get("cache_dir", self.cache_dir)
+            if new_dir != self.cache_dir:
+                self._flush()
+                self.cache_dir = new_dir
+                self._index = None
+        self.similar.configure(settings.get("similarity", {}), new_dir)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value = None
+            if not self._is_expired(entry):
+                try:
+                    with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                        value = json.load(f)["value"]
+                except (IOError, ValueError, KeyError) as e:
+                    print(f"Error reading cache entry {key}: {e}")
+            if value is None:
+                self._remove(key)
+                self._save_index()
+                self.misses += 1
+            else:
+                entry["last_access"] = time.time()
+                self._dirty = True
+                self.hits += 1
+                return value
+        self.similar.discard(key)
+        return None
+
+    def put(self, key: str, value: str):
+        """Store value under key and evict old entries past the size cap"""
+        if not self.enabled:
+            return
+        with self._lock:
+            index = self._load_index()
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                data = json.dumps({"value": value}, ensure_ascii=False)
+                with open(self._entry_path(key), "w", encoding="utf-8") as f:
+                    f.write(data)
+            except IOError as e:
+                print(f"Error writing cache entry {key}: {e}")
+                return
+            now = time.time()
+            index[key] = {"size": len(data.encode("utf-8")), "created": now, "last_access": now}
+            evicted = self._evict()
+            self._save_index()
+        if evicted:
+            self.similar.discard(*evicted)
+
+    def flush(self):
+        """Write access times recorded by hits since the last write to index.json"""
+        with self._lock:
+            self._flush()
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            for key in list(self._load_index()):
+                self._remove(key)
+            self._save_index()
+            self.hits = 0
+            self.misses = 0
+        self.similar.clear()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            index = self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(index),
+                "bytes": sum(entry["size"] for entry in index.values()),
+                "max_bytes": self.max_bytes,
+                "similar": self.similar.stats(),
+            }
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _is_expired(self, entry: Dict) -> bool:
+        return self.ttl_seconds > 0 and time.time() - entry["created"] > self.ttl_seconds
+
+    def _evict(self) -> List[str]:
+        """Remove expired entries, then least recently used ones past max_bytes; returns the removed keys"""
+        index = self._index
+        evicted = [k for k, entry in index.items() if self._is_expired(entry)]
+        for key in evicted:
+            self._remove(key)
+        total = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= index[key]["size"]
+            self._remove(key)
+            evicted.append(key)
+        return evicted
+
+    def _remove(self, key: str):
+        self._index.pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _load_index(self) -> Dict:
+        if self._index is None:
+            path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            self._index = {}
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._index = json.load(f)
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"Error loading response cache index: {e}")
+        return self._index
+
+    def _flush(self):
+        if self._dirty and self._index is not None:
+            self._save_index()
+
+    def _save_index(self):
+        self._dirty = False
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, path)
+        except IOError as e:
+            print(f"Error saving response cache index: {e}")
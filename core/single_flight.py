@@ -0,0 +1,106 @@
+"""
+Single-flight deduplication of identical AI requests.
+While a request is in flight, callers asking for the same fingerprint attach
+to it and share its result instead of issuing a duplicate provider call, e.g.
+when Generate is double-clicked. Threads and asyncio tasks are deduplicated
+separately, each within its own kind, and asyncio tasks only within the
+event loop that runs them.
+"""
+
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """In-flight request table keyed by (operation, fingerprint)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        # Tasks belong to the loop that runs them, so async calls are only shared within one loop;
+        # keyed by (loop, key) and guarded by the same lock, since callers may run on different loops
+        self._tasks: Dict[Hashable, list] = {}
+        self.executed = Counter()
+        self.coalesced = Counter()
+
+    def do(self, key: Tuple[str, Hashable], fn: Callable):
+        """Run fn() unless an identical call is already running in another thread; either way return its result"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.executed[key[0]] += 1
+            else:
+                self.coalesced[key[0]] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    async def ado(self, key: Tuple[str, Hashable], factory: Callable[[], Awaitable]):
+        """Async do(): await factory() or attach to the identical call already running on this loop.
+
+        The shared call is only cancelled once every caller waiting on it has
+        been cancelled, so one caller giving up does not fail the others.
+        """
+        task_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            entry = self._tasks.get(task_key)
+            if entry is None or entry[0].done():
+                task = asyncio.ensure_future(factory())
+                entry = self._tasks[task_key] = [task, 0]
+                task.add_done_callback(lambda done, task_key=task_key: self._forget_task(task_key, done))
+                self.executed[key[0]] += 1
+            else:
+                self.coalesced[key[0]] += 1
+            task = entry[0]
+            entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self._lock:
+                entry[1] -= 1
+                abandoned = entry[1] == 0 and not task.done()
+                if abandoned and self._tasks.get(task_key) is entry:
+                    # Forget it now rather than in the done-callback, so nobody attaches to a dying task
+                    del self._tasks[task_key]
+            if abandoned:
+                task.cancel()
+            raise
+
+    def stats(self) -> Dict:
+        """Calls that reached a provider and calls that were coalesced into them, per operation"""
+        with self._lock:
+            in_flight = len(self._calls) + len(self._tasks)
+            return {
+                "executed": dict(self.executed),
+                "coalesced": dict(self.coalesced),
+                "in_flight": in_flight,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.executed.clear()
+            self.coalesced.clear()
+
+    def _finish(self, key):
+        # Forget the call before publishing its result so later callers start a fresh one
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def _forget_task(self, task_key, task):
+        with self._lock:
+            entry = self._tasks.get(task_key)
+            if entry is not None and entry[0] is task:
+                del self._tasks[task_key]
@@ -0,0 +1,119 @@
+"""
+Thread-safe publish/subscribe bus for AI status events.
+Workers publish typed events as a request progresses; subscribers get every
+event, and the UI drains them on the Tk thread through TkStatusDrain instead
+of polling a shared dict.
+"""
+
+import logging
+import queue
+import threading
+import time
+import tkinter as tk
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+STATUS = "status"                        # plain state change (connecting, error, offline...)
+REQUEST_STARTED = "request_started"
+CHUNK_RECEIVED = "chunk_received"
+RETRY = "retry"
+PROVIDER_SWITCHED = "provider_switched"
+DONE = "done"
+
+
+@dataclass
+class StatusEvent:
+    kind: str
+    state: str
+    message: str
+    provider: Optional[str] = None
+    attempt: Optional[int] = None
+    chars: Optional[int] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+class StatusBus:
+    """Keeps the latest state and fans events out to subscribers"""
+
+    def __init__(self, state: str = "connecting", message: str = "Connecting to AI service..."):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._next_token = 0
+        self._latest = StatusEvent(STATUS, state, message)
+
+    def publish(self, event: StatusEvent):
+        with self._lock:
+            self._latest = event
+            subscribers = list(self._subscribers.values())
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"[StatusBus] Subscriber failed on {event.kind}: {e}")
+
+    def subscribe(self, callback: Callable[[StatusEvent], None]) -> int:
+        """Call callback(event) from the publishing thread for every event; returns a token for unsubscribe"""
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._subscribers[token] = callback
+            return token
+
+    def unsubscribe(self, token: int):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def latest(self) -> StatusEvent:
+        with self._lock:
+            return self._latest
+
+    def snapshot(self) -> Dict:
+        """Latest state as the {"state", "message"} dict the UI used to poll"""
+        event = self.latest()
+        return {"state": event.state, "message": event.message}
+
+
+class TkStatusDrain:
+    """Forwards bus events to handler on the Tk thread.
+
+    Workers only put events on a queue; Tk is never called from their threads.
+    The drain polls that queue every POLL_INTERVAL_MS with after(), scheduled
+    from the Tk thread itself, and hands a whole burst of streaming chunks to
+    handler in one pass. Create it on the Tk thread.
+    """
+
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, widget, bus: StatusBus, handler: Callable[[StatusEvent], None]):
+        self.widget = widget
+        self.handler = handler
+        self._events = queue.Queue()
+        self._bus = bus
+        self._token = bus.subscribe(self._events.put)
+        self._poll = None
+        self.drain()
+
+    def drain(self):
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            self.handler(event)
+        try:
+            self._poll = self.widget.after(self.POLL_INTERVAL_MS, self.drain)
+        except tk.TclError:
+            # The widget is gone; nothing left to update
+            self.close()
+
+    def close(self):
+        self._bus.unsubscribe(self._token)
+        if self._poll is not None:
+            try:
+                self.widget.after_cancel(self._poll)
+            except tk.TclError:
+                pass
+            self._poll = None
@@ -0,0 +1,125 @@
+import json
+
+STREAMED_FIELDS = ("html", "css", "js", "name")
+
+
+class PartialJSONFieldParser:
+    """Incrementally decode top-level string fields of a JSON object as it streams in.
+
+    Chunks are scanned exactly once, so feeding a whole response costs O(n)
+    regardless of how it was split. Any text before the opening brace (markdown
+    fences, prose) is ignored.
+    """
+
+    def __init__(self, fields=STREAMED_FIELDS):
+        self.fields = tuple(fields)
+        self.completed = set()
+        self._values = {}
+        self._depth = 0
+        self._in_string = False
+        self._string_role = None  # "key", "value" or None for nested strings
+        self._escape = ""
+        self._high_surrogate = ""
+        self._token = []
+        self._key = None
+        self._expect_value = False
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; return True if any tracked field received new text."""
+        changed = False
+        for ch in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape += ch
+                    if self._escape_complete():
+                        decoded = self._decode_escape()
+                        if decoded:
+                            changed |= self._append(decoded)
+                elif ch == "\\":
+                    self._escape = ch
+                elif ch == '"':
+                    self._close_string()
+                else:
+                    changed |= self._append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._string_role = "value" if self._expect_value else "key"
+                else:
+                    self._string_role = None
+                self._token = []
+                if self._string_role == "value" and self._key in self.fields:
+                    self._values[self._key] = self._token
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth = max(self._depth - 1, 0)
+            elif self._depth == 1 and ch == ":":
+                self._expect_value = True
+            elif self._depth == 1 and ch == ",":
+                self._expect_value = False
+                self._key = None
+        return changed
+
+    def fields_so_far(self) -> dict:
+        """Return the decoded (possibly partial) value of every tracked field seen so far."""
+        return {key: "".join(parts) for key, parts in self._values.items()}
+
+    def is_complete(self, field: str) -> bool:
+        return field in self.completed
+
+    def _append(self, text: str) -> bool:
+        self._token.append(text)
+        return self._string_role == "value" and self._key in self.fields
+
+    def _close_string(self):
+        self._in_string = False
+        if self._string_role == "key":
+            self._key = "".join(self._token)
+        elif self._string_role == "value":
+            if self._key in self.fields:
+                self.completed.add(self._key)
+            self._expect_value = False
+        self._string_role = None
+
+    def _escape_complete(self) -> bool:
+        if len(self._escape) < 2:
+            return False
+        if self._escape[1] == "u":
+            return len(self._escape) == 6
+        return True
+
+    def _decode_escape(self) -> str:
+        escape, self._escape = self._escape, ""
+        try:
+            decoded = json.loads(f'"{escape}"')
+        except json.JSONDecodeError:
+            return escape[1:]
+        # Surrogate pairs arrive as two separate \\u escapes
+        if "\ud800" <= decoded <= "\udbff":
+            self._high_surrogate = escape
+            return ""
+        if self._high_surrogate and "\udc00" <= decoded <= "\udfff":
+            pair, self._high_surrogate = self._high_surrogate + escape, ""
+            return json.loads(f'"{pair}"')
+        return decoded
+
+
+def render_partial_document(fields: dict, completed=()) -> str:
+    """Build a previewable HTML document from partially streamed fields.
+
+    CSS is injected as soon as any of it is known; JavaScript is only attached
+    once its field is complete so half-written scripts never execute.
+    """
+    html = fields.get("html", "")
+    css = fields.get("css", "")
+    js = fields.get("js", "") if "js" in completed else ""
+
+    if css:
+        style = f"<style>{css}</style>"
+        html = html.replace("</head>", f"{style}</head>") if "</head>" in html else style + html
+    if js and "</body>" in html:
+        html = html.replace("</body>", f"<script>{js}</script></body>")
+    return html
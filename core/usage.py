@@ -0,0 +1,170 @@
+"""
+Token and cost accounting for AI provider calls.
+Every completed call is appended as one JSON line to a usage file, keyed by
+provider, model, user and operation. Token counts come from the provider
+when it reports them (see report_usage) and are estimated from the text
+otherwise. summary() aggregates the file for any combination of those keys.
+"""
+
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_USAGE_FILE = os.path.join("usage", "usage.jsonl")
+
+# Rough characters per token for English text and code; only used when the provider reports nothing
+CHARS_PER_TOKEN = 4
+
+GROUP_KEYS = ("provider", "model", "user", "operation")
+
+_reported = contextvars.ContextVar("reported_usage", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+@contextmanager
+def capture_reported_usage():
+    """Collect token counts a provider reports during the body; yields the dict they land in"""
+    reported = {}
+    token = _reported.set(reported)
+    try:
+        yield reported
+    finally:
+        _reported.reset(token)
+
+
+def report_usage(prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+    """Called by providers with the token counts their API returned for the current call"""
+    reported = _reported.get()
+    if reported is None:
+        return
+    if prompt_tokens is not None:
+        reported["prompt_tokens"] = int(prompt_tokens)
+    if completion_tokens is not None:
+        reported["completion_tokens"] = int(completion_tokens)
+
+
+class UsageLedger:
+    """Append-only JSON-lines store of per-call token usage"""
+
+    def __init__(self, path: str = DEFAULT_USAGE_FILE, enabled=True, prices: Dict = None):
+        self.path = path
+        self.enabled = enabled
+        # {model: {"input": price, "output": price}} per million tokens
+        self.prices = dict(prices or {})
+        self.user = None
+        self._lock = threading.Lock()
+
+    def configure(self, settings: Dict):
+        """Apply the "usage" section of settings.json"""
+        with self._lock:
+            self.enabled = bool(settings.get("enabled", self.enabled))
+            self.path = settings.get("file", self.path)
+            self.prices = dict(settings.get("prices", self.prices))
+
+    def set_user(self, user: Optional[str]):
+        """User that calls are attributed to from now on"""
+        self.user = user
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        price = self.prices.get(model)
+        if not price:
+            return None
+        return (prompt_tokens * float(price.get("input", 0)) +
+                completion_tokens * float(price.get("output", 0))) / 1_000_000
+
+    def record_call(self, provider, operation: str, prompt: str, response: str, reported: Dict = None):
+        """Record one completed provider call, estimating whatever the provider did not report"""
+        if not provider.billable:
+            return
+        reported = reported or {}
+        prompt_tokens = reported.get("prompt_tokens")
+        completion_tokens = reported.get("completion_tokens")
+        self.record(
+            provider.name, provider.model, operation,
+            prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+            completion_tokens if completion_tokens is not None else estimate_tokens(response),
+            estimated=prompt_tokens is None or completion_tokens is None
+        )
+
+    def record(self, provider: str, model: str, operation: str, prompt_tokens: int, completion_tokens: int,
+               estimated: bool = False, user: str = None):
+        if not self.enabled:
+            return
+        entry = {
+            "time": time.time(),
+            "provider": provider,
+            "model": model,
+            "user": user or self.user,
+            "operation": operation,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated": estimated,
+            "cost": self.cost(model, prompt_tokens, completion_tokens),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except IOError as e:
+                print(f"Error recording token usage: {e}")
+
+    def records(self, since: float = None, until: float = None, **filters) -> Iterator[Dict]:
+        """Stored records in time order, optionally limited to [since, until) and matching filters,
+        e.g. records(user="alice", operation="generate")"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash; the rest of the file is still good
+                    continue
+                if since is not None and entry["time"] < since:
+                    continue
+                if until is not None and entry["time"] >= until:
+                    continue
+                if any(entry.get(key) != value for key, value in filters.items()):
+                    continue
+                yield entry
+
+    def summary(self, group_by: Iterable[str] = GROUP_KEYS, since: float = None, until: float = None,
+                **filters) -> List[Dict]:
+        """Totals per distinct combination of the group_by keys, largest token count first"""
+        group_by = tuple(group_by)
+        for key in group_by:
+            if key not in GROUP_KEYS:
+                raise ValueError(f"Cannot group usage by {key!r}; expected one of {GROUP_KEYS}")
+        groups = {}
+        for entry in self.records(since, until, **filters):
+            group_key = tuple(entry.get(key) for key in group_by)
+            group = groups.get(group_key)
+            if group is None:
+                group = groups[group_key] = dict(zip(group_by, group_key), calls=0, prompt_tokens=0,
+                                                 completion_tokens=0, estimated_calls=0, cost=None)
+            group["calls"] += 1
+            group["prompt_tokens"] += entry["prompt_tokens"]
+            group["completion_tokens"] += entry["completion_tokens"]
+            group["estimated_calls"] += 1 if entry.get("estimated") else 0
+            if entry.get("cost") is not None:
+                group["cost"] = (group["cost"] or 0.0) + entry["cost"]
+        result = list(groups.values())
+        for group in result:
+            group["total_tokens"] = group["prompt_tokens"] + group["completion_tokens"]
+        result.sort(key=lambda group: group["total_tokens"], reverse=True)
+        return result
+
+
+ledger = UsageLedger()
@@ -31,28 +31,40 @@ def validate_github_token(token=None):
         return False, None, str(e)
 
 
-def export_code(code: str, as_zip: bool = False):
+def export_code(code: str, as_zip: bool = False, app=None, split: bool = False):
+    """Ask for a folder and export code into it; see write_export"""
     folder_selected = filedialog.askdirectory(title="Select Export Folder")
     if not folder_selected:
         return
 
+    path = write_export(folder_selected, code, as_zip, app, split)
     if as_zip:
-        export_name = f"karbon_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        zip_path = os.path.join(folder_selected, export_name)
-
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            zipf.writestr("index.html", code)
-
-        print(f"✅ Code exported as zip: {zip_path}")
+        print(f"✅ Code exported as zip: {path}")
     else:
-        html_path = os.path.join(folder_selected, "index.html")
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(code)
-        print(f"✅ Code exported as HTML: {html_path}")
+        print(f"✅ Code exported as HTML: {path}")
 
     return folder_selected
 
 
+def write_export(folder: str, code: str, as_zip: bool = False, app=None, split: bool = False) -> str:
+    """Write code as index.html into folder (or a zip inside it) and return the written path.
+    With split and a GeneratedApp for that code, index.html, style.css and script.js are written instead."""
+    files = app.files() if split and app is not None else {"index.html": code}
+
+    if as_zip:
+        export_name = f"karbon_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        zip_path = os.path.join(folder, export_name)
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for name, content in files.items():
+                zipf.writestr(name, content)
+        return zip_path
+
+    for name, content in files.items():
+        with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+            f.write(content)
+    return os.path.join(folder, "index.html")
+
+
 def export_to_github(code: str, repo_name="karbon-export-demo"):
     print("🚀 export_to_github() called")
 
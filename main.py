@@ -1,3 +1,9 @@
+from core.batch import exit_if_batch
+
+# "karbon batch ..." generates prompts headlessly without opening any window
+if __name__ == "__main__":
+    exit_if_batch()
+
 import tkinter as tk
 import threading
 from ui_items.karbon_ui import KarbonUI
@@ -43,14 +49,8 @@ os.makedirs(autosave_dir, exist_ok=True)
 if __name__ == "__main__":
     def start_ui():
         root = tk.Tk()
-        app = KarbonUI(root)
-        # --- MODIFIED: Add protocol handler to save settings on close ---
-        def on_closing():
-            app.save_settings()
-            root.destroy()
-        
-        root.protocol("WM_DELETE_WINDOW", on_closing)
-        # --- END MODIFIED ---
+        app = KarbonUI(root, user=CURRENT_USER)
+        root.protocol("WM_DELETE_WINDOW", app.close)
         root.mainloop()
 
     # Run the UI
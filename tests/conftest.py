@@ -0,0 +1,22 @@
+import pytest
+
+from core.metrics import metrics
+from core.usage import ledger
+
+
+@pytest.fixture(autouse=True)
+def usage_ledger_in_tmp_path(tmp_path):
+    """Send token usage recorded by the code under test to tmp_path instead of ./usage"""
+    saved = (ledger.path, ledger.enabled, ledger.prices, ledger.user)
+    ledger.path = str(tmp_path / "usage" / "usage.jsonl")
+    yield ledger
+    ledger.path, ledger.enabled, ledger.prices, ledger.user = saved
+
+
+@pytest.fixture(autouse=True)
+def metrics_export_in_tmp_path(tmp_path):
+    """Send the periodic metrics.prom/metrics.json exports to tmp_path instead of ./metrics"""
+    saved = metrics.export_dir
+    metrics.configure(export_dir=str(tmp_path / "metrics"))
+    yield metrics
+    metrics.configure(export_dir=saved)
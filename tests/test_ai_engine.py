@@ -0,0 +1,535 @@
+import asyncio
+import threading
+import time
+
+from core import ai_engine
+from core.providers import LocalProvider, create_provider, register_provider
+
+
+def stalled_provider(name: str):
+    """Register a local provider called name that answers only once the returned event is set"""
+    released = threading.Event()
+
+    class StalledProvider(LocalProvider):
+        def generate(self, prompt, api_key=None, operation="generate"):
+            released.wait(timeout=5)
+            return super().generate(prompt, api_key, operation)
+
+        async def agenerate(self, prompt, api_key=None, operation="generate"):
+            while not released.is_set():
+                await asyncio.sleep(0.01)
+            return await super().agenerate(prompt, api_key, operation)
+
+    StalledProvider.name = name
+    register_provider(StalledProvider)
+    return released
+
+
+def test_fast_provider_wins_hedged_race():
+    slow = create_provider("local", latency=0.5)
+    slow.name = "slow"
+    fast = create_provider("local", latency=0.0)
+    fast.name = "fast"
+    formatted = ai_engine.build_generation_prompt("Create a login page")
+
+    provider, parsed = ai_engine.request_hedged(formatted, [slow, fast], hedge_delay=0.05)
+
+    assert provider is fast
+    assert parsed["name"] == "Create a login page"
+    stats = ai_engine.get_hedge_stats()
+    assert stats["fast"]["wins"] == 1
+    assert stats["slow"]["launched"] == 1
+
+
+def test_streamed_generations_are_hedged_like_the_ui_uses_them():
+    from core.async_engine import generate_code_async, submit
+    from core.providers import configure_providers
+
+    def stats(name):
+        return ai_engine.get_hedge_stats().get(name, {})
+
+    # stalled never answers while the test runs, so every result has to come from the hedge
+    released = stalled_provider("stalled")
+    configure_providers([{"name": "stalled"}, {"name": "local", "chunk_size": 32}])
+    ai_engine.configure_hedging({"enabled": True, "delay": 0.05})
+    try:
+        before = stats("local").get("wins", 0), stats("stalled").get("launched", 0)
+        previews = []
+        result = submit(generate_code_async("Create a hedged page", use_cache=False,
+                                            on_partial=previews.append)).result(timeout=5)
+        assert result.ok and result.provider == "local" and previews
+
+        code = ai_engine.generate_code_from_prompt("Create a hedged page", use_cache=False, on_partial=previews.append)
+        assert "<h1>Create a hedged page</h1>" in code
+        assert not released.is_set()
+        assert stats("local")["wins"] == before[0] + 2 and stats("stalled")["launched"] == before[1] + 2
+        assert stats("stalled").get("wins", 0) == 0
+    finally:
+        released.set()
+        ai_engine.configure_hedging({"enabled": False})
+        configure_providers()
+
+
+def test_extract_json_skips_prose_braces_and_trailing_objects():
+    payload = '{"html": "<p>{not a brace} \\"quoted\\"</p>", "css": "a { color: red; }", "js": "", "name": "x"}'
+    response = f"Here is {{your}} app:\n{payload}\nMetadata: {{\"tokens\": 10}}"
+    assert ai_engine.extract_json(response)["css"] == "a { color: red; }"
+
+
+def test_extract_json_looks_past_an_unclosed_brace_in_prose():
+    from core.json_scan import iter_object_spans
+
+    response = 'Sure { here is the app you asked for, then {"html": "<p>x</p>", "css": "", "js": ""}'
+    assert ai_engine.extract_json(response) == {"html": "<p>x</p>", "css": "", "js": ""}
+    assert list(iter_object_spans("a {b} {c {d} {e {f} g")) == [(2, 5), (9, 12), (16, 19)]
+
+
+def test_extract_json_rejects_unbalanced_input():
+    assert ai_engine.extract_json("{" * 5000) is None
+    # A cut-off response is repaired, but flagged so callers can refuse it
+    repaired = ai_engine.extract_json('{"html": "<p>cut off')
+    assert repaired.partial and repaired.truncated == "html"
+
+
+def test_apply_edits_detects_conflicts():
+    import pytest
+    from core.patching import PatchConflictError, apply_edits
+
+    code = "<h1>Title</h1><p>a</p><p>a</p>"
+    assert apply_edits(code, [{"search": "Title", "replace": "Home"}]) == "<h1>Home</h1><p>a</p><p>a</p>"
+    with pytest.raises(PatchConflictError):
+        apply_edits(code, [{"search": "<p>a</p>", "replace": ""}])
+    with pytest.raises(PatchConflictError):
+        apply_edits(code, [{"search": "missing", "replace": ""}])
+
+
+def test_update_applies_edit_list_offline():
+    from core.providers import configure_providers
+
+    configure_providers([{"name": "local"}])
+    try:
+        code = "<html><head></head><body><h1>Hi</h1></body></html>"
+        updated = ai_engine.update_code_from_prompt(code, "add a footer")
+    finally:
+        configure_providers()
+    assert updated == "<html><head></head><body><h1>Hi</h1><!-- add a footer --></body></html>"
+
+
+def test_regenerate_region_only_touches_selected_element():
+    from core.providers import configure_providers
+    from core.regions import resolve_region
+
+    code = "<body>\n<nav><div><a>Home</a></div></nav>\n<main>Content</main>\n</body>"
+    assert code[slice(*resolve_region(code, "nav"))] == "<nav><div><a>Home</a></div></nav>"
+    assert code[slice(*resolve_region(code, "3"))] == "<main>Content</main>\n"
+
+    configure_providers([{"name": "local"}])
+    try:
+        updated = ai_engine.regenerate_target(code, "nav", "make it purple")
+    finally:
+        configure_providers()
+    assert updated == code.replace("</nav>", "</nav><!-- make it purple -->")
+
+
+def test_async_updates_are_hedged_and_can_be_stopped():
+    from core import async_engine
+    from core.providers import configure_providers
+
+    code = "<html><head></head><body>\n<nav>Home</nav>\n<h1>Hi</h1></body></html>"
+    released = stalled_provider("stalled-editor")
+    configure_providers([{"name": "stalled-editor"}, {"name": "local"}])
+    ai_engine.configure_hedging({"enabled": True, "delay": 0.05})
+    try:
+        updated = async_engine.submit(async_engine.update_code_async(code, "add a footer")).result(timeout=5)
+        region = async_engine.submit(async_engine.regenerate_target_async(code, "nav", "make it purple")).result(5)
+        assert not released.is_set()
+    finally:
+        released.set()
+        ai_engine.configure_hedging({"enabled": False})
+        configure_providers()
+    assert updated.ok and updated.provider == "local"
+    assert updated.code == code.replace("</body>", "<!-- add a footer --></body>")
+    assert region.ok and region.provider == "local"
+    assert region.code == code.replace("</nav>", "</nav><!-- make it purple -->")
+
+    released = stalled_provider("stalled-editor")
+    configure_providers([{"name": "stalled-editor"}])
+    try:
+        async def stop_early():
+            task = asyncio.ensure_future(async_engine.update_code_async(code, "add a footer"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            return await task
+
+        result = asyncio.run(stop_early())
+        assert not released.is_set()
+    finally:
+        released.set()
+        configure_providers()
+    assert result.status == async_engine.CANCELLED and result.code == ""
+
+
+def test_async_generation_honours_deadline_and_cancellation():
+    from core import async_engine
+    from core.providers import configure_providers
+
+    released = stalled_provider("stalled-deadline")
+    configure_providers([{"name": "stalled-deadline"}])
+    try:
+        result = asyncio.run(async_engine.generate_code_async("Create a pricing page", timeout=0.1, use_cache=False))
+        assert result.status == async_engine.TIMEOUT and result.error == "Timed out after 0.1s."
+        assert not released.is_set()
+
+        task = async_engine.submit(async_engine.generate_code_async("Create a pricing page", use_cache=False))
+        assert task.cancel()
+    finally:
+        released.set()
+        configure_providers()
+
+    configure_providers([{"name": "local"}])
+    try:
+        result = asyncio.run(async_engine.generate_code_async("Create a pricing page", use_cache=False))
+    finally:
+        configure_providers()
+    assert result.ok and result.provider == "local"
+
+
+def test_async_results_reach_tk_only_through_its_own_poll():
+    from core import async_engine
+    from core.providers import configure_providers
+
+    class FakeWidget:
+        def __init__(self):
+            self.polls = []
+            self.threads = set()
+
+        def after(self, delay, callback):
+            self.threads.add(threading.current_thread())
+            self.polls.append(callback)
+
+    widget = FakeWidget()
+    bridge = async_engine.TkAsyncBridge(widget)
+    results = []
+    configure_providers([{"name": "local"}])
+    try:
+        bridge.submit(async_engine.generate_code_async("Create a pricing page", use_cache=False),
+                      on_done=results.append)
+        # The loop thread only queues the result; polls run on this (the Tk) thread and deliver it
+        for _ in range(500):
+            widget.polls[-1]()
+            if results:
+                break
+            time.sleep(0.01)
+    finally:
+        configure_providers()
+
+    assert widget.threads == {threading.current_thread()}
+    assert len(results) == 1 and results[0].ok
+
+
+def test_variants_run_concurrently_with_distinct_temperatures():
+    from core.providers import configure_providers
+    from core.resilience import configure_resilience
+
+    # Each request waits until all four are in flight, so running them one at a time would break the barrier
+    all_started = threading.Barrier(4, timeout=5)
+
+    @register_provider
+    class GatheringProvider(LocalProvider):
+        name = "gathering"
+
+        def generate(self, prompt, api_key=None, operation="generate"):
+            all_started.wait()
+            return super().generate(prompt, api_key, operation)
+
+    configure_resilience({"gathering": {"rate": 0}})
+    configure_providers([{"name": "gathering"}])
+    seen = []
+    try:
+        variants = ai_engine.generate_variants("Create a blog", 4, on_variant=seen.append)
+        configure_providers([{"name": "local"}])
+        enhanced = ai_engine.generate_variants("login", 4, enhance=True)
+        code = ai_engine.generate_code_from_prompt("login", use_cache=False, enhance=True)
+    finally:
+        configure_providers()
+        configure_resilience()
+
+    assert not all_started.broken
+    assert [variant["index"] for variant in variants] == [0, 1, 2, 3]
+    assert len(seen) == 4 and all(variant["status"] == "ok" for variant in variants)
+    assert len({variant["code"] for variant in variants}) == 4
+    assert [variant["temperature"] for variant in variants] == list(ai_engine.DEFAULT_VARIANT_TEMPERATURES)
+    assert all(variant["refined_prompt"] is None for variant in variants)
+    # Enhancement works as for a single generation, which still returns one document
+    assert all(variant["refined_prompt"].startswith("login. Use a responsive layout") for variant in enhanced)
+    assert isinstance(code, str) and "<h1>" in code
+
+
+def test_status_bus_publishes_typed_events_for_a_streamed_request():
+    from core import status_bus
+    from core.providers import configure_providers
+
+    events = []
+    token = ai_engine.status_bus.subscribe(events.append)
+    configure_providers([{"name": "local", "chunk_size": 32}])
+    try:
+        ai_engine.generate_code_from_prompt("Create a todo app", on_partial=lambda code: None, use_cache=False)
+    finally:
+        configure_providers()
+        ai_engine.status_bus.unsubscribe(token)
+
+    kinds = [event.kind for event in events]
+    assert kinds[0] == status_bus.REQUEST_STARTED
+    assert kinds.count(status_bus.CHUNK_RECEIVED) > 1
+    assert kinds[-1] == status_bus.DONE and events[-1].provider == "local"
+    assert ai_engine.get_ai_status() == {"state": "online", "message": "AI service is online."}
+
+
+def test_generation_phases_are_timed_per_provider(tmp_path):
+    from core.metrics import metrics
+    from core.providers import configure_providers
+
+    metrics.reset()
+    configure_providers([{"name": "local", "latency": 0.05}])
+    try:
+        for _ in range(3):
+            ai_engine.generate_code_from_prompt("Create a weather widget", use_cache=False)
+    finally:
+        configure_providers()
+
+    network = metrics.percentiles("network", provider="local")
+    assert network["count"] == 3 and network["p50"] >= 0.05
+    for phase in ("queue_wait", "extract_json", "inline", "total"):
+        assert metrics.percentiles(phase, provider="local", model="local-template")["count"] == 3
+
+    metrics.export(str(tmp_path))
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert 'karbon_generation_phase_seconds_count{phase="total",provider="local",model="local-template"} 3' in prom
+    assert (tmp_path / "metrics.json").exists()
+
+
+def test_generate_app_keeps_parts_and_splices_last_closing_tags():
+    from core.artifacts import GeneratedApp
+    from core.providers import configure_providers
+
+    configure_providers([{"name": "local"}])
+    try:
+        app = ai_engine.generate_app("Create a pricing table", use_cache=False)
+    finally:
+        configure_providers()
+    assert app.provider == "local" and app.html and app.css
+    assert {"request", "inline", "total"} <= set(app.timings)
+    assert app.document() == ai_engine.inline_assets({"html": app.html, "css": app.css, "js": app.js})
+    assert set(app.files()) == {"index.html", "style.css", "script.js"}
+
+    tricky = GeneratedApp(html="<html><head></head><body><p>x</p></body></html>", css="p{}",
+                          js="document.write('</body>')")
+    assert tricky.document().count("</body>") == 2
+    assert tricky.document().endswith("<script>document.write('</body>')</script></body></html>")
+    assert tricky.body_html() == "<p>x</p>"
+
+
+def test_preview_of_a_generated_app_is_built_from_its_parts(monkeypatch):
+    import contextlib
+    import io
+    import re
+
+    from core.artifacts import GeneratedApp
+    from ui_items.editor_view import EditorView
+
+    app = GeneratedApp(html="<!DOCTYPE html><html><head><title>x</title></head><body><h1>x</h1></body></html>",
+                       css="h1 { color: red; }", js="console.log('x');")
+    # The formatting helpers only use each other, so no Tk widget is needed
+    view = EditorView.__new__(EditorView)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scanned = view.format_html_for_preview(app.document())
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("the document was scanned for <style> blocks")
+
+    monkeypatch.setattr(re, "findall", no_scan)
+    assert view.format_html_for_preview(app.document(), app) == scanned
+
+
+def test_cut_off_response_is_repaired_instead_of_retried():
+    import json
+
+    from core.json_scan import repair_json_object
+    from core.providers import configure_providers
+
+    full = json.dumps({"html": "<html><head></head><body><h1>Todo</h1></body></html>", "css": "h1 { color: red; }",
+                       "js": "console.log('ready');", "name": "Todo"})
+    cut = full[:full.index("ready")]
+    repaired = repair_json_object(cut)
+    assert repaired.partial and repaired.truncated == "js" and repaired["css"] == "h1 { color: red; }"
+    assert repair_json_object('{"a": 1, "b": [1, 2,], }') == {"a": 1, "b": [1, 2]}
+    assert repair_json_object('{"html') is None
+
+    configure_providers([{"name": "local", "responses": {"Create a todo app": cut}}])
+    try:
+        app = ai_engine.generate_app("Create a todo app", retries=2, use_cache=False)
+        status = ai_engine.get_ai_status()
+        with_html_cut = json.dumps({"html": "<html><body><h1>Todo"})[:-2]
+        configure_providers([{"name": "local", "responses": {"Create a todo app": with_html_cut}}])
+        failed = ai_engine.generate_app("Create a todo app", retries=0, use_cache=False)
+    finally:
+        configure_providers()
+    assert app.partial and app.js == "" and "<h1>Todo</h1>" in app.document()
+    assert status["state"] == "online" and "cut off" in status["message"]
+    assert failed.document() == ai_engine.UNAVAILABLE_HTML
+
+
+def test_identical_concurrent_generations_share_one_provider_call():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from core.async_engine import generate_code_async, submit
+    from core.providers import configure_providers
+    from core.resilience import configure_resilience
+
+    calls = []
+    released = threading.Event()
+
+    @register_provider
+    class GatedProvider(LocalProvider):
+        name = "gated"
+
+        def generate(self, prompt, api_key=None, operation="generate"):
+            calls.append(prompt)
+            released.wait(timeout=5)
+            return super().generate(prompt, api_key, operation)
+
+        async def agenerate(self, prompt, api_key=None, operation="generate"):
+            calls.append(prompt)
+            await asyncio.to_thread(released.wait, 5)
+            return await super().agenerate(prompt, api_key, operation)
+
+    def release_once_coalesced(count):
+        # The first call holds the provider until every other caller has attached to it
+        for _ in range(500):
+            if ai_engine.get_single_flight_stats()["coalesced"].get("generate") == count:
+                break
+            time.sleep(0.01)
+        released.set()
+
+    configure_resilience({"gated": {"rate": 0}})
+    configure_providers([{"name": "gated"}])
+    ai_engine.in_flight.reset_stats()
+    try:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            pending = [pool.submit(ai_engine.generate_code_from_prompt, "Create a clock", use_cache=False)
+                       for _ in range(3)]
+            release_once_coalesced(2)
+            codes = [future.result(timeout=5) for future in pending]
+        assert len(calls) == 1
+
+        async def double_click():
+            return await asyncio.gather(*[generate_code_async("Create a clock", use_cache=False) for _ in range(2)])
+
+        released.clear()
+        pending = submit(double_click())
+        release_once_coalesced(3)
+        results = pending.result(timeout=5)
+    finally:
+        released.set()
+        configure_providers()
+        configure_resilience()
+    assert len(calls) == 2
+    assert len(set(codes)) == 1 and "<h1>Create a clock</h1>" in codes[0]
+    assert results[0].code == results[1].code and results[0] is not results[1]
+    stats = ai_engine.get_single_flight_stats()
+    assert stats["executed"] == {"generate": 2} and stats["coalesced"] == {"generate": 3}
+    assert stats["in_flight"] == 0
+
+
+def test_async_single_flight_never_shares_a_task_across_event_loops():
+    from core.async_engine import submit
+    from core.single_flight import SingleFlight
+
+    flight = SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+
+    async def held():
+        started.set()
+        await asyncio.to_thread(finish.wait, 5)
+        return asyncio.get_running_loop()
+
+    async def quick():
+        return asyncio.get_running_loop()
+
+    shared = submit(flight.ado(("generate", "k"), held))
+    assert started.wait(timeout=5)
+    # Same key on a second loop while the first call is still running there
+    other_loop = asyncio.run(flight.ado(("generate", "k"), quick))
+    finish.set()
+    assert shared.result(timeout=5) is not other_loop
+    assert flight.stats()["executed"] == {"generate": 2} and flight.stats()["in_flight"] == 0
+
+    async def cancel_then_retry():
+        never = asyncio.Event()
+        task = asyncio.ensure_future(flight.ado(("generate", "c"), never.wait))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0)
+        # The cancelled call is forgotten at once instead of being joined
+        assert flight.stats()["in_flight"] == 0
+        return await flight.ado(("generate", "c"), quick)
+
+    assert asyncio.run(cancel_then_retry()) is not None
+    assert flight.stats()["executed"] == {"generate": 4} and not flight.stats()["coalesced"]
+
+
+def test_enhanced_generation_costs_one_round_trip(monkeypatch):
+    from core.async_engine import generate_code_async, submit
+    from core.providers import LocalProvider, configure_providers
+
+    operations = []
+    render = LocalProvider.render
+    monkeypatch.setattr(LocalProvider, "render", lambda self, prompt, operation="generate": (
+        operations.append(operation), render(self, prompt, operation))[1])
+    configure_providers([{"name": "local"}])
+    try:
+        app = ai_engine.generate_app("login", use_cache=False, enhance=True)
+        result = submit(generate_code_async("dashboard", use_cache=False, enhance=True)).result(timeout=5)
+        detailed = ai_engine.generate_app("Create a recipe list with search", use_cache=False, enhance=True)
+        plain_key = ai_engine.generation_cache_key("login")
+        enhanced_key = ai_engine.generation_cache_key("login", enhance=True)
+    finally:
+        configure_providers()
+    assert operations == ["generate", "generate", "generate"]
+    assert app.refined_prompt.startswith("login. Use a responsive layout")
+    assert result.app.refined_prompt.startswith("dashboard.")
+    # Detailed prompts are used as written, so they share the plain cache entry
+    assert detailed.refined_prompt is None
+    assert plain_key != enhanced_key
+
+
+def test_short_prompts_are_enhanced_locally_and_ai_is_opt_in(monkeypatch):
+    from core import prompt_enhancer
+    from core.async_engine import optimize_prompt_async, submit
+    from core.providers import LocalProvider, configure_providers
+
+    assert [template.name for template, _ in prompt_enhancer.classify("Sign-up page")] == ["signup"]
+    spec = prompt_enhancer.enhance("landing page with pricing plans")
+    assert "Build a landing page with:" in spec and "Also include a pricing table section with:" in spec
+    assert prompt_enhancer.enhance("build ui") is None
+
+    operations = []
+    render = LocalProvider.render
+    monkeypatch.setattr(LocalProvider, "render", lambda self, prompt, operation="generate": (
+        operations.append(operation), render(self, prompt, operation))[1])
+    configure_providers([{"name": "local"}])
+    try:
+        login = ai_engine.optimize_prompt("login")
+        unknown = submit(optimize_prompt_async("build ui")).result(timeout=5)
+        assert operations == []
+        ai_engine.configure_enhancement({"ai_fallback": True})
+        assert ai_engine.plan_enhancement("pricing") == (prompt_enhancer.enhance("pricing"), False)
+        assert ai_engine.plan_enhancement("build ui") == ("build ui", True)
+        refined = ai_engine.optimize_prompt("build ui")
+    finally:
+        ai_engine.configure_enhancement({"ai_fallback": False})
+        configure_providers()
+    assert login.startswith("login.\n\nBuild a login form with:")
+    assert unknown == ai_engine.rule_based_enhancement("build ui")
+    assert operations == ["optimize"] and refined.startswith("build ui. Use a responsive layout")
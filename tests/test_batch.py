@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from core import batch
+from core.providers import configure_providers
+
+
+def test_each_run_writes_a_fresh_summary(tmp_path):
+    configure_providers([{"name": "local"}])
+    try:
+        batch.run_batch(["Create a clock", "Create a timer"], str(tmp_path), workers=2, use_cache=False)
+        results = batch.run_batch(["Create a blog"], str(tmp_path), workers=1, use_cache=False)
+    finally:
+        configure_providers()
+    lines = (tmp_path / "summary.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["prompt"] for line in lines] == ["Create a blog"]
+    assert results[0]["status"] == "ok"
+
+
+def test_launch_scripts_only_leave_for_the_batch_command(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batch, "main", lambda argv: calls.append(argv) or 0)
+    batch.exit_if_batch(["main.py"])
+    batch.exit_if_batch(["main.py", "--debug"])
+    with pytest.raises(SystemExit) as exit_info:
+        batch.exit_if_batch(["main.py", "batch", "prompts.txt", "--workers", "2"])
+    assert exit_info.value.code == 0 and calls == [["prompts.txt", "--workers", "2"]]
@@ -0,0 +1,22 @@
+from core.ai_engine import UNAVAILABLE_HTML
+from core.async_engine import CANCELLED, FAILED, OK, GenerationResult
+from ui_items.editor_view import EditorView
+
+
+def test_failed_or_cancelled_update_keeps_the_users_code():
+    # finish_update only talks to these hooks, so no Tk widget is needed
+    view = EditorView.__new__(EditorView)
+    shown = []
+    outcomes = []
+    view.set_code = shown.append
+    view.update_error = lambda message: outcomes.append(("error", message))
+    view.update_cancelled = lambda: outcomes.append(("cancelled", None))
+    view.update_complete = lambda: outcomes.append(("done", None))
+
+    view.finish_update(GenerationResult(FAILED, UNAVAILABLE_HTML, error="All attempts to use AI failed."))
+    view.finish_update(GenerationResult(CANCELLED, error="Cancelled."))
+    assert shown == []
+    assert outcomes == [("error", "All attempts to use AI failed."), ("cancelled", None)]
+
+    view.finish_update(GenerationResult(OK, "<html><body>new</body></html>"))
+    assert shown == ["<html><body>new</body></html>"] and outcomes[-1] == ("done", None)
@@ -0,0 +1,30 @@
+import logging
+
+from core import log_setup
+
+
+def test_payloads_are_truncated_and_file_rotates(tmp_path):
+    log_file = tmp_path / "engine.log"
+    log_setup.configure_logging({"file": str(log_file), "max_bytes": 4096, "backup_count": 2, "payload_chars": 50})
+    logger = logging.getLogger("core.test")
+    try:
+        for _ in range(40):
+            log_setup.log_payload(logger, "Raw AI response", "x" * 10000)
+    finally:
+        log_setup.shutdown_logging()
+
+    text = log_file.read_text()
+    assert "(10000 chars, truncated)" in text
+    assert "x" * 51 not in text
+    assert (tmp_path / "engine.log.1").exists()
+    assert not (tmp_path / "engine.log.3").exists()
+
+
+def test_debug_logs_full_payload(tmp_path):
+    log_file = tmp_path / "engine.log"
+    log_setup.configure_logging({"file": str(log_file), "debug": True})
+    try:
+        log_setup.log_payload(logging.getLogger("core.test"), "Raw AI response", "y" * 2000)
+    finally:
+        log_setup.shutdown_logging()
+    assert "y" * 2000 in log_file.read_text()
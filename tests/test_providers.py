@@ -0,0 +1,152 @@
+from core import ai_engine
+from core.providers import configure_providers, get_providers, load_providers
+
+
+def test_load_providers_respects_order_and_enabled():
+    providers = load_providers([
+        {"name": "local"}, {"name": "meta_ai", "enabled": False}, {"name": "nope"}, {"name": "gemini"}
+    ])
+    assert [p.name for p in providers] == ["local", "gemini"]
+
+
+def test_gemini_is_skipped_without_api_key():
+    configure_providers([{"name": "gemini"}, {"name": "local"}])
+    try:
+        assert [p.name for p in get_providers(None)] == ["local"]
+        assert [p.name for p in get_providers("key")] == ["gemini", "local"]
+    finally:
+        configure_providers()
+
+
+def test_pipeline_runs_offline_with_local_provider():
+    configure_providers([{"name": "local", "chunk_size": 16}])
+    try:
+        code = ai_engine.generate_code_from_prompt("Create a login page", use_cache=False)
+        partials = []
+        streamed = ai_engine.generate_code_from_prompt(
+            "Create a login page", use_cache=False, on_partial=partials.append)
+    finally:
+        configure_providers()
+    assert "<h1>Create a login page</h1>" in code
+    assert "<style>" in code and "<script>" in code
+    assert streamed == code
+
+
+def test_gemini_clients_are_reused_until_the_key_changes(monkeypatch):
+    import google.generativeai as genai
+    from core import providers
+
+    configured = []
+    monkeypatch.setattr(genai, "configure", lambda api_key: configured.append(api_key))
+    monkeypatch.setattr(genai, "GenerativeModel", lambda model: object())
+    monkeypatch.setattr(providers.GeminiProvider, "_configured_key", None)
+    gemini = providers.create_provider("gemini")
+
+    first = gemini._client("key-a")
+    assert gemini._client("key-a") is first
+    assert gemini._client("key-b") is not first
+    assert configured == ["key-a", "key-b"]
+    providers.client_pool.invalidate()
+
+
+def test_meta_ai_starts_a_new_conversation_on_a_client_of_its_own(monkeypatch):
+    import itertools
+    import sys
+    import types
+
+    from core import providers
+
+    conversation_ids = itertools.count(1)
+    sent = []
+
+    class FakeMetaAI:
+        def __init__(self):
+            self.external_conversation_id = None
+            self.session = types.SimpleNamespace(closed=False)
+            self.session.close = lambda: setattr(self.session, "closed", True)
+
+        def prompt(self, message, stream=False, new_conversation=False):
+            if self.external_conversation_id is None or new_conversation:
+                self.external_conversation_id = next(conversation_ids)
+            sent.append((self, self.external_conversation_id))
+            return {"message": message.upper()}
+
+    monkeypatch.setitem(sys.modules, "meta_ai_api", types.SimpleNamespace(MetaAI=FakeMetaAI))
+    meta_ai = providers.create_provider("meta_ai")
+    try:
+        assert meta_ai.generate("first") == "FIRST"
+        assert meta_ai.generate("second") == "SECOND"
+        (first, first_id), (second, second_id) = sent
+        assert first is second and first_id != second_id
+
+        # A client in use is never shared, and aborting its call leaves the other clients alone
+        busy = providers.client_pool.checkout(meta_ai._pool_key(), FakeMetaAI)
+        meta_ai.generate("third")
+        third = sent[-1][0]
+        assert busy is first and third is not busy
+        meta_ai.abort([busy])
+        assert busy.session.closed and not third.session.closed
+    finally:
+        providers.client_pool.invalidate()
+
+
+def test_cassette_replays_recorded_responses_without_latency(tmp_path, monkeypatch):
+    import pytest
+    from core import cassettes
+    from core.cassettes import Cassette, CassetteMissError, RECORD, REPLAY, ZERO
+    from core.usage import ledger
+
+    path = str(tmp_path / "cassette.json")
+    configure_providers([{"name": "local", "latency": 0.2, "chunk_size": 32}], wrapper=Cassette(path, RECORD).wrap)
+    try:
+        recorded = ai_engine.generate_code_from_prompt("Create a login page", use_cache=False)
+        streamed = ai_engine.generate_code_from_prompt("Create a login page", use_cache=False, on_partial=lambda code: None)
+
+        replay = Cassette(path, REPLAY, ZERO)
+        assert replay.provider_settings() == [{"name": "local", "model": "local-template"}]
+        configure_providers(replay.provider_settings(), wrapper=replay.wrap)
+        billed = len(list(ledger.records()))
+        waits = []
+        monkeypatch.setattr(cassettes.time, "sleep", waits.append)
+        assert ai_engine.generate_code_from_prompt("Create a login page", use_cache=False) == recorded
+        assert ai_engine.generate_code_from_prompt("Create a login page", use_cache=False,
+                                                   on_partial=lambda code: None) == streamed
+        # The recorded 0.2 s latency is skipped in ZERO mode
+        assert waits == []
+        with pytest.raises(CassetteMissError):
+            get_providers()[0].generate("never recorded")
+        # Replayed answers are not spend
+        assert len(list(ledger.records())) == billed
+    finally:
+        configure_providers()
+    assert replay.stats()["hits"] == 2 and replay.stats()["interactions"] == 2
+
+
+def test_gemini_requests_schema_constrained_json(monkeypatch):
+    import json
+
+    import google.generativeai as genai
+    from core import providers
+
+    configs = []
+
+    class FakeModel:
+        def generate_content(self, prompt, generation_config=None):
+            configs.append(generation_config)
+            payload = {"html": "<html><head></head><body></body></html>", "css": "", "js": "", "name": "x"}
+            return type("Response", (), {"text": json.dumps(payload), "usage_metadata": None})()
+
+    monkeypatch.setattr(genai, "configure", lambda api_key: None)
+    monkeypatch.setattr(genai, "GenerativeModel", lambda model: FakeModel())
+    monkeypatch.setattr(providers.GeminiProvider, "_configured_key", None)
+    configure_providers([{"name": "gemini", "temperature": 0.4}])
+    try:
+        ai_engine.generate_code_from_prompt("Create a login page", api_key="key", use_cache=False)
+        providers.create_provider("gemini", structured_output=False).generate("hi", "key")
+        providers.create_provider("gemini").generate("hi", "key", operation="optimize")
+    finally:
+        configure_providers()
+        providers.client_pool.invalidate()
+    assert configs[0]["response_mime_type"] == "application/json" and configs[0]["temperature"] == 0.4
+    assert configs[0]["response_schema"]["required"] == ["html", "css", "js", "name"]
+    assert configs[1] is None and configs[2] is None
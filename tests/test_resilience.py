@@ -0,0 +1,86 @@
+import asyncio
+
+from core import ai_engine
+from core.resilience import CIRCUIT_OPEN, HALF_OPEN, OPEN, RATE_LIMITED, configure_resilience, guard_for
+
+
+def test_open_circuit_skips_failing_provider_without_backoff(monkeypatch):
+    from core.providers import LocalProvider, configure_providers, register_provider
+
+    calls = []
+
+    @register_provider
+    class BrokenProvider(LocalProvider):
+        name = "broken"
+
+        def generate(self, prompt, api_key=None, operation="generate"):
+            calls.append(prompt)
+            raise ConnectionError("backend down")
+
+    delays = []
+    backoff_delay = ai_engine.backoff_delay
+    monkeypatch.setattr(ai_engine, "backoff_delay", lambda *args: delays.append(backoff_delay(*args)) or delays[-1])
+    configure_resilience({"broken": {"rate": 0, "failure_threshold": 2, "recovery_timeout": 60}})
+    configure_providers([{"name": "broken"}])
+    try:
+        for _ in range(2):
+            ai_engine.generate_code_from_prompt("page", retries=0, use_cache=False)
+        assert guard_for("broken").breaker.state == OPEN and len(calls) == 2
+
+        code = ai_engine.generate_code_from_prompt("page", retries=2, use_cache=False)
+        assert code == ai_engine.UNAVAILABLE_HTML
+        # Nothing was sent and no retry was waited for
+        assert len(calls) == 2 and delays == [None]
+        assert ai_engine.get_ai_status()["state"] == "offline"
+    finally:
+        configure_providers()
+        configure_resilience()
+
+
+def test_breaker_is_asked_before_a_token_is_spent():
+    configure_resilience({"limited": {"rate": 1, "burst": 1, "max_wait": 0, "failure_threshold": 1,
+                                      "recovery_timeout": 60}})
+    try:
+        guard = guard_for("limited")
+        guard.breaker.record_failure()
+        assert guard.admit() == CIRCUIT_OPEN
+        assert asyncio.run(guard.admit_async()) == CIRCUIT_OPEN
+        # The refused calls left the only token in the bucket
+        assert guard.bucket.try_acquire()
+
+        # A half-open trial refused for want of a token is given back
+        guard.breaker.recovery_timeout = 0
+        assert guard.admit() == RATE_LIMITED and guard.breaker.is_available()
+        assert asyncio.run(guard.admit_async()) == RATE_LIMITED and guard.breaker.is_available()
+    finally:
+        configure_resilience()
+
+
+def test_abandoned_stream_gives_back_half_open_trial():
+    import pytest
+    from core.providers import configure_providers
+
+    def stop_reading(code):
+        raise RuntimeError("preview window closed")
+
+    # Without a recovery timeout a failed breaker is half-open straight away
+    configure_resilience({"local": {"rate": 0, "failure_threshold": 1, "recovery_timeout": 0}})
+    configure_providers([{"name": "local", "chunk_size": 16}])
+    try:
+        breaker = guard_for("local").breaker
+        for abandon in ("close", "on_partial"):
+            breaker.record_failure()
+            assert breaker.state == HALF_OPEN
+            if abandon == "close":
+                stream = ai_engine.stream_code_from_prompt("Create a clock", use_cache=False)
+                next(stream)
+                stream.close()
+            else:
+                with pytest.raises(RuntimeError):
+                    ai_engine.generate_code_from_prompt("Create a clock", use_cache=False, on_partial=stop_reading)
+            assert breaker.state == HALF_OPEN and breaker.is_available()
+        code = ai_engine.generate_code_from_prompt("Create a clock", retries=0, use_cache=False)
+    finally:
+        configure_providers()
+        configure_resilience()
+    assert code != ai_engine.UNAVAILABLE_HTML
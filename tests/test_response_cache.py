@@ -0,0 +1,94 @@
+import time
+
+from core.response_cache import ResponseCache, make_cache_key
+
+
+def test_key_ignores_case_and_whitespace():
+    assert make_cache_key("Create  a Login page", "gemini", "m", 1) == \
+        make_cache_key("create a login page ", "gemini", "m", 1)
+    assert make_cache_key("login", "gemini", "m", 1) != make_cache_key("login", "gemini", "m", 2)
+
+
+def test_lru_eviction_and_counters(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_bytes=200)
+    cache.put("a", "x" * 60)
+    cache.put("b", "y" * 60)
+    assert cache.get("a") == "x" * 60  # a is now most recently used
+    cache.put("c", "z" * 60)
+    assert cache.get("b") is None
+    assert cache.get("c") == "z" * 60
+    assert ResponseCache(cache_dir=str(tmp_path)).get("a") == "x" * 60
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_ttl_expiry(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl_seconds=0.01)
+    cache.put("a", "value")
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_reworded_prompt_matches_similar_entry(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    cache.put("login", "<login/>")
+    cache.similar.add("create a login page", "login", "local")
+    cache.similar.add("dashboard with sales charts", "dashboard", "local")
+
+    match = cache.similar.find("Make a login page please", "local")
+    assert match.key == "login" and match.score >= cache.similar.threshold
+    assert match.latency_ms >= 0
+    assert cache.similar.find("signup form with captcha", "local") is None
+    assert cache.similar.find("create a login page", "gemini") is None
+
+    reloaded = ResponseCache(cache_dir=str(tmp_path))
+    assert reloaded.similar.find("login pages", "local").key == "login"
+
+
+def test_exact_repeat_is_not_offered_as_similar(tmp_path, monkeypatch):
+    from core import ai_engine
+    from core.providers import configure_providers
+
+    monkeypatch.setattr(ai_engine, "response_cache", ResponseCache(cache_dir=str(tmp_path)))
+    configure_providers([{"name": "local"}])
+    try:
+        ai_engine.generate_code_from_prompt("create a login page")
+        # The exact entry answers repeats by itself; only a different earlier prompt is worth offering
+        assert ai_engine.find_similar_generation("create a login page") is None
+        match, code = ai_engine.find_similar_generation("Make a login page please")
+        assert match.key == ai_engine.generation_cache_key("create a login page") and "login" in code
+    finally:
+        configure_providers()
+
+
+def test_hits_are_written_lazily(tmp_path, monkeypatch):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_bytes=200)
+    cache.put("a", "x" * 60)
+    cache.put("b", "y" * 60)
+    writes = []
+    save_index = cache._save_index
+    monkeypatch.setattr(cache, "_save_index", lambda: writes.append(1) or save_index())
+    for _ in range(5):
+        assert cache.get("a") == "x" * 60
+    assert writes == []
+
+    # A fresh process only learns that a was used once the access times are flushed
+    cache.flush()
+    reloaded = ResponseCache(cache_dir=str(tmp_path), max_bytes=200)
+    reloaded.put("c", "z" * 60)
+    assert reloaded.get("b") is None and reloaded.get("a") == "x" * 60
+
+
+def test_evicted_entries_leave_the_similar_prompt_index(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_bytes=100)
+    cache.put("login", "x" * 60)
+    cache.similar.add("create a login page", "login", "local")
+    cache.put("signup", "y" * 60)
+    assert cache.similar.find("create a login page", "local") is None
+    assert cache.similar.stats()["entries"] == 0
+
+    cache = ResponseCache(cache_dir=str(tmp_path / "ttl"), ttl_seconds=60)
+    cache.put("login", "x")
+    cache.similar.add("create a login page", "login", "local")
+    cache._index["login"]["created"] -= 120
+    assert cache.get("login") is None
+    assert cache.similar.find("create a login page", "local") is None
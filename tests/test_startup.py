@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROVIDER_SDKS = ("google.generativeai", "meta_ai_api")
+
+
+def _run_fresh(code: str) -> list:
+    """Run code in a new interpreter (nothing imported yet) and return its output lines"""
+    code += f"\nprint(','.join(name for name in {PROVIDER_SDKS!r} if name in sys.modules))\n"
+    result = subprocess.run([sys.executable, "-c", "import sys\n" + code], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()
+
+
+def test_importing_the_engine_does_not_load_provider_sdks():
+    assert _run_fresh("import core.async_engine")[-1] == ""
+
+
+def test_opening_the_window_module_does_not_load_provider_sdks():
+    missing, loaded = _run_fresh(
+        "try:\n"
+        "    import ui_items.karbon_ui\n"
+        "    print('')\n"
+        "except ModuleNotFoundError as e:\n"
+        "    print(e.name)"
+    )[-2:]
+    if missing and missing not in PROVIDER_SDKS:
+        pytest.skip(f"the window module needs {missing}")
+    assert missing == "" and loaded == ""
+
+
+def test_prewarm_loads_only_the_active_provider_sdks():
+    loaded = _run_fresh(
+        "from core.providers import create_provider, prewarm_providers\n"
+        "prewarm_providers([create_provider('gemini'), create_provider('local')]).join(timeout=30)"
+    )[-1]
+    assert loaded == "google.generativeai"
@@ -0,0 +1,46 @@
+import threading
+
+from core.status_bus import CHUNK_RECEIVED, StatusBus, StatusEvent, TkStatusDrain
+
+
+class FakeWidget:
+    """Records after() calls instead of running a Tk loop"""
+
+    def __init__(self):
+        self.scheduled = []
+        self.threads = set()
+
+    def after(self, delay, callback):
+        self.threads.add(threading.current_thread())
+        self.scheduled.append(callback)
+        return len(self.scheduled)
+
+    def after_cancel(self, poll):
+        self.scheduled[poll - 1] = None
+
+    def run_next(self):
+        self.scheduled[-1]()
+
+
+def test_workers_only_queue_events_for_the_tk_thread():
+    bus = StatusBus()
+    widget = FakeWidget()
+    handled = []
+    drain = TkStatusDrain(widget, bus, handled.append)
+
+    workers = [threading.Thread(target=bus.publish, args=(StatusEvent(CHUNK_RECEIVED, "generating", str(n)),))
+               for n in range(20)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert handled == [] and widget.threads == {threading.current_thread()}
+
+    # One poll hands the whole burst over and schedules the next poll
+    widget.run_next()
+    assert sorted(int(event.message) for event in handled) == list(range(20))
+    assert len(widget.scheduled) == 2
+
+    drain.close()
+    bus.publish(StatusEvent(CHUNK_RECEIVED, "generating", "late"))
+    assert widget.scheduled[-1] is None and len(handled) == 20
@@ -0,0 +1,23 @@
+import json
+
+from core.streaming import PartialJSONFieldParser, render_partial_document
+
+
+def test_parser_matches_json_loads_for_any_chunking():
+    payload = {"html": "<html><head></head><body>\"hi\" é \U0001F600</body></html>",
+               "css": "body { color: red; }", "js": "console.log('a\\nb');", "name": "Demo"}
+    response = "```json\n" + json.dumps(payload) + "\n```"
+    for size in (1, 3, 7, len(response)):
+        parser = PartialJSONFieldParser()
+        for i in range(0, len(response), size):
+            parser.feed(response[i:i + size])
+        assert parser.fields_so_far() == payload
+        assert parser.completed == set(payload)
+
+
+def test_partial_document_withholds_incomplete_js():
+    parser = PartialJSONFieldParser()
+    parser.feed('{"html": "<html><head></head><body></body></html>", "css": "h1 {}", "js": "alert(')
+    document = render_partial_document(parser.fields_so_far(), parser.completed)
+    assert "<style>h1 {}</style></head>" in document
+    assert "<script>" not in document
@@ -0,0 +1,45 @@
+from core import ai_engine
+from core.providers import configure_providers, create_provider
+from core.usage import UsageLedger, capture_reported_usage, ledger, report_usage
+
+
+def test_calls_are_recorded_per_user_and_operation():
+    path = ledger.path
+    ledger.configure({"prices": {"local-template": {"input": 1.0, "output": 2.0}}})
+    ledger.set_user("alice")
+    configure_providers([{"name": "local"}])
+    try:
+        ai_engine.generate_code_from_prompt("Create a login page", use_cache=False)
+        # Only prompts no local template recognizes reach a provider, and only when opted in
+        ai_engine.configure_enhancement({"ai_fallback": True})
+        ai_engine.optimize_prompt("build ui")
+        ledger.set_user("bob")
+        with capture_reported_usage() as reported:
+            report_usage(prompt_tokens=120, completion_tokens=30)
+        ledger.record_call(create_provider("local"), "update", "prompt", "response", reported)
+    finally:
+        ai_engine.configure_enhancement({"ai_fallback": False})
+        configure_providers()
+
+    # A fresh ledger reads the same append-only file
+    rows = {row["operation"]: row for row in UsageLedger(path).summary(("user", "operation"))}
+    assert rows["generate"]["user"] == "alice" and rows["generate"]["estimated_calls"] == 1
+    assert rows["optimize"]["calls"] == 1
+    update = rows["update"]
+    assert (update["user"], update["prompt_tokens"], update["completion_tokens"]) == ("bob", 120, 30)
+    assert update["estimated_calls"] == 0 and update["cost"] == (120 * 1.0 + 30 * 2.0) / 1_000_000
+
+
+def test_signed_in_user_is_attributed_usage_and_metrics():
+    import os
+    import pytest
+    from core.metrics import metrics
+    # The window module needs the full UI dependencies (Pillow, GitPython, ...)
+    KarbonUI = pytest.importorskip("ui_items.karbon_ui").KarbonUI
+    from user_manager import USERS_DIR
+
+    # set_user needs no widgets, so the window is never built
+    KarbonUI.__new__(KarbonUI).set_user("alice")
+    ledger.record_call(create_provider("local"), "generate", "prompt", "response")
+    assert [row["user"] for row in ledger.records()] == ["alice"]
+    assert metrics.export_dir == os.path.join(USERS_DIR, "alice", "metrics")
@@ -1,3 +1,9 @@
+from core.batch import exit_if_batch
+
+# "karbon batch ..." generates prompts headlessly without opening any window
+if __name__ == "__main__":
+    exit_if_batch()
+
 import tkinter as tk
 from ui_items.karbon_ui import KarbonUI
 from user_manager import select_or_create_user
@@ -9,6 +15,7 @@ if __name__ == "__main__":
     # Launch Tkinter UI
     root = tk.Tk()
     app = KarbonUI(root, user=CURRENT_USER)
+    root.protocol("WM_DELETE_WINDOW", app.close)
     root.mainloop()
 import tkinter as tk
 
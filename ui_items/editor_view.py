@@ -1,11 +1,13 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import threading
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import webbrowser
 import tempfile
 import os
 # from code_editor_ui import update_preview
-from core.ai_engine import generate_code_from_prompt, ai_status
+from core.ai_engine import get_ai_status
+from core.artifacts import GeneratedApp
+from core.async_engine import CANCELLED, TkAsyncBridge, regenerate_target_async, update_code_async
+from core.regions import resolve_region
 from exporters.exporter import export_code
 from core import prompt_history
 try:
@@ -21,6 +23,14 @@ try:
 except ImportError:
     WEBVIEW_AVAILABLE = False
 
+UPDATE_PLACEHOLDER = (
+    "Describe what you'd like to change...\n\n"
+    "Example: Make the header purple, add a contact form, or change the font to something more modern"
+)
+
+# Baseline styling for previews of pages that bring no css of their own
+PREVIEW_BASE_CSS = "body { margin: 0; padding: 20px; font-family: Arial, sans-serif; }"
+
 # Alternative HTML rendering method using webbrowser
 def open_html_in_browser(html_content, title="Preview"):
     """Open HTML content in default browser for better CSS support"""
@@ -74,13 +84,17 @@ class SimpleEmbeddedPreview:
 
 
 class EditorView(tk.Frame):
-    def __init__(self, master, get_code_callback, set_code_callback, get_api_key_callback, get_model_source_callback):
+    def __init__(self, master, get_code_callback, set_code_callback, get_api_key_callback, get_model_source_callback,
+                 get_app_callback=None):
         super().__init__(master, bg='#0d1117')
         self.get_code = get_code_callback
         self.set_code = set_code_callback
+        self.get_app = get_app_callback or (lambda: None)
         self.get_api_key = get_api_key_callback
         self.get_model_source = get_model_source_callback
         self.is_updating = False
+        self.update_task = None
+        self.async_bridge = TkAsyncBridge(self)
         self.export_as_zip_var = tk.BooleanVar(value=False)
 
         # Store references to important UI elements for update_appearance
@@ -191,6 +205,39 @@ class EditorView(tk.Frame):
         )
         self.update_btn.pack(side="left")
 
+        self.region_btn = tk.Button(
+            button_container,
+            text="🎯 Edit Region",
+            font=("Segoe UI", 11, "bold"),
+            bg='#1f6feb',
+            fg='white',
+            activebackground='#2f81f7',
+            activeforeground='white',
+            relief='flat',
+            bd=0,
+            padx=25,
+            pady=10,
+            cursor='hand2',
+            command=self.handle_region_update
+        )
+        self.region_btn.pack(side="left", padx=(10, 0))
+
+        self.stop_update_btn = tk.Button(
+            button_container,
+            text="⏹ Stop",
+            font=("Segoe UI", 11, "bold"),
+            bg='#da3633',
+            fg='white',
+            activebackground='#f85149',
+            activeforeground='white',
+            relief='flat',
+            bd=0,
+            padx=25,
+            pady=10,
+            cursor='hand2',
+            command=self.stop_update
+        )
+
         self.undo_btn = tk.Button(
             button_container,
             text="⏪ Undo",
@@ -627,7 +674,7 @@ class EditorView(tk.Frame):
         self.status_bar_label.configure(text=message)  # Reference the instance variable
         self.activity_indicator_label.configure(text=activity)  # Reference the instance variable
 
-    def handle_update(self):
+    def handle_update(self, target=None):
         if self.is_updating:
             return
 
@@ -641,7 +688,7 @@ class EditorView(tk.Frame):
             prompt_history.pop_code()
             prompt_history.push_prompt(prompt)
 
-        self.start_update(prompt)
+        self.start_update(prompt, target)
         self.redo_btn.config(
             bg="#1f6feb",
             state="disabled",
@@ -655,6 +702,34 @@ class EditorView(tk.Frame):
             state="active"
         )
 
+    def handle_region_update(self):
+        """Regenerate only one element or line range of the current code"""
+        if self.is_updating:
+            return
+
+        prompt = self.update_text.get("1.0", "end-1c").strip()
+        if not prompt or prompt == self.update_placeholder:
+            self.show_error("Please describe what changes you'd like to make! 🔄")
+            return
+
+        code = self.get_code()
+        if not code:
+            self.show_error("No code to edit! Generate a website first.")
+            return
+
+        target = simpledialog.askstring(
+            "Edit Region",
+            "Element to change (e.g. nav, #hero, .card) or line range (e.g. 10-25):",
+            parent=self
+        )
+        if not target:
+            return
+        if resolve_region(code, target) is None:
+            self.show_error(f"Could not find '{target}' in the current code.")
+            return
+
+        self.handle_update(target=target.strip())
+
     def handle_undo(self):
         if (prompt_history.undo() == 0):
             self.undo_btn.config(
@@ -689,7 +764,7 @@ class EditorView(tk.Frame):
         self.update_text.delete("1.0", "end")
         self.update_text.insert("1.0", prompt_history.get_current_prompt())
 
-    def start_update(self, prompt):
+    def start_update(self, prompt, target=None):
         self.is_updating = True
 
         self.update_btn.configure(
@@ -699,51 +774,99 @@ class EditorView(tk.Frame):
             fg='white'          
         )
 
-        self.update_status("Applying your changes...", "🔄")
+        self.update_status(f"Applying your changes to {target}..." if target else "Applying your changes...", "🔄")
         self.preview_status.configure(text="● Updating", fg='#f79c42')
 
-        def update_in_background():
-            try:
-                api_key = self.get_api_key()
-                code = generate_code_from_prompt(prompt, api_key)
-                prompt_history.push_code(code)
-                prompt_history.push_prompt(
-                    "Describe what you'd like to change...\n\nExample: Make the header purple, add a contact form, or change the font to something more modern"
-                )
-                prompt_history.push_code(code)
-
-                # This must be done in the main thread
-                self.after(0, lambda: self.set_code(code))
-                
-                from code_editor_ui import update_preview
-                update_preview(code)
+        self.stop_update_btn.pack(side="left", padx=(10, 0), after=self.region_btn)
 
-                self.after(0, self.update_complete)
+        # Read Tk state here on the main thread; the request itself runs on the shared AI event loop
+        api_key = self.get_api_key()
+        code = self.get_code()
+        if target:
+            update = regenerate_target_async(code, target, prompt, api_key)
+        else:
+            update = update_code_async(code, prompt, api_key,
+                                       on_partial=lambda partial: self.async_bridge.call_soon(self.show_partial_code,
+                                                                                               partial))
+        self.update_task = self.async_bridge.submit(
+            update,
+            on_done=self.finish_update,
+            on_error=lambda exc: self.update_error(str(exc))
+        )
 
-            # except Exception as e:
-            #     self.after(0, lambda: self.update_error(str(e)))
-            except Exception as e:
-                error_message = str(e)
-                self.after(0, lambda: self.update_error(error_message))
+    def finish_update(self, result):
+        self.update_task = None
+        if result.status == CANCELLED:
+            self.update_cancelled()
+            return
+        if not result.ok:
+            # A failed update has nothing better than what the user already has; keep their code
+            self.update_error(result.error or "The AI could not apply this change.")
+            return
+        code = result.code
+        prompt_history.push_code(code)
+        prompt_history.push_prompt(UPDATE_PLACEHOLDER)
+        prompt_history.push_code(code)
+        # set_code refreshes the previews as well
+        self.set_code(code)
+        self.update_complete()
+
+    def stop_update(self):
+        # Cancels the in-flight provider request too, not just the UI wait
+        if self.update_task is not None and self.update_task.cancel():
+            self.update_task = None
+            self.update_cancelled()
+
+    def update_cancelled(self):
+        self.restore_update()
+        self.reset_update_button()
+        self.update_status("Update cancelled", "⏹")
+        self.preview_status.configure(text="● Live", fg='#3fb950')
 
-        threading.Thread(target=update_in_background, daemon=True).start()
+    def restore_update(self):
+        """Leave the editor as it was before an update that did not finish"""
+        # handle_update already swapped the placeholder for the instruction; put the history back
+        prompt_history.pop_prompt()
+        prompt_history.push_prompt(UPDATE_PLACEHOLDER)
+        prompt_history.push_code(self.get_code())
+        # Replace any streamed partial preview with the code that is still current
+        self.show_partial_code(self.get_code())
 
-    def update_complete(self):
+    def reset_update_button(self):
         self.is_updating = False
-
+        self.stop_update_btn.pack_forget()
         self.update_btn.configure(
             text="🔄 Update Code",
             state='normal',
-            bg='#1f6feb', 
-            fg = 'white'
+            bg='#1f6feb',
+            fg='white'
         )
+
+    def show_partial_code(self, html_code):
+        """Render a partially streamed document while generation is still running"""
+        self.preview_status.configure(text="● Streaming", fg='#f79c42')
+        try:
+            if HTML_AVAILABLE and getattr(self, 'html_preview', None) is not None:
+                self.html_preview.set_html(self.create_simple_html_preview(html_code))
+            if WEBVIEW_AVAILABLE:
+                from utils.preview import is_preview_ready, update_preview
+                if is_preview_ready():
+                    update_preview(html_code)
+        except Exception as e:
+            print(f"Error showing partial preview: {e}")
+
+    def update_complete(self):
+        self.reset_update_button()
         self.update_status("Changes applied successfully!", "✅")
         self.preview_status.configure(text="● Live", fg='#3fb950')
 
         self.update_stats()
 
-        status = ai_status.get("state", "unknown")
-        message = ai_status.get("message", "")
+        current = get_ai_status()
+
+        status = current["state"]
+
+        message = current["message"]
         if status != "online":
             if status == "offline":
                 self.show_error(
@@ -759,19 +882,17 @@ class EditorView(tk.Frame):
         self.clear_update_input()
 
     def update_error(self, error_msg):
-        self.is_updating = False
-
-        self.update_btn.configure(
-            text="🔄 Update Code",
-            state='normal',
-            bg='#1f6feb',
-            fg = 'white'
-        )
+        self.update_task = None
+        self.restore_update()
+        self.reset_update_button()
         self.update_status("Update failed", "❌")
         self.preview_status.configure(text="● Error", fg='#f85149')
         
-        status = ai_status.get("state", "unknown")
-        message = ai_status.get("message", "")
+        current = get_ai_status()
+        
+        status = current["state"]
+        
+        message = current["message"]
         # print(f"status is :{status}, msg: {message}")
         
         if status == "offline":
@@ -791,7 +912,7 @@ class EditorView(tk.Frame):
         export_as_zip = self.export_as_zip_var.get()
 
         try:
-            export_code(code, as_zip=export_as_zip)
+            export_code(code, as_zip=export_as_zip, app=self.get_app())
             if export_as_zip:
                 self.show_success("Code exported successfully as ZIP! 📦")
                 self.update_status("Exported ZIP file", "📦")
@@ -934,7 +1055,7 @@ class EditorView(tk.Frame):
             if current_code:
                 if WEBVIEW_AVAILABLE and hasattr(self, 'embedded_browser'):
                     # Use simple embedded preview that opens in browser
-                    formatted_html = self.format_html_for_preview(current_code)
+                    formatted_html = self.format_html_for_preview(current_code, self.get_app())
                     if self.embedded_browser.update_content(formatted_html):
                         self.preview_status.configure(text="● Refreshed", fg='#3fb950')
                         self.show_success("Preview opened in browser with full CSS support!")
@@ -943,12 +1064,13 @@ class EditorView(tk.Frame):
                             
                 elif HTML_AVAILABLE and hasattr(self, 'html_preview'):
                     # Use tkhtmlview fallback
-                    simple_html = self.create_simple_html_preview(current_code)
+                    app = self.get_app()
+                    simple_html = self.create_simple_html_preview(current_code, app)
                     self.html_preview.set_html(simple_html)
                     self.preview_status.configure(text="● Refreshed", fg='#3fb950')
                     
                     # Also open in browser for guaranteed rendering
-                    formatted_html = self.format_html_for_preview(current_code)
+                    formatted_html = self.format_html_for_preview(current_code, app)
                     temp_file = open_html_in_browser(formatted_html, "Karbon Preview")
                     
                     if temp_file:
@@ -971,8 +1093,10 @@ class EditorView(tk.Frame):
         except Exception as e:
             print(f"Error checking preview rendering: {e}")
 
-    def format_html_for_preview(self, html_code):
+    def format_html_for_preview(self, html_code, app=None):
         """Format HTML code for proper rendering in the preview"""
+        if app is not None and app.html:
+            return self.format_app_for_preview(app)
         try:
             print(f"Original HTML length: {len(html_code)}")
             print(f"HTML starts with: {html_code[:100]}...")
@@ -995,6 +1119,17 @@ class EditorView(tk.Frame):
             print(f"Error formatting HTML: {e}")
             return html_code
 
+    def format_app_for_preview(self, app):
+        """Preview page built from a generation's separate html/css/js; the css goes straight into <head>,
+        so the document never has to be searched for <style> blocks"""
+        try:
+            page = self.validate_and_fix_html(self.clean_html(app.html.strip()))
+            css = app.css if app.css.strip() else PREVIEW_BASE_CSS
+            return GeneratedApp(html=page, css=css, js=app.js).document()
+        except Exception as e:
+            print(f"Error formatting generated app: {e}")
+            return app.document()
+
     def encode_html_entities(self, html_code):
         """Encode HTML entities to prevent code from being displayed as text"""
         try:
@@ -1067,25 +1202,30 @@ class EditorView(tk.Frame):
             print(f"Error validating HTML: {e}")
             return html_code
 
-    def create_simple_html_preview(self, html_code):
+    def create_simple_html_preview(self, html_code, app=None):
         """Create a simplified HTML preview that tkhtmlview can handle better"""
         try:
-            # Extract the body content
-            import re
-            
-            # Find body content
-            body_match = re.search(r'<body[^>]*>(.*?)</body>', html_code, re.DOTALL | re.IGNORECASE)
-            if body_match:
-                body_content = body_match.group(1)
+            if app is not None and app.html:
+                # Generated parts are already separate; no need to search the document
+                body_content = app.body_html()
+                css_content = app.css
             else:
-                # If no body tag, use the entire content
-                body_content = html_code
-            
-            # Extract CSS
-            style_match = re.search(r'<style[^>]*>(.*?)</style>', html_code, re.DOTALL | re.IGNORECASE)
-            css_content = ""
-            if style_match:
-                css_content = style_match.group(1)
+                # Extract the body content
+                import re
+
+                # Find body content
+                body_match = re.search(r'<body[^>]*>(.*?)</body>', html_code, re.DOTALL | re.IGNORECASE)
+                if body_match:
+                    body_content = body_match.group(1)
+                else:
+                    # If no body tag, use the entire content
+                    body_content = html_code
+
+                # Extract CSS
+                style_match = re.search(r'<style[^>]*>(.*?)</style>', html_code, re.DOTALL | re.IGNORECASE)
+                css_content = ""
+                if style_match:
+                    css_content = style_match.group(1)
             
             # Create a simplified HTML structure
             simple_html = f"""
@@ -1153,7 +1293,7 @@ class EditorView(tk.Frame):
             # Add some basic styling to ensure proper rendering if no styles exist
             if '<style>' not in html_code:
                 # Insert basic CSS for better rendering
-                style_insert = '<style>\nbody { margin: 0; padding: 20px; font-family: Arial, sans-serif; }\n</style>'
+                style_insert = f'<style>\n{PREVIEW_BASE_CSS}\n</style>'
                 html_code = html_code.replace('</head>', f'{style_insert}\n</head>')
                 print("Added basic CSS styling")
             
@@ -1332,7 +1472,7 @@ class EditorView(tk.Frame):
             current_code = self.get_code()
             if current_code:
                 # Format the HTML for browser
-                formatted_html = self.format_html_for_preview(current_code)
+                formatted_html = self.format_html_for_preview(current_code, self.get_app())
                 
                 # Open in browser
                 temp_file = open_html_in_browser(formatted_html, "Karbon Preview")
@@ -1353,7 +1493,7 @@ class EditorView(tk.Frame):
             current_code = self.get_code()
             if current_code:
                 # Format the HTML for browser
-                formatted_html = self.format_html_for_preview(current_code)
+                formatted_html = self.format_html_for_preview(current_code, self.get_app())
                 
                 # Open in browser
                 temp_file = open_html_in_browser(formatted_html, "Karbon Preview")
@@ -0,0 +1,104 @@
+import re
+import tkinter as tk
+
+from ui_items.editor_view import open_html_in_browser
+
+
+class GalleryView(tk.Toplevel):
+    """Side-by-side comparison of n generated variants; cards fill in as each variant finishes"""
+
+    COLUMNS = 2
+
+    def __init__(self, master, prompt, count, on_select, on_close=None):
+        super().__init__(master)
+        self.prompt = prompt
+        self.on_select = on_select
+        self.on_close = on_close
+        self.cards = []
+        self.title("Compare Variants")
+        self.geometry("900x600")
+        self.configure(bg='#0d1117')
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        tk.Label(
+            self,
+            text=f"🧪 {count} variants for: {prompt[:80]}",
+            font=("Segoe UI", 14, "bold"),
+            bg='#0d1117',
+            fg='#f0f6fc',
+            anchor='w'
+        ).pack(fill="x", padx=20, pady=(15, 10))
+
+        grid = tk.Frame(self, bg='#0d1117')
+        grid.pack(fill="both", expand=True, padx=15, pady=(0, 15))
+        for column in range(self.COLUMNS):
+            grid.columnconfigure(column, weight=1, uniform="variant")
+        for index in range(count):
+            grid.rowconfigure(index // self.COLUMNS, weight=1)
+            self.cards.append(self.create_card(grid, index))
+
+    def create_card(self, parent, index):
+        card = tk.Frame(parent, bg='#161b22', relief='solid', bd=1)
+        card.grid(row=index // self.COLUMNS, column=index % self.COLUMNS, sticky="nsew", padx=5, pady=5)
+        tk.Label(
+            card,
+            text=f"Variant {index + 1}",
+            font=("Segoe UI", 12, "bold"),
+            bg='#21262d',
+            fg='#f0f6fc',
+            anchor='w',
+            padx=12,
+            pady=6
+        ).pack(fill="x")
+        status = tk.Label(card, text="⏳ Generating...", font=("Segoe UI", 10), bg='#161b22', fg='#8b949e',
+                          anchor='w', padx=12)
+        status.pack(fill="x", pady=(6, 0))
+        summary = tk.Label(card, text="", font=("Segoe UI", 10), bg='#161b22', fg='#c9d1d9', anchor='nw',
+                           justify='left', wraplength=380, padx=12)
+        summary.pack(fill="both", expand=True, pady=6)
+        buttons = tk.Frame(card, bg='#161b22')
+        buttons.pack(fill="x", padx=12, pady=(0, 10))
+        preview_btn = tk.Button(buttons, text="🌐 Preview", font=("Segoe UI", 10), bg='#21262d', fg='#f0f6fc',
+                                relief='flat', bd=0, padx=12, pady=4, cursor='hand2', state='disabled')
+        preview_btn.pack(side="left")
+        use_btn = tk.Button(buttons, text="✅ Use this", font=("Segoe UI", 10, "bold"), bg='#238636', fg='white',
+                            relief='flat', bd=0, padx=12, pady=4, cursor='hand2', state='disabled')
+        use_btn.pack(side="right")
+        return {"status": status, "summary": summary, "preview": preview_btn, "use": use_btn}
+
+    def set_variant(self, index, result):
+        """Fill in one card; result is a GenerationResult from core.async_engine"""
+        if not self.winfo_exists() or index >= len(self.cards):
+            return
+        card = self.cards[index]
+        if not result.ok:
+            card["status"].configure(text=f"❌ {result.error or result.status}", fg='#f85149')
+            return
+        card["status"].configure(
+            text=f"✅ {result.provider} · temperature {result.temperature} · {result.elapsed:.1f}s",
+            fg='#3fb950'
+        )
+        card["summary"].configure(text=self.describe(result.code))
+        card["preview"].configure(state='normal', command=lambda: open_html_in_browser(result.code, "Variant"))
+        refined = result.app.refined_prompt if result.app is not None else None
+        card["use"].configure(state='normal', command=lambda: self.select(result.code, refined))
+
+    @staticmethod
+    def describe(code):
+        """Title and visible text of a variant, for a quick comparison without opening it"""
+        title = re.search(r"<title>(.*?)</title>", code, re.DOTALL | re.IGNORECASE)
+        body = re.search(r"<body[^>]*>(.*?)</body>", code, re.DOTALL | re.IGNORECASE)
+        text = re.sub(r"<script.*?</script>|<style.*?</style>", " ", body.group(1) if body else code, flags=re.DOTALL)
+        text = re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", text)).strip()
+        heading = title.group(1).strip() if title else "Untitled"
+        return f"{heading}\n\n{text[:240]}{'…' if len(text) > 240 else ''}\n\n{len(code):,} characters"
+
+    def select(self, code, refined_prompt=None):
+        self.on_close = None
+        self.destroy()
+        self.on_select(refined_prompt or self.prompt, code)
+
+    def close(self):
+        if self.on_close:
+            self.on_close()
+        self.destroy()
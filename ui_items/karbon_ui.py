@@ -11,9 +11,18 @@ from ui_items.editor_view import EditorView, open_html_in_browser
 from ui_items.token_manager_view import TokenManagerView
 from contributors_page import ContributorsPage
 
-from core.ai_engine import ai_status, generate_code_from_prompt
+from core.ai_engine import (
+    get_ai_status, generate_code_from_prompt, response_cache, configure_enhancement, configure_hedging, status_bus
+)
+from core.log_setup import configure_logging
+from core.metrics import metrics
+from core.status_bus import CHUNK_RECEIVED, DONE, TkStatusDrain
+from core.providers import configure_providers, prewarm_providers
+from core.resilience import configure_resilience
+from core.usage import ledger as usage_ledger
 from exporters.exporter import export_code, export_to_github
 from exporters.repo_pusher import push_to_github
+from user_manager import USERS_DIR
 
 EXAMPLES = {
     "Login Page": "Create a login page using HTML and Tailwind CSS",
@@ -27,10 +36,12 @@ EXAMPLES = {
 class KarbonUI:
     def __init__(self, root, user=None):
         self.root = root
-        self.user = user
+        self.set_user(user)
         self.setup_window()
         self.setup_styles()
         self.code = ""
+        # GeneratedApp behind self.code while it is unedited; lets preview and export skip re-parsing the document
+        self.current_app = None
         self.api_key = None
         self.model_source = None
         self.history = []  # To store prompt-output history
@@ -49,14 +60,16 @@ class KarbonUI:
             on_generate=self.handle_prompt_generated,
             get_api_key_callback=self.get_api_key,
             get_model_source_callback=self.get_model_source,
-            examples_data=EXAMPLES
+            examples_data=EXAMPLES,
+            on_partial=self.handle_partial_code
         )
         self.editor_view = EditorView(
             self.paned_window,
             get_code_callback=self.get_code,
             set_code_callback=self.set_code,
             get_api_key_callback=self.get_api_key,
-            get_model_source_callback=self.get_model_source
+            get_model_source_callback=self.get_model_source,
+            get_app_callback=self.get_current_app
         )
 
         self.paned_window.add(self.prompt_view)
@@ -110,7 +123,15 @@ class KarbonUI:
 
         self.animate_title()
         self.update_ai_status_indicator()
+        self.status_drain = TkStatusDrain(self.root, status_bus, self.handle_ai_event)
         self.apply_user_appearance()
+
+    def set_user(self, user):
+        """Attribute token usage to user and export their metrics next to their history and preferences"""
+        self.user = user
+        usage_ledger.set_user(user)
+        if user:
+            metrics.configure(export_dir=os.path.join(USERS_DIR, user, "metrics"))
     def show_history_panel(self):
         if not self.history:
             messagebox.showinfo("History", "No history available.")
@@ -298,14 +319,33 @@ class KarbonUI:
         self.progress_label = tk.Label(self.status_frame, textvariable=self.progress_var, font=("Segoe UI", 9),
                                        bg='#161b22', fg='#58a6ff')
         self.progress_label.pack(side="right", padx=20, pady=5)
+        self.latency_label = tk.Label(self.status_frame, text="", font=("Segoe UI", 9), bg='#161b22', fg='#6e7681')
+        self.latency_label.pack(side="right", padx=(0, 10), pady=5)
 
-    def update_ai_status_indicator(self):
-        state = ai_status.get("state", "unknown")
+    def update_ai_status_indicator(self, state=None):
+        state = state or get_ai_status()["state"]
         color_map = {"online": "#3fb950", "offline": "#f85149", "connecting": "#58a6ff", "error": '#d29922',
-                     "unknown": "#6e7681"}
+                     "generating": "#58a6ff", "unknown": "#6e7681"}
         color = color_map.get(state, "#6e7681")
         self.ai_status_label.config(text=f"AI: {state.capitalize()}", fg=color)
-        self.root.after(2000, self.update_ai_status_indicator)
+
+    def handle_ai_event(self, event):
+        # Runs on the Tk thread via TkStatusDrain
+        self.update_ai_status_indicator(event.state)
+        if event.kind == CHUNK_RECEIVED:
+            self.update_status(event.message, "⚡")
+        elif event.state == "generating":
+            self.update_status(event.message, "🔄")
+        elif event.kind == DONE:
+            self.update_latency_label()
+
+    def update_latency_label(self):
+        latency = metrics.percentiles("total")
+        if not latency["count"]:
+            return
+        self.latency_label.configure(
+            text=f"Generation p50 {latency['p50']:.1f}s · p95 {latency['p95']:.1f}s · p99 {latency['p99']:.1f}s"
+        )
 
     def animate_title(self):
         colors = ['#58a6ff', '#79c0ff', '#a5d6ff', '#79c0ff', '#58a6ff']
@@ -326,15 +366,22 @@ class KarbonUI:
     def get_code(self):
         return self.code
 
+    def get_current_app(self):
+        """Structured result for the current code, or None once the code has been edited"""
+        if self.current_app is not None and self.current_app.document() != self.code:
+            self.current_app = None
+        return self.current_app
+
     def set_code(self, new_code):
         self.code = new_code
+        app = self.get_current_app()
         self.update_status(f"Code updated - {len(new_code)} characters", "📝")
         
         # Update embedded preview if available
         try:
             if hasattr(self.editor_view, 'embedded_browser'):
                 # Use simple embedded preview that opens in browser
-                formatted_html = self.editor_view.format_html_for_preview(new_code)
+                formatted_html = self.editor_view.format_html_for_preview(new_code, app)
                 if self.editor_view.embedded_browser.update_content(formatted_html):
                     self.editor_view.preview_status.configure(text="● Updated", fg='#3fb950')
                     print("Preview opened in browser with full CSS support")
@@ -343,20 +390,21 @@ class KarbonUI:
                         
             elif hasattr(self.editor_view, 'html_preview') and hasattr(self.editor_view.html_preview, 'set_html'):
                 # Use tkhtmlview fallback
-                simple_html = self.editor_view.create_simple_html_preview(new_code)
+                simple_html = self.editor_view.create_simple_html_preview(new_code, app)
                 self.editor_view.html_preview.set_html(simple_html)
                 self.editor_view.preview_status.configure(text="● Updated", fg='#3fb950')
                 
                 # Also open in browser for guaranteed rendering
-                formatted_html = self.editor_view.format_html_for_preview(new_code)
+                formatted_html = self.editor_view.format_html_for_preview(new_code, app)
                 temp_file = open_html_in_browser(formatted_html, "Karbon Preview")
                 if temp_file:
                     print("Preview opened in browser for full rendering")
         except Exception as e:
             print(f"Error updating embedded preview: {e}")
 
-    def handle_prompt_generated(self, prompt_text, code):
+    def handle_prompt_generated(self, prompt_text, code, app=None):
         self.code = code
+        self.current_app = app
         self.history.append((prompt_text, code))  # ✅ Save to history
 
         self.update_status("Code generated successfully!", "🎉")
@@ -365,7 +413,7 @@ class KarbonUI:
     # Update embedded preview if available
         try:
             if hasattr(self.editor_view, 'embedded_browser'):
-                formatted_html = self.editor_view.format_html_for_preview(code)
+                formatted_html = self.editor_view.format_html_for_preview(code, app)
                 if self.editor_view.embedded_browser.update_content(formatted_html):
                     self.editor_view.preview_status.configure(text="● Updated", fg='#3fb950')
                     print("Preview opened in browser with full CSS support")
@@ -373,17 +421,21 @@ class KarbonUI:
                     print("Failed to open preview in browser")
 
             elif hasattr(self.editor_view, 'html_preview') and hasattr(self.editor_view.html_preview, 'set_html'):
-                simple_html = self.editor_view.create_simple_html_preview(code)
+                simple_html = self.editor_view.create_simple_html_preview(code, app)
                 self.editor_view.html_preview.set_html(simple_html)
                 self.editor_view.preview_status.configure(text="● Updated", fg='#3fb950')
 
-                formatted_html = self.editor_view.format_html_for_preview(code)
+                formatted_html = self.editor_view.format_html_for_preview(code, app)
                 temp_file = open_html_in_browser(formatted_html, "Karbon Preview")
                 if temp_file:
                     print("Preview opened in browser for full rendering")
         except Exception as e:
             print(f"Error updating embedded preview: {e}")
 
+    def handle_partial_code(self, partial_code):
+        # Progress text comes from CHUNK_RECEIVED events in handle_ai_event
+        self.editor_view.show_partial_code(partial_code)
+
     def get_api_key(self):
         return self.api_key
 
@@ -471,6 +523,14 @@ class KarbonUI:
         self.editor_view_visible.set(True)
         self.root.after(100, lambda: self.paned_window.sashpos(0, self.root.winfo_width() // 2))
 
+    def close(self):
+        """Save settings, cache access times and the latest metrics, then close the window"""
+        self.save_settings()
+        response_cache.flush()
+        # Metrics are otherwise only exported every few seconds while requests run
+        metrics.export()
+        self.root.destroy()
+
     def save_settings(self):
         sash_position = None
         if len(self.paned_window.panes()) > 1:
@@ -484,14 +544,23 @@ class KarbonUI:
             "editor_view_visible": self.editor_view_visible.get(),
             "sash_position": sash_position
         }
-        settings = {
+        settings = {}
+        if os.path.exists("settings.json"):
+            # Keep sections this window does not edit (e.g. response_cache)
+            try:
+                with open("settings.json", "r") as f:
+                    settings = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                settings = {}
+        settings.update({
             "api_key": self.api_key,
             "model_source": self.model_source,
             "layout": layout_settings,
             "font_family": getattr(self, 'font_family', 'Segoe UI'),
             "font_size": int(getattr(self, 'font_size', 12)),
-            "theme": getattr(self, 'theme', 'Dark')
-        }
+            "theme": getattr(self, 'theme', 'Dark'),
+            "split_export": getattr(self, 'split_export', False)
+        })
         try:
             with open("settings.json", "w") as f:
                 json.dump(settings, f, indent=4)
@@ -503,6 +572,9 @@ class KarbonUI:
         self.font_family = 'Segoe UI'
         self.font_size = 12
         self.theme = 'Dark'
+        self.split_export = False
+        logging_settings = None
+        prewarm = False
 
         if os.path.exists("settings.json"):
             try:
@@ -533,9 +605,22 @@ class KarbonUI:
                     self.font_family = settings.get("font_family", self.font_family)
                     self.font_size = int(settings.get("font_size", self.font_size))
                     self.theme = settings.get("theme", self.theme)
+                    self.split_export = bool(settings.get("split_export", self.split_export))
+                    response_cache.configure(settings.get("response_cache", {}))
+                    configure_providers(settings.get("providers"))
+                    configure_hedging(settings.get("hedging", {}))
+                    configure_enhancement(settings.get("prompt_enhancement", {}))
+                    configure_resilience(settings.get("resilience"))
+                    usage_ledger.configure(settings.get("usage", {}))
+                    prewarm = bool(settings.get("prewarm_providers", False))
+                    logging_settings = settings.get("logging")
 
             except (json.JSONDecodeError, KeyError, IOError) as e:
                 print(f"Error reading settings.json ({e}), using default settings.")
+        configure_logging(logging_settings)
+        if prewarm:
+            # Load provider SDKs in the background once the window is up, before the first Generate
+            self.root.after(500, prewarm_providers)
 
         if not self.prompt_view_visible.get() and not self.editor_view_visible.get():
             self.layout_default()
@@ -543,7 +628,7 @@ class KarbonUI:
     def open_settings(self):
         settings_window = tk.Toplevel(self.root)
         settings_window.title("Settings")
-        settings_window.geometry("400x450")
+        settings_window.geometry("400x520")
         settings_window.configure(bg='#161b22')
         settings_window.transient(self.root)
         settings_window.grab_set()
@@ -587,6 +672,14 @@ class KarbonUI:
         theme_menu = ttk.Combobox(settings_window, textvariable=self.theme_var, values=themes, state="readonly")
         theme_menu.pack(pady=5, padx=20)
 
+        # Export writes a single self-contained index.html unless this is ticked
+        self.split_export_var = tk.BooleanVar(value=getattr(self, 'split_export', False))
+        tk.Checkbutton(settings_window, text="Export HTML, CSS and JS as separate files\n"
+                                             "(index.html, style.css, script.js)",
+                       variable=self.split_export_var, bg='#161b22', fg='white', selectcolor='#21262d',
+                       activebackground='#161b22', activeforeground='white', justify='left',
+                       font=("Segoe UI", 10)).pack(pady=(15, 0))
+
         warning_label = tk.Label(settings_window, text="", bg='#161b22', fg='#f85149', font=("Segoe UI", 9),
                                  wraplength=350)
         warning_label.pack(pady=(5, 0))
@@ -610,6 +703,7 @@ class KarbonUI:
                 warning_label.config(text="")
 
             self.theme = new_theme
+            self.split_export = self.split_export_var.get()
             self.save_settings()
             self.apply_user_appearance()
             settings_window.destroy()
@@ -623,8 +717,13 @@ class KarbonUI:
             if not self.code:
                 self.show_notification("There is no code to export.", "warning")
                 return
-            export_code(self.code)
-            self.show_notification("Code exported successfully!", "success")
+            split = getattr(self, 'split_export', False)
+            if export_code(self.code, app=self.get_current_app(), split=split) is None:
+                return
+            if split and self.get_current_app() is not None:
+                self.show_notification("Exported index.html, style.css and script.js.", "success")
+            else:
+                self.show_notification("Code exported successfully!", "success")
         except ImportError:
             self.show_notification("Export functionality not available. 'exporter.py' module not found.", "error")
         except Exception as e:
@@ -1,23 +1,34 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import threading
-from core.ai_engine import generate_code_from_prompt
+from core.async_engine import (
+    CANCELLED, OK, GenerationResult, TkAsyncBridge, generate_code_async, generate_variants_async
+)
 import core.prompt_history as prompt_history
-from core.ai_engine import ai_status
-from core.ai_engine import optimize_prompt
+from core.ai_engine import (
+    find_similar_generation, generation_cache_key, get_ai_status, plan_enhancement, remember_prompt_alias,
+    response_cache, set_ai_status
+)
+from ui_items.gallery_view import GalleryView
 
 MAX_PROMPT_LENGTH = 256
+MAX_VARIANTS = 4
 
 
 class PromptView(tk.Frame):
-    def __init__(self, master, on_generate, get_api_key_callback, get_model_source_callback, examples_data):
+    def __init__(self, master, on_generate, get_api_key_callback, get_model_source_callback, examples_data,
+                 on_partial=None):
         super().__init__(master, bg='#0d1117')
         self.on_generate = on_generate
+        self.on_partial = on_partial
         self.get_api_key_callback = get_api_key_callback
         self.get_model_source_callback = get_model_source_callback
         self.examples_data = examples_data
         self.is_generating = False
+        self.generation_task = None
+        self.async_bridge = TkAsyncBridge(self)
         self.enhance_ui_var = tk.BooleanVar(value=True)
+        self.variants_var = tk.IntVar(value=1)
+        self.gallery = None
         self.setup_ui()
         self.bind_all("<Control-g>", lambda event: self.handle_generate())
         self.bind_all("<Control-e>", lambda event: self.export_project())
@@ -97,6 +108,27 @@ class PromptView(tk.Frame):
             activeforeground="#00ffcc"
         )
         self.enhance_checkbox.pack(anchor="w", pady=(5, 0))
+        variants_frame = tk.Frame(input_frame, bg='#161b22')
+        variants_frame.pack(anchor="w", pady=(5, 0))
+        tk.Label(
+            variants_frame,
+            text="Variants to compare:",
+            font=("Segoe UI", 9),
+            bg='#161b22',
+            fg='#8b949e'
+        ).pack(side="left")
+        tk.Spinbox(
+            variants_frame,
+            from_=1,
+            to=MAX_VARIANTS,
+            width=3,
+            textvariable=self.variants_var,
+            state='readonly',
+            bg='#0d1117',
+            fg='#f0f6fc',
+            readonlybackground='#0d1117',
+            buttonbackground='#21262d'
+        ).pack(side="left", padx=(6, 0))
         self.char_count_label = tk.Label(
             input_frame,
             text="256 characters left",
@@ -129,6 +161,21 @@ class PromptView(tk.Frame):
             command=self.handle_generate
         )
         self.generate_btn.pack(side="right")
+        self.stop_btn = tk.Button(
+            button_frame,
+            text="⏹ Stop",
+            font=("Segoe UI", 12, "bold"),
+            bg='#da3633',
+            fg='white',
+            activebackground='#f85149',
+            activeforeground='white',
+            relief='flat',
+            bd=0,
+            padx=20,
+            pady=15,
+            cursor='hand2',
+            command=self.stop_generation
+        )
         self.create_secondary_buttons(button_frame)
 
     def create_secondary_buttons(self, parent):
@@ -358,32 +405,145 @@ class PromptView(tk.Frame):
             font=("Segoe UI", 12, "bold")
         )
         self.show_progress()
-        def generate_in_background():
-            try:
-                # Get value from UI BEFORE entering thread
-                api_key = self.get_api_key_callback()
-                model_source = self.get_model_source_callback()
-                final_prompt = prompt
-                if self.enhance_ui_var:
-                    final_prompt = optimize_prompt(prompt, api_key)
-                code = generate_code_from_prompt(final_prompt, api_key)
-                try:
-                    from ui_items.editor_view import HTML_AVAILABLE
-                    if HTML_AVAILABLE:
-                        pass
-                except ImportError:
-                    pass
-                prompt_history.pop_prompt()
-                prompt_history.push_prompt(final_prompt)
-                prompt_history.push_prompt(
-                    "Describe what you'd like to change...\n\nExample: Make the header purple, add a contact form or change the font to something more modern")
-                prompt_history.push_code(code)
-                prompt_history.push_code(code)
-                self.after(0, lambda: self.generation_complete(code))
-            except Exception as e:
-                self.after(0, lambda exc=e: self.generation_error(str(exc)))
-        threading.Thread(target=generate_in_background, daemon=True).start()
-        
+        self.stop_btn.pack(side="right", padx=(0, 10))
+        # Read Tk state here on the main thread; the request itself runs on the shared AI event loop
+        api_key = self.get_api_key_callback()
+        enhance = self.enhance_ui_var.get()
+
+        variants = self.variants_var.get()
+        if variants > 1:
+            self.start_variant_generation(prompt, api_key, enhance, variants)
+            return
+        # Local templates expand the prompt instantly; AI enhancement, when enabled, rides along with the
+        # generation request so it costs no extra round trip
+        final_prompt, ai_enhance = plan_enhancement(prompt) if enhance else (prompt, False)
+        reused = self.offer_similar_result(prompt, api_key, ai_enhance,
+                                           generation_cache_key(final_prompt, api_key, ai_enhance))
+        if reused:
+            return
+        # Declining a suggestion asks for a fresh result, so the cache must not answer either
+        use_cache = reused is None
+
+        async def generate():
+            result = await generate_code_async(final_prompt, api_key, on_partial=self.push_partial,
+                                               use_cache=use_cache, enhance=ai_enhance)
+            refined = result.app.refined_prompt if result.app is not None else None
+            return refined or final_prompt, result
+
+        def generated(outcome):
+            if outcome[1].ok and not ai_enhance:
+                remember_prompt_alias(prompt, final_prompt, api_key)
+            self.finish_generation(outcome)
+
+        self.generation_task = self.async_bridge.submit(
+            generate(),
+            on_done=generated,
+            on_error=lambda exc: self.generation_error(str(exc))
+        )
+
+    def offer_similar_result(self, prompt, api_key, enhance=False, exclude_key=None):
+        """Ask to reuse the result of a near-identical earlier prompt.
+        True if the user accepted it, False if they declined, None if there was nothing to offer"""
+        if response_cache.similar.auto_serve:
+            return None  # the engine serves it without asking
+        similar = find_similar_generation(prompt, api_key, enhance, exclude_key)
+        if similar is None:
+            return None
+        match, code = similar
+        reuse = messagebox.askyesno(
+            "Similar prompt found",
+            f"This looks {match.score:.0%} similar to an earlier prompt:\n\n\"{match.prompt[:200]}\"\n\n"
+            f"Reuse that website instead of generating a new one?\n(found in {match.latency_ms:.1f} ms)",
+            parent=self
+        )
+        if not reuse:
+            return False
+        set_ai_status("online", f"AI service is online (reused a {match.score:.0%} similar result).")
+        self.finish_generation((prompt, GenerationResult(OK, code, provider="cache")))
+        return True
+
+    def start_variant_generation(self, prompt, api_key, enhance, count):
+        # Every variant streams into its own gallery card as soon as it is ready
+        self.gallery = GalleryView(self, prompt, count, on_select=self.select_variant, on_close=self.stop_generation)
+
+        def show_variant(index, result):
+            gallery = self.gallery
+            if gallery is not None:
+                self.async_bridge.call_soon(gallery.set_variant, index, result)
+
+        # Enhanced as for a single generation: templates expand the prompt here, AI enhancement rides along
+        # with each variant's request
+        final_prompt, ai_enhance = plan_enhancement(prompt) if enhance else (prompt, False)
+        self.gallery.prompt = final_prompt
+
+        async def generate():
+            return await generate_variants_async(final_prompt, count, api_key, on_variant=show_variant,
+                                                 enhance=ai_enhance)
+
+        self.generation_task = self.async_bridge.submit(
+            generate(),
+            on_done=lambda results: self.finish_variants(),
+            on_error=lambda exc: self.generation_error(str(exc))
+        )
+
+    def finish_variants(self):
+        self.generation_task = None
+        self.reset_generate_button()
+        if get_ai_status()["state"] != "online":
+            self.show_error("None of the variants could be generated. Please try again later.")
+
+    def select_variant(self, final_prompt, code):
+        self.gallery = None
+        self.stop_generation()
+        prompt_history.pop_prompt()
+        prompt_history.push_prompt(final_prompt)
+        prompt_history.push_prompt(
+            "Describe what you'd like to change...\n\nExample: Make the header purple, add a contact form or change the font to something more modern")
+        prompt_history.push_code(code)
+        prompt_history.push_code(code)
+        self.show_success("Variant selected! 🎉")
+        self.on_generate(final_prompt, code)
+
+    def finish_generation(self, outcome):
+        final_prompt, result = outcome
+        self.generation_task = None
+        if result.status == CANCELLED:
+            self.reset_generate_button()
+            return
+        code = result.code
+        prompt_history.pop_prompt()
+        prompt_history.push_prompt(final_prompt)
+        prompt_history.push_prompt(
+            "Describe what you'd like to change...\n\nExample: Make the header purple, add a contact form or change the font to something more modern")
+        prompt_history.push_code(code)
+        prompt_history.push_code(code)
+        self.generation_complete(code, app=result.app)
+
+    def stop_generation(self):
+        # Cancels the in-flight provider request too, not just the UI wait
+        if self.generation_task is not None:
+            self.generation_task.cancel()
+            self.generation_task = None
+        if self.gallery is not None and self.gallery.winfo_exists():
+            self.gallery.on_close = None
+            self.gallery.destroy()
+        self.gallery = None
+        self.reset_generate_button()
+
+    def reset_generate_button(self):
+        self.is_generating = False
+        self.stop_btn.pack_forget()
+        self.generate_btn.configure(
+            text="🚀 Generate My Website",
+            state='normal',
+            bg='#238636'
+        )
+
+    def push_partial(self, partial_code):
+        # Called from the AI event loop thread; hand the partial document to Tk
+        if self.on_partial and self.is_generating:
+            self.async_bridge.call_soon(self.on_partial, partial_code)
+
     def show_progress(self):
         progress_texts = [
             "🔄 Analyzing your idea...",
@@ -400,15 +560,11 @@ class PromptView(tk.Frame):
                 self.after(1500, update_progress)
         update_progress()
 
-    def generation_complete(self, code, prompt_text=None):
-        self.is_generating = False
-        self.generate_btn.configure(
-            text="🚀 Generate My Website",
-            state='normal',
-            bg='#238636'
-        )
-        status = ai_status.get("state", "unknown")
-        message = ai_status.get("message", "")
+    def generation_complete(self, code, prompt_text=None, app=None):
+        self.reset_generate_button()
+        current = get_ai_status()
+        status = current["state"]
+        message = current["message"]
         if status != "online":
             if status == "offline":
                 self.show_error(
@@ -419,17 +575,13 @@ class PromptView(tk.Frame):
                 self.show_error(f"Website could not be generated due to an AI service issue")
             return
         self.show_success("Website generated successfully! 🎉")
-        self.on_generate(prompt_text,code)
+        self.on_generate(prompt_text, code, app)
 
     def generation_error(self, error_msg):
-        self.is_generating = False
-        self.generate_btn.configure(
-            text="🚀 Generate My Website",
-            state='normal',
-            bg='#238636'
-        )
-        status = ai_status.get("state", "unknown")
-        message = ai_status.get("message", "")
+        self.reset_generate_button()
+        current = get_ai_status()
+        status = current["state"]
+        message = current["message"]
         if status == "offline":
             self.show_error(
                 "AI service is currently unavailable. Please check you internet connection or try again later.")